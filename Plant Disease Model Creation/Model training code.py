@@ -15,11 +15,14 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 import json
+import hashlib
 import shutil
 from PIL import Image
 import zipfile
+import fcntl
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from sklearn.model_selection import train_test_split
 import yaml
 import gdown
 
@@ -96,7 +99,6 @@ except Exception as e:
     print("   3. Try using a different sharing link format")
     print("   4. Or manually upload the file to Lightning Studio\n")
 
-    import time
     print("⏳ Waiting for manual upload...")
     max_wait = 300
     elapsed = 0
@@ -114,134 +116,205 @@ except Exception as e:
     print(f"  File size: {file_size:.2f} MB\n")
 
 # ============================================================================
-# STEP 3: EXTRACT DATASET
+# STEP 3: READ DATASET ARCHIVE
 # ============================================================================
 
+# INGEST_MODE:
+#   'stream'  -> stream every image that needs (re)writing straight from the ZIP into
+#                its final split folder: one write, peak disk use near one copy
+#   'extract' -> extract those images under LOCAL_DATASET_PATH first, then hardlink /
+#                reflink / copy them into the splits
+# Either way classes come from the member paths (Plant/Disease/img.jpg -> Plant_Disease).
+INGEST_MODE = 'stream'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+def zip_image_members(zip_path):
+    """(member name, class name, content hash) for every image, from the central directory alone.
+
+    The content hash is the CRC-32 and size the ZIP already records per member,
+    so change detection never reads image data.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        infos = [info for info in zip_ref.infolist()
+                 if not info.is_dir()
+                 and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+                 and not info.filename.startswith('__MACOSX/')]
+
+    folders = [info.filename.split('/')[:-1] for info in infos]
+    # A single folder wrapping everything is the archive's name, not a class
+    while folders and all(len(f) > 1 for f in folders) and len({f[0] for f in folders}) == 1:
+        folders = [f[1:] for f in folders]
+    # Images at the archive root have no class folder
+    return [(info.filename, '_'.join(f), f"crc32:{info.CRC:08x}:{info.file_size}")
+            for info, f in zip(infos, folders) if f]
+
 print("="*70)
-print("📦 EXTRACTING DATASET")
+print("📦 READING ZIP CENTRAL DIRECTORY")
 print("="*70 + "\n")
 
-print(f"Extracting from: {LOCAL_DATASET_ZIP}")
-print(f"Extracting to: {LOCAL_DATASET_PATH}\n")
-
 try:
-    with zipfile.ZipFile(LOCAL_DATASET_ZIP, 'r') as zip_ref:
-        total_files = len(zip_ref.namelist())
-        print(f"Found {total_files} files in ZIP archive")
-
-        if total_files == 0:
-            raise ValueError("ZIP file is empty!")
-
-        print("Extracting files...\n")
-
-        extracted_count = 0
-        for file in zip_ref.namelist():
-            zip_ref.extract(file, LOCAL_DATASET_PATH)
-            extracted_count += 1
-
-            if extracted_count % 500 == 0 or extracted_count == total_files:
-                progress = (extracted_count / total_files) * 100
-                print(f"\rProgress: {extracted_count}/{total_files} files ({progress:.1f}%)", end='')
-
-        print()
-
-    print("✓ Dataset extracted successfully!\n")
-
+    zip_members = zip_image_members(LOCAL_DATASET_ZIP)
 except zipfile.BadZipFile:
     print("ERROR: File is not a valid ZIP file!")
     raise
-except Exception as e:
-    print(f"ERROR during extraction: {e}")
-    raise
+if not zip_members:
+    raise ValueError("ZIP file has no images in class folders!")
+print(f"✓ Found {len(zip_members)} images in {len({c for _, c, _ in zip_members})} class folders\n")
 
 # ============================================================================
-# STEP 4: LOCATE DATASET FOLDER
+# STEP 4: PLAN INCREMENTAL UPDATE FROM THE MANIFEST
 # ============================================================================
 
 print("="*70)
-print("🔍 LOCATING DATASET FOLDER")
+print("🧾 COMPARING WITH DATASET MANIFEST")
 print("="*70 + "\n")
 
-print(f"Searching in: {LOCAL_DATASET_PATH}")
+# Every image is one whole leaf with one label, so this is image classification:
+#   'classify' -> ImageFolder layout {split}/{class}/img.jpg for a YOLOv8-cls model
+#                 (no anchors / NMS at inference, always returns a class)
+#   'detect'   -> the original layout with a full-image box label per image
+TASK = 'classify'
 
-all_items = os.listdir(LOCAL_DATASET_PATH)
-dataset_folders = [f for f in all_items if os.path.isdir(os.path.join(LOCAL_DATASET_PATH, f))]
+yolo_dataset_path = '/teamspace/studios/this_studio/yolo_dataset'
+os.makedirs(yolo_dataset_path, exist_ok=True)
 
-print(f"Found {len(all_items)} items in dataset directory")
-print(f"Found {len(dataset_folders)} folders\n")
+# Records every image's content hash, class, split and output path, so re-runs
+# only touch added, changed or removed images
+MANIFEST_PATH = f'{yolo_dataset_path}/manifest.json'
+
+# OPTIMIZED SPLIT: 85% train, 10% val, 5% test (more training data).
+# Assigned per image from a hash of its name, so existing images never move
+# between splits when new photos are added.
+SPLIT_FRACTIONS = (('train', 0.85), ('val', 0.10), ('test', 0.05))
+
+def name_hash(member):
+    return hashlib.sha1(member.encode('utf-8')).hexdigest()
+
+def assign_split(member):
+    position = int(name_hash(member)[:8], 16) / 16**8
+    cumulative = 0.0
+    for split, fraction in SPLIT_FRACTIONS:
+        cumulative += fraction
+        if position < cumulative:
+            return split
+    return SPLIT_FRACTIONS[-1][0]
+
+def split_destination(split, class_name, member):
+    """(image path, label file path or None) of an image's place in the YOLO layout."""
+    stem, ext = os.path.splitext(os.path.basename(member))
+    # The name hash keeps same-named files from different folders apart
+    img_stem = f"{stem}_{name_hash(member)[:8]}"
+    if TASK == 'classify':
+        return f'{yolo_dataset_path}/{split}/{class_name}/{img_stem}{ext}', None
+    return (f'{yolo_dataset_path}/{split}/images/{img_stem}{ext}',
+            f'{yolo_dataset_path}/{split}/labels/{img_stem}.txt')
+
+def load_manifest():
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    return {'task': None, 'classes': [], 'images': {}}
+
+def save_manifest(manifest):
+    # Written to a temp file first so an interrupted run never leaves a truncated manifest
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+manifest = load_manifest()
+previous = manifest['images']
+
+classes = sorted({class_name for _, class_name, _ in zip_members})
+num_classes = len(classes)
+class_to_idx = {cls: idx for idx, cls in enumerate(classes)}
+classes_changed = classes != manifest['classes'] or TASK != manifest['task']
 
-print("Directory structure:")
-for item in all_items[:10]:
-    item_path = os.path.join(LOCAL_DATASET_PATH, item)
-    if os.path.isdir(item_path):
-        print(f"  📁 {item}/")
+for split, _ in SPLIT_FRACTIONS:
+    if TASK == 'classify':
+        for class_name in classes:
+            os.makedirs(f'{yolo_dataset_path}/{split}/{class_name}', exist_ok=True)
     else:
-        print(f"  📄 {item}")
-
-if len(all_items) > 10:
-    print(f"  ... and {len(all_items) - 10} more items\n")
+        os.makedirs(f'{yolo_dataset_path}/{split}/images', exist_ok=True)
+        os.makedirs(f'{yolo_dataset_path}/{split}/labels', exist_ok=True)
 
-if len(dataset_folders) == 1:
-    dataset_path = os.path.join(LOCAL_DATASET_PATH, dataset_folders[0])
-    print(f"\n✓ Using nested folder: {dataset_folders[0]}")
-elif len(dataset_folders) > 1:
-    dataset_path = LOCAL_DATASET_PATH
-    print(f"\n✓ Using root folder with {len(dataset_folders)} class folders")
-else:
-    print("\n⚠️  WARNING: No folders found!")
-    dataset_path = LOCAL_DATASET_PATH
+print(f"Found {num_classes} classes{' (changed since last run)' if classes_changed else ''}:")
+for i, cls in enumerate(classes, 1):
+    print(f"  {i}. {cls}")
+print()
 
-print(f"\nFinal dataset location: {dataset_path}\n")
+images = {}
+jobs = {split: [] for split, _ in SPLIT_FRACTIONS}
+stale_paths = []
+added = changed = unchanged = 0
+
+for member, class_name, content_hash in zip_members:
+    old = previous.get(member, {})
+    if old.get('status') == 'corrupt' and old['hash'] == content_hash:
+        # Still the same broken file: don't retry it every run
+        images[member] = old
+        unchanged += 1
+        continue
+
+    split = old.get('split') or assign_split(member)
+    path, label_path = split_destination(split, class_name, member)
+    entry = {
+        'hash': content_hash,
+        'class': class_name,
+        # Detection labels hold the class index, which shifts when classes are added
+        'label': class_to_idx[class_name] if TASK == 'detect' else None,
+        'split': split,
+        'path': path,
+        'label_path': label_path,
+    }
+    images[member] = entry
+
+    if all(old.get(k) == v for k, v in entry.items()) and os.path.exists(path):
+        unchanged += 1
+        continue
+    if old:
+        changed += 1
+        stale_paths += [p for p in (old.get('path'), old.get('label_path')) if p not in (path, label_path)]
+    else:
+        added += 1
+    jobs[split].append((member, path, label_path, entry['label']))
+
+removed = [member for member in previous if member not in images]
+for member in removed:
+    stale_paths += [previous[member].get('path'), previous[member].get('label_path')]
+for stale_path in stale_paths:
+    if stale_path and os.path.exists(stale_path):
+        os.remove(stale_path)
+if classes_changed and TASK == 'classify':
+    # A leftover folder would still be read as a class
+    for split, _ in SPLIT_FRACTIONS:
+        for folder in os.listdir(f'{yolo_dataset_path}/{split}'):
+            if folder not in class_to_idx:
+                shutil.rmtree(f'{yolo_dataset_path}/{split}/{folder}')
+
+print(f"Manifest: {unchanged} unchanged, {added} added, {changed} changed, {len(removed)} removed\n")
+
+split_counts = {split: sum(1 for e in images.values() if e['split'] == split) for split, _ in SPLIT_FRACTIONS}
+print(f"Dataset split (OPTIMIZED):")
+for split, count in split_counts.items():
+    print(f"  {split.capitalize() + ':':<6} {count} images ({count / len(images) * 100:.1f}%)")
+print()
 
 # ============================================================================
-# STEP 5: FLATTEN NESTED STRUCTURE (IF NEEDED)
+# STEP 5: EXTRACT CHANGED IMAGES (INGEST_MODE = 'extract' ONLY)
 # ============================================================================
 
-nested_structure = False
-plant_folders = [f for f in os.listdir(dataset_path)
-                 if os.path.isdir(os.path.join(dataset_path, f))]
-
-if plant_folders:
-    first_plant_path = os.path.join(dataset_path, plant_folders[0])
-    subfolders = [f for f in os.listdir(first_plant_path)
-                  if os.path.isdir(os.path.join(first_plant_path, f))]
-    if subfolders:
-        nested_structure = True
-
-if nested_structure:
-    print("📁 Detected nested folder structure (Plant → Disease)")
-    print("Flattening structure...\n")
-
-    flattened_path = '/teamspace/studios/this_studio/dataset_flattened'
-    if os.path.exists(flattened_path):
-        shutil.rmtree(flattened_path)
-    os.makedirs(flattened_path)
-
-    total_images = 0
-    for plant_folder in plant_folders:
-        plant_path = os.path.join(dataset_path, plant_folder)
-        disease_folders = [f for f in os.listdir(plant_path)
-                          if os.path.isdir(os.path.join(plant_path, f))]
+if INGEST_MODE == 'extract':
+    members_to_extract = [job[0] for split_jobs in jobs.values() for job in split_jobs]
+    print(f"Extracting {len(members_to_extract)} images to: {LOCAL_DATASET_PATH}\n")
 
-        for disease_folder in disease_folders:
-            disease_path = os.path.join(plant_path, disease_folder)
-            new_folder_name = f"{plant_folder}_{disease_folder}"
-            new_folder_path = os.path.join(flattened_path, new_folder_name)
-            os.makedirs(new_folder_path, exist_ok=True)
-
-            image_files = [f for f in os.listdir(disease_path)
-                          if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]
-
-            for img_file in image_files:
-                src = os.path.join(disease_path, img_file)
-                dst = os.path.join(new_folder_path, img_file)
-                shutil.copy2(src, dst)
-                total_images += 1
-
-            print(f"✓ Created class: {new_folder_name} ({len(image_files)} images)")
-
-    dataset_path = flattened_path
-    print(f"\n✓ Flattened {total_images} images\n")
+    with zipfile.ZipFile(LOCAL_DATASET_ZIP, 'r') as zip_ref:
+        for extracted_count, member in enumerate(members_to_extract, 1):
+            zip_ref.extract(member, LOCAL_DATASET_PATH)
+            if extracted_count % 500 == 0 or extracted_count == len(members_to_extract):
+                progress = (extracted_count / len(members_to_extract)) * 100
+                print(f"\rProgress: {extracted_count}/{len(members_to_extract)} files ({progress:.1f}%)", end='')
+    print("\n✓ Extraction complete!\n")
 
 # ============================================================================
 # STEP 6: CONVERT TO YOLO FORMAT (OPTIMIZED - REDUCED VAL/TEST SIZE)
@@ -251,101 +324,291 @@ print("="*70)
 print("🔄 CONVERTING TO YOLO FORMAT (OPTIMIZED)")
 print("="*70 + "\n")
 
-yolo_dataset_path = '/teamspace/studios/this_studio/yolo_dataset'
-os.makedirs(yolo_dataset_path, exist_ok=True)
-
-for split in ['train', 'val', 'test']:
-    os.makedirs(f'{yolo_dataset_path}/{split}/images', exist_ok=True)
-    os.makedirs(f'{yolo_dataset_path}/{split}/labels', exist_ok=True)
-
-classes = sorted([d for d in os.listdir(dataset_path)
-                  if os.path.isdir(os.path.join(dataset_path, d))])
-num_classes = len(classes)
-
-print(f"Found {num_classes} classes:")
-for i, cls in enumerate(classes, 1):
-    print(f"  {i}. {cls}")
-print()
-
-class_to_idx = {cls: idx for idx, cls in enumerate(classes)}
-
-all_image_paths = []
-all_labels = []
-
-for class_name in classes:
-    class_path = os.path.join(dataset_path, class_name)
-    image_files = [f for f in os.listdir(class_path)
-                   if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]
-
-    for img_file in image_files:
-        all_image_paths.append(os.path.join(class_path, img_file))
-        all_labels.append(class_to_idx[class_name])
-
-# OPTIMIZED SPLIT: 85% train, 10% val, 5% test (more training data)
-train_imgs, temp_imgs, train_labels, temp_labels = train_test_split(
-    all_image_paths, all_labels, test_size=0.15, random_state=42, stratify=all_labels
-)
-
-val_imgs, test_imgs, val_labels, test_labels = train_test_split(
-    temp_imgs, temp_labels, test_size=0.33, random_state=42, stratify=temp_labels
-)
-
-print(f"Dataset split (OPTIMIZED):")
-print(f"  Train: {len(train_imgs)} images ({len(train_imgs)/len(all_image_paths)*100:.1f}%)")
-print(f"  Val:   {len(val_imgs)} images ({len(val_imgs)/len(all_image_paths)*100:.1f}%)")
-print(f"  Test:  {len(test_imgs)} images ({len(test_imgs)/len(all_image_paths)*100:.1f}%)\n")
-
-def process_images(image_paths, labels, split):
-    print(f"Processing {split} set...")
-    for idx, (img_path, label) in enumerate(zip(image_paths, labels)):
+# Conversion runs on every core. Images are checked by parsing their headers
+# (no pixel decode). Extracted files are placed with hardlinks / reflinks when
+# the filesystem allows; in stream mode each ZIP member is written exactly once.
+CONVERT_WORKERS = os.cpu_count() or 4
+FICLONE = 0x40049409  # Linux ioctl: copy-on-write clone (btrfs, XFS, overlayfs on those)
+
+def verify_image(path):
+    """Cheap integrity check: parse the header and file structure without decoding pixels."""
+    try:
+        with Image.open(path) as img:
+            fmt = img.format
+            img.verify()
+        if fmt == 'JPEG':
+            # verify() doesn't read JPEG scan data; a truncated download loses its end marker
+            with open(path, 'rb') as f:
+                f.seek(-2, os.SEEK_END)
+                if f.read() != b'\xff\xd9':
+                    return False
+        return True
+    except Exception:
+        return False
+
+def link_or_copy(src, dst):
+    """Place src at dst as a hardlink, else a reflink, else a plain copy; returns the method used."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return 'reflink'
+    except OSError:
+        pass
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+# Stream mode: each pool process opens its own handle on the ZIP
+_zip_ref = None
+
+def open_zip(zip_path):
+    global _zip_ref
+    _zip_ref = zipfile.ZipFile(zip_path, 'r')
+
+def stream_member(member, dst):
+    """Write one ZIP member straight to its final path; its CRC is checked as it streams."""
+    with _zip_ref.open(member) as src, open(dst, 'wb') as f:
+        shutil.copyfileobj(src, f, 1024 * 1024)
+
+def convert_image(job):
+    member, dst_img_path, label_path, label = job
+    if _zip_ref is not None:
         try:
-            img = cv2.imread(img_path)
-            if img is None:
-                continue
-
-            img_name = f"{split}_{idx}_{os.path.basename(img_path)}"
-            dst_img_path = f'{yolo_dataset_path}/{split}/images/{img_name}'
-            shutil.copy(img_path, dst_img_path)
-
-            label_name = os.path.splitext(img_name)[0] + '.txt'
-            label_path = f'{yolo_dataset_path}/{split}/labels/{label_name}'
+            stream_member(member, dst_img_path)
+        except (zipfile.BadZipFile, OSError):
+            valid = False
+        else:
+            valid = verify_image(dst_img_path)
+        if not valid:
+            if os.path.exists(dst_img_path):
+                os.remove(dst_img_path)
+            return member, None, 0
+        method = 'stream'
+        size = os.path.getsize(dst_img_path)
+    else:
+        img_path = os.path.join(LOCAL_DATASET_PATH, member)
+        if not verify_image(img_path):
+            if os.path.exists(dst_img_path):
+                os.remove(dst_img_path)
+            return member, None, 0
+        method = link_or_copy(img_path, dst_img_path)
+        size = os.path.getsize(img_path)
+    if label_path is not None:
+        with open(label_path, 'w') as f:
+            f.write(f"{label} 0.5 0.5 1.0 1.0\n")
+    return member, method, size
+
+def process_images(jobs, split, pool):
+    """Convert one split's (member, image path, label path, label) jobs; returns the corrupt members."""
+    print(f"Processing {split} set...")
+    start = time.time()
+    corrupt, methods, total_bytes = [], {}, 0
+    chunksize = max(1, min(256, len(jobs) // (CONVERT_WORKERS * 4)))
+    for done, (member, method, size) in enumerate(pool.map(convert_image, jobs, chunksize=chunksize), 1):
+        if method is None:
+            corrupt.append(member)
+        else:
+            methods[method] = methods.get(method, 0) + 1
+            total_bytes += size
+        if done % 1000 == 0:
+            print(f"  Processed {done}/{len(jobs)} images")
+
+    elapsed = max(time.time() - start, 1e-6)
+    placed = ", ".join(f"{n} {m}" for m, n in methods.items()) or "none"
+    print(f"  ✓ {split}: {len(jobs) - len(corrupt)} images in {elapsed:.1f}s "
+          f"({len(jobs) / elapsed:.0f} img/s, {total_bytes / elapsed / 1e6:.0f} MB/s; {placed})")
+    if corrupt:
+        print(f"  ⚠️  {len(corrupt)} corrupt image(s) skipped")
+    return corrupt
+
+if INGEST_MODE == 'stream':
+    pool = ProcessPoolExecutor(max_workers=CONVERT_WORKERS, initializer=open_zip, initargs=(LOCAL_DATASET_ZIP,))
+else:
+    pool = ProcessPoolExecutor(max_workers=CONVERT_WORKERS)
 
-            with open(label_path, 'w') as f:
-                f.write(f"{label} 0.5 0.5 1.0 1.0\n")
+with pool:
+    for split, split_jobs in jobs.items():
+        if split_jobs:
+            for member in process_images(split_jobs, split, pool):
+                images[member] = {**images[member], 'status': 'corrupt', 'path': None, 'label_path': None}
 
-        except Exception as e:
-            continue
+manifest = {'task': TASK, 'classes': classes, 'images': images}
+save_manifest(manifest)
 
-        if (idx + 1) % 1000 == 0:
-            print(f"  Processed {idx + 1}/{len(image_paths)} images")
+corrupt_images = sorted(m for m, e in images.items() if e.get('status') == 'corrupt')
+if corrupt_images:
+    corrupt_list_path = '/teamspace/studios/this_studio/corrupt_images.txt'
+    with open(corrupt_list_path, 'w') as f:
+        f.write("\n".join(corrupt_images) + "\n")
+    print(f"\n⚠️  {len(corrupt_images)} corrupt image(s) listed in {corrupt_list_path}")
 
-process_images(train_imgs, train_labels, 'train')
-process_images(val_imgs, val_labels, 'val')
-process_images(test_imgs, test_labels, 'test')
+test_imgs = [e['path'] for e in images.values() if e['split'] == 'test' and e['path']]
 print("✓ All images processed!\n")
 
 # ============================================================================
 # STEP 7: CREATE YOLO CONFIG
 # ============================================================================
 
-data_yaml = {
-    'path': yolo_dataset_path,
-    'train': 'train/images',
-    'val': 'val/images',
-    'test': 'test/images',
-    'nc': num_classes,
-    'names': classes
-}
-
 yaml_path = f'{yolo_dataset_path}/data.yaml'
-with open(yaml_path, 'w') as f:
-    yaml.dump(data_yaml, f, sort_keys=False)
+class_names_path = '/teamspace/studios/this_studio/class_names.json'
+
+# Only rewritten when the class set changes (or the files are missing)
+if TASK == 'detect' and (classes_changed or not os.path.exists(yaml_path)):
+    data_yaml = {
+        'path': yolo_dataset_path,
+        'train': 'train/images',
+        'val': 'val/images',
+        'test': 'test/images',
+        'nc': num_classes,
+        'names': classes
+    }
+
+    with open(yaml_path, 'w') as f:
+        yaml.dump(data_yaml, f, sort_keys=False)
+
+# Classification reads class folders straight from the dataset root
+train_data = yolo_dataset_path if TASK == 'classify' else yaml_path
 
-with open('/teamspace/studios/this_studio/class_names.json', 'w') as f:
-    json.dump(classes, f, indent=2)
+if classes_changed or not os.path.exists(class_names_path):
+    with open(class_names_path, 'w') as f:
+        json.dump(classes, f, indent=2)
 
 print("✓ YOLO config created\n")
 
+# ============================================================================
+# STEP 7B: PACK PRE-RESIZED TRAINING SHARDS (CLASSIFY)
+# ============================================================================
+
+# Decoding full-size JPEGs every epoch makes training decode-bound, and caching
+# them all in RAM doesn't scale. Each split is decoded once, downscaled so its
+# short side is IMGSZ, and appended to ~1 GB shard files with an offset index.
+# The training loader slices images straight out of the memory-mapped shards:
+# epochs become sequential reads and RAM use is bounded by the page cache.
+IMGSZ = 512
+PACK_IMAGES = TASK == 'classify'
+PACK_DIR = f'{yolo_dataset_path}_packed'
+SHARD_BYTES = 1 << 30
+
+def load_resized(path):
+    """Decode one image and downscale it so its short side is IMGSZ (never upscaled)."""
+    im = cv2.imread(path)
+    if im is None:
+        return None
+    h, w = im.shape[:2]
+    scale = IMGSZ / min(h, w)
+    if scale < 1:
+        im = cv2.resize(im, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    return np.ascontiguousarray(im)
+
+def pack_split(split, pool):
+    """Write split's images into shard files; skipped when the split hasn't changed since the last pack."""
+    root = f'{yolo_dataset_path}/{split}'
+    out_dir = f'{PACK_DIR}/{split}'
+    entries = sorted((os.path.relpath(e['path'], root), e['hash'])
+                     for e in images.values() if e['split'] == split and e['path'])
+    signature = hashlib.sha1(json.dumps([IMGSZ, entries]).encode('utf-8')).hexdigest()
+
+    meta_path = f'{out_dir}/meta.json'
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f)['signature'] == signature:
+                print(f"  ✓ {split}: unchanged, reusing pack")
+                return
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+
+    start = time.time()
+    files, index = [], []
+    shard, offset, shard_file = 0, 0, None
+    paths = [os.path.join(root, rel) for rel, _ in entries]
+    chunksize = max(1, min(64, len(paths) // (CONVERT_WORKERS * 4)))
+    for (rel, _), im in zip(entries, pool.map(load_resized, paths, chunksize=chunksize)):
+        if im is None:
+            continue
+        if shard_file is None or offset + im.nbytes > SHARD_BYTES:
+            if shard_file is not None:
+                shard_file.close()
+                shard += 1
+            shard_file = open(f'{out_dir}/shard-{shard:04d}.bin', 'wb')
+            offset = 0
+        shard_file.write(im.data)
+        files.append(rel)
+        index.append((shard, offset, im.shape[0], im.shape[1]))
+        offset += im.nbytes
+    if shard_file is not None:
+        shard_file.close()
+
+    np.save(f'{out_dir}/index.npy', np.array(index, dtype=np.int64).reshape(-1, 4))
+    with open(f'{out_dir}/files.json', 'w') as f:
+        json.dump(files, f)
+    # Written last: a pack without meta.json is incomplete and gets rebuilt
+    with open(meta_path, 'w') as f:
+        json.dump({'signature': signature, 'imgsz': IMGSZ, 'images': len(files)}, f)
+
+    elapsed = max(time.time() - start, 1e-6)
+    packed_bytes = sum(h * w * 3 for _, _, h, w in index)
+    print(f"  ✓ {split}: packed {len(files)} images into {shard + 1} shard(s), "
+          f"{packed_bytes / 1e9:.2f} GB in {elapsed:.1f}s ({len(files) / elapsed:.0f} img/s)")
+
+class ShardPack:
+    """Read-only view of a packed split; images are zero-copy views into memory-mapped shards."""
+
+    def __init__(self, pack_dir):
+        self.pack_dir = pack_dir
+        self.index = np.load(f'{pack_dir}/index.npy')
+        with open(f'{pack_dir}/files.json') as f:
+            self.rows = {rel: row for row, rel in enumerate(json.load(f))}
+        # Opened on first use, so every dataloader worker maps its own shards
+        self._shards = {}
+
+    def image(self, row):
+        shard, offset, h, w = (int(v) for v in self.index[row])
+        data = self._shards.get(shard)
+        if data is None:
+            data = self._shards[shard] = np.memmap(f'{self.pack_dir}/shard-{shard:04d}.bin', dtype=np.uint8, mode='r')
+        return data[offset:offset + h * w * 3].reshape(h, w, 3)
+
+if PACK_IMAGES:
+    from ultralytics.data import ClassificationDataset
+    from ultralytics.models.yolo.classify import ClassificationTrainer
+
+    class PackedClassificationDataset(ClassificationDataset):
+        """ClassificationDataset that reads BGR pixels from a ShardPack instead of decoding files."""
+
+        def __init__(self, root, args, augment=False, prefix=""):
+            super().__init__(root, args, augment, prefix)
+            self.pack = ShardPack(f'{PACK_DIR}/{os.path.basename(os.path.normpath(root))}')
+            self.pack_rows = [self.pack.rows.get(os.path.relpath(s[0], self.root)) for s in self.samples]
+
+        def __getitem__(self, i):
+            row = self.pack_rows[i]
+            if row is None:
+                # Not in the pack (e.g. unreadable when packing): fall back to the file
+                return super().__getitem__(i)
+            im = self.pack.image(row)
+            im = Image.fromarray(cv2.cvtColor(im, cv2.COLOR_BGR2RGB))
+            return {"img": self.torch_transforms(im), "cls": self.samples[i][1]}
+
+    class PackedClassificationTrainer(ClassificationTrainer):
+        def build_dataset(self, img_path, mode="train", batch=None):
+            return PackedClassificationDataset(root=img_path, args=self.args, augment=mode == "train", prefix=mode)
+
+    print("="*70)
+    print("🗜️  PACKING TRAINING SHARDS")
+    print("="*70 + "\n")
+
+    with ProcessPoolExecutor(max_workers=CONVERT_WORKERS) as pool:
+        for split, _ in SPLIT_FRACTIONS:
+            pack_split(split, pool)
+    print()
+
 # ============================================================================
 # STEP 8: DISEASE RECOMMENDATIONS
 # ============================================================================
@@ -423,24 +686,32 @@ print("🚀 STARTING TRAINING - 2-HOUR OPTIMIZED")
 print("="*70 + "\n")
 
 print("⚙️  OPTIMIZATION SETTINGS:")
-print("   • Model: YOLOv8m (Medium - balanced speed/accuracy)")
+print(f"   • Model: YOLOv8m{'-cls' if TASK == 'classify' else ''} (Medium - balanced speed/accuracy)")
 print("   • Epochs: 30 (reduced from 100)")
 print("   • Batch size: 32 (optimized for speed)")
-print("   • Image size: 512 (reduced from 640)")
+print(f"   • Image size: {IMGSZ} (reduced from 640)")
 print("   • Early stopping patience: 8")
 print("   • Mixed precision training: Enabled")
-print("   • Caching: Enabled for faster data loading\n")
+print(f"   • Data loading: {'packed shards (memory-mapped)' if PACK_IMAGES else 'RAM cache'}\n")
 
 # Use YOLOv8m instead of YOLOv8l for faster training
-MODEL_SIZE = 'yolov8m.pt'
+MODEL_SIZE = 'yolov8m-cls.pt' if TASK == 'classify' else 'yolov8m.pt'
 model = YOLO(MODEL_SIZE)
 
 print(f"Training with {MODEL_SIZE}...\n")
 
+# Box-only settings don't apply to the classifier
+detect_args = {} if TASK == 'classify' else dict(
+    close_mosaic=5,         # Disable mosaic augmentation in last 5 epochs
+    rect=False,             # Disable rectangular training for speed
+    single_cls=False
+)
+
 results = model.train(
-    data=yaml_path,
+    trainer=PackedClassificationTrainer if PACK_IMAGES else None,
+    data=train_data,
     epochs=30,              # Reduced from 100
-    imgsz=512,              # Reduced from 640 for faster training
+    imgsz=IMGSZ,            # Reduced from 640 for faster training
     batch=32,               # Reduced from 64 to fit memory better
     patience=8,             # Reduced from 15 for faster early stopping
     save=True,
@@ -452,15 +723,13 @@ results = model.train(
     seed=42,
     cos_lr=True,
     amp=True,               # Mixed precision for speed
-    cache=True,             # Cache images in RAM for faster loading
+    cache=not PACK_IMAGES,  # Packed shards replace the RAM cache
     project='/teamspace/studios/this_studio/plant_disease_yolo',
     name='train',
     plots=True,
     save_period=10,
-    close_mosaic=5,         # Disable mosaic augmentation in last 5 epochs
     val=True,
-    rect=False,             # Disable rectangular training for speed
-    single_cls=False
+    **detect_args
 )
 
 print("\n✓ Training complete!\n")
@@ -476,10 +745,14 @@ print("="*70 + "\n")
 metrics = model.val()
 
 print(f"Results:")
-print(f"  mAP@50:    {metrics.box.map50:.4f}")
-print(f"  mAP@50-95: {metrics.box.map:.4f}")
-print(f"  Precision: {metrics.box.mp:.4f}")
-print(f"  Recall:    {metrics.box.mr:.4f}")
+if TASK == 'classify':
+    print(f"  Top-1 accuracy: {metrics.top1:.4f}")
+    print(f"  Top-5 accuracy: {metrics.top5:.4f}")
+else:
+    print(f"  mAP@50:    {metrics.box.map50:.4f}")
+    print(f"  mAP@50-95: {metrics.box.map:.4f}")
+    print(f"  Precision: {metrics.box.mp:.4f}")
+    print(f"  Recall:    {metrics.box.mr:.4f}")
 print("="*70 + "\n")
 
 # ============================================================================
@@ -496,11 +769,12 @@ results_path = '/teamspace/studios/this_studio/plant_disease_yolo/train'
 files_to_save = {
     f'{results_path}/weights/best.pt': 'best_model.pt',
     f'{results_path}/weights/last.pt': 'last_model.pt',
-    '/teamspace/studios/this_studio/class_names.json': 'class_names.json',
+    class_names_path: 'class_names.json',
     '/teamspace/studios/this_studio/disease_recommendations.json': 'disease_recommendations.json',
     f'{results_path}/results.png': 'training_results.png',
-    yaml_path: 'data.yaml'
 }
+if TASK == 'detect':
+    files_to_save[yaml_path] = 'data.yaml'
 
 for src, dst_name in files_to_save.items():
     if os.path.exists(src):
@@ -509,6 +783,246 @@ for src, dst_name in files_to_save.items():
 
 print(f"\n✓ Files saved to: {output_folder}\n")
 
+# ============================================================================
+# STEP 13B: DISTILL A CPU-SERVING STUDENT (CLASSIFY)
+# ============================================================================
+
+# The medium model above is the teacher. A nano/small student is trained on the
+# same splits against both the labels and the teacher's softened outputs, then
+# optionally channel-pruned and fine-tuned the same way. The report compares
+# per-class test accuracy and CPU latency, and the fastest candidate within the
+# accuracy budget is saved as student_model.pt.
+DISTILL = TASK == 'classify'
+STUDENT_SIZE = 'yolov8n-cls.pt'     # 'yolov8s-cls.pt' if nano loses too much
+DISTILL_TEMPERATURE = 4.0
+DISTILL_ALPHA = 0.7                 # Weight of the teacher term; the rest is label cross-entropy
+STUDENT_EPOCHS = 30
+PRUNE_RATIO = 0.3                   # Channels removed per prunable layer (needs torch-pruning); 0 disables
+PRUNE_FINETUNE_EPOCHS = 10
+LATENCY_IMAGES = 50
+MAX_TOP1_DROP = 0.01                # Budget vs the teacher for a candidate to be shipped
+MAX_CLASS_DROP = 0.03
+
+teacher_weights = f'{results_path}/weights/best.pt'
+
+if DISTILL:
+    import torch.nn.functional as F
+    from ultralytics.models.yolo.classify import ClassificationTrainer
+
+    class DistillationLoss:
+        """Label cross-entropy blended with KL divergence to the teacher's temperature-softened outputs."""
+
+        def __init__(self, base, teacher):
+            self.base = base
+            self.teacher = teacher
+
+        def __call__(self, preds, batch):
+            loss, loss_items = self.base(preds, batch)
+            logits = preds[1] if isinstance(preds, (list, tuple)) else preds
+            img = batch['img']
+            if next(self.teacher.parameters()).device != img.device:
+                self.teacher.to(img.device)
+            with torch.no_grad():
+                teacher_out = self.teacher(img)
+            # In eval mode the Classify head returns probabilities (with the logits on newer releases)
+            if isinstance(teacher_out, (list, tuple)):
+                teacher_logits = teacher_out[1]
+            else:
+                teacher_logits = teacher_out.clamp_min(1e-8).log()
+            T = DISTILL_TEMPERATURE
+            kd = F.kl_div(F.log_softmax(logits.float() / T, dim=1), F.softmax(teacher_logits.float() / T, dim=1),
+                          reduction='batchmean') * T * T
+            # Some releases scale the loss by batch size; match it so DISTILL_ALPHA keeps its meaning
+            scale = loss.detach() / loss_items.sum().clamp_min(1e-12)
+            return (1 - DISTILL_ALPHA) * loss + DISTILL_ALPHA * kd * scale, loss_items
+
+    def make_distillation_trainer(teacher_path, student_model=None):
+        """Trainer class for YOLO.train(trainer=...); `student_model` replaces the model built from the yaml."""
+        base = PackedClassificationTrainer if PACK_IMAGES else ClassificationTrainer
+
+        class DistillationTrainer(base):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                # Runs after the EMA copy is taken, so saved checkpoints never carry the teacher
+                self.add_callback('on_pretrain_routine_end', DistillationTrainer.attach_teacher)
+
+            def get_model(self, cfg=None, weights=None, verbose=True):
+                if student_model is not None:
+                    # Rebuilding a pruned model from its yaml would restore the removed channels
+                    return student_model
+                return super().get_model(cfg, weights, verbose)
+
+            def attach_teacher(self):
+                teacher = YOLO(teacher_path).model.float().eval()
+                for p in teacher.parameters():
+                    p.requires_grad = False
+                self.model.criterion = DistillationLoss(self.model.init_criterion(), teacher)
+
+        return DistillationTrainer
+
+    def prune_channels(weights, ratio):
+        """Structured L2-magnitude channel pruning; returns (pruned model, MACs/params before, after)."""
+        import torch_pruning as tp
+
+        net = YOLO(weights).model.float().cpu()
+        for p in net.parameters():
+            p.requires_grad = True
+        example = torch.randn(1, 3, IMGSZ, IMGSZ)
+        before = tp.utils.count_ops_and_params(net, example)
+        pruner = tp.pruner.MagnitudePruner(
+            net, example,
+            importance=tp.importance.MagnitudeImportance(p=2),
+            pruning_ratio=ratio,
+            # The class count is fixed
+            ignored_layers=[net.model[-1].linear],
+        )
+        pruner.step()
+        return net, before, tp.utils.count_ops_and_params(net, example)
+
+    def evaluate_per_class(weights, entries):
+        """Test-split accuracy per class name, and overall top-1."""
+        m = YOLO(weights)
+        device = 0 if torch.cuda.is_available() else 'cpu'
+        correct, total = {}, {}
+        predictions = m.predict([path for path, _ in entries], imgsz=IMGSZ, device=device, stream=True, verbose=False)
+        for (_, class_name), r in zip(entries, predictions):
+            total[class_name] = total.get(class_name, 0) + 1
+            correct[class_name] = correct.get(class_name, 0) + (m.names[r.probs.top1] == class_name)
+        per_class = {c: correct[c] / total[c] for c in sorted(total)}
+        return per_class, sum(correct.values()) / max(1, sum(total.values()))
+
+    def cpu_latency(weights, paths):
+        """Median / p95 single-image predict time on CPU (decode excluded), plus the model-only median."""
+        m = YOLO(weights)
+        ims = [im for im in map(load_resized, paths) if im is not None]
+        for im in ims[:5]:
+            m.predict(im, imgsz=IMGSZ, device='cpu', verbose=False)
+        total_ms, inference_ms = [], []
+        for im in ims:
+            t = time.perf_counter()
+            r = m.predict(im, imgsz=IMGSZ, device='cpu', verbose=False)[0]
+            total_ms.append((time.perf_counter() - t) * 1000)
+            inference_ms.append(r.speed['inference'])
+        return {
+            'median_ms': round(float(np.median(total_ms)), 2),
+            'p95_ms': round(float(np.percentile(total_ms, 95)), 2),
+            'inference_median_ms': round(float(np.median(inference_ms)), 2),
+        }
+
+    print("="*70)
+    print("🎓 DISTILLING STUDENT MODEL")
+    print("="*70 + "\n")
+
+    print(f"Teacher: {teacher_weights}")
+    print(f"Student: {STUDENT_SIZE} (T={DISTILL_TEMPERATURE}, alpha={DISTILL_ALPHA}, {STUDENT_EPOCHS} epochs)\n")
+
+    student_train_args = dict(
+        data=train_data,
+        imgsz=IMGSZ,
+        batch=64,
+        patience=8,
+        device=0,
+        workers=8,
+        optimizer='AdamW',
+        seed=42,
+        cos_lr=True,
+        amp=True,
+        cache=not PACK_IMAGES,
+        project='/teamspace/studios/this_studio/plant_disease_yolo',
+        plots=True,
+        val=True,
+    )
+
+    student = YOLO(STUDENT_SIZE)
+    student.train(trainer=make_distillation_trainer(teacher_weights), epochs=STUDENT_EPOCHS,
+                  pretrained=True, name='distill', **student_train_args)
+    candidates = {'teacher': teacher_weights, 'student': str(student.trainer.best)}
+    print("\n✓ Student trained\n")
+
+    prune_stats = None
+    if PRUNE_RATIO > 0:
+        try:
+            import torch_pruning  # noqa: F401
+        except ImportError:
+            print("⚠️  torch-pruning not installed (pip install torch-pruning), skipping channel pruning\n")
+        else:
+            print(f"✂️  Pruning {PRUNE_RATIO:.0%} of channels, then fine-tuning for {PRUNE_FINETUNE_EPOCHS} epochs...")
+            pruned_net, before, after = prune_channels(candidates['student'], PRUNE_RATIO)
+            prune_stats = {'macs_before': before[0], 'macs_after': after[0],
+                           'params_before': before[1], 'params_after': after[1]}
+            print(f"  MACs {before[0] / 1e9:.2f}G -> {after[0] / 1e9:.2f}G, "
+                  f"params {before[1] / 1e6:.2f}M -> {after[1] / 1e6:.2f}M")
+            pruned = YOLO(candidates['student'])
+            pruned.train(trainer=make_distillation_trainer(teacher_weights, student_model=pruned_net),
+                         epochs=PRUNE_FINETUNE_EPOCHS, name='distill_pruned', **student_train_args)
+            candidates['student_pruned'] = str(pruned.trainer.best)
+            print("\n✓ Pruned student fine-tuned\n")
+
+    # --- Report: per-class test accuracy and CPU latency of every candidate ---
+    test_entries = [(e['path'], e['class']) for e in images.values() if e['split'] == 'test' and e['path']]
+    latency_paths = [path for path, _ in test_entries[:LATENCY_IMAGES]]
+
+    report = {'test_images': len(test_entries), 'cpu_threads': torch.get_num_threads(),
+              'pruning': prune_stats, 'models': {}}
+    for name, weights in candidates.items():
+        print(f"Evaluating {name}...")
+        per_class, top1 = evaluate_per_class(weights, test_entries)
+        report['models'][name] = {
+            'weights': weights,
+            'size_mb': round(os.path.getsize(weights) / 1e6, 2),
+            'params': sum(p.numel() for p in YOLO(weights).model.parameters()),
+            'top1': round(top1, 4),
+            'per_class': {c: round(a, 4) for c, a in per_class.items()},
+            'cpu_latency': cpu_latency(weights, latency_paths),
+        }
+
+    teacher_report = report['models']['teacher']
+    for name, entry in report['models'].items():
+        if name == 'teacher':
+            continue
+        entry['speedup'] = round(teacher_report['cpu_latency']['median_ms'] / entry['cpu_latency']['median_ms'], 2)
+        entry['regressed_classes'] = [c for c, a in entry['per_class'].items()
+                                      if teacher_report['per_class'].get(c, 0) - a > MAX_CLASS_DROP]
+        entry['within_budget'] = (teacher_report['top1'] - entry['top1'] <= MAX_TOP1_DROP
+                                  and not entry['regressed_classes'])
+
+    shippable = [n for n, e in report['models'].items() if e.get('within_budget')]
+    report['recommended'] = min(shippable, key=lambda n: report['models'][n]['cpu_latency']['median_ms'],
+                                default='teacher')
+
+    print(f"\n{'Model':<16}{'Top-1':>8}{'CPU p50 ms':>12}{'CPU p95 ms':>12}{'Speedup':>9}{'Params':>10}{'MB':>8}")
+    for name, e in report['models'].items():
+        print(f"{name:<16}{e['top1']:>8.4f}{e['cpu_latency']['median_ms']:>12.1f}{e['cpu_latency']['p95_ms']:>12.1f}"
+              f"{e.get('speedup', 1.0):>8.2f}x{e['params'] / 1e6:>9.2f}M{e['size_mb']:>8.1f}")
+
+    names = list(report['models'])
+    print(f"\nPer-class test accuracy (⚠️  = more than {MAX_CLASS_DROP:.0%} below the teacher):")
+    print(f"{'Class':<45}" + "".join(f"{n:>16}" for n in names))
+    for class_name, teacher_acc in teacher_report['per_class'].items():
+        cells = []
+        for n in names:
+            acc = report['models'][n]['per_class'].get(class_name, 0.0)
+            flag = '⚠️ ' if teacher_acc - acc > MAX_CLASS_DROP else ''
+            cells.append(f"{flag}{acc:.4f}".rjust(16))
+        print(f"{class_name[:44]:<45}" + "".join(cells))
+
+    report_path = os.path.join(output_folder, 'distillation_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    recommended = report['recommended']
+    if recommended == 'teacher':
+        print(f"\n⚠️  No student stays within the accuracy budget "
+              f"(top-1 -{MAX_TOP1_DROP:.0%}, per class -{MAX_CLASS_DROP:.0%}); keep serving best_model.pt")
+    else:
+        shutil.copy(candidates[recommended], os.path.join(output_folder, 'student_model.pt'))
+        print(f"\n✓ {recommended}: {report['models'][recommended]['speedup']}x faster on CPU, "
+              f"saved as student_model.pt")
+    print(f"✓ Report: {report_path}")
+    print("="*70 + "\n")
+else:
+    print("⏩ Distillation is only set up for the classifier (TASK = 'classify')\n")
+
 # ============================================================================
 # STEP 14: PREDICTION FUNCTION
 # ============================================================================
@@ -516,30 +1030,34 @@ print(f"\n✓ Files saved to: {output_folder}\n")
 def predict_disease(image_path, model, class_names):
     results = model.predict(image_path, conf=0.25, verbose=False)
 
-    if len(results[0].boxes) > 0:
+    if results[0].probs is not None:
+        # Classifier: always returns a class, no boxes
+        disease_name = class_names[results[0].probs.top1]
+        confidence = float(results[0].probs.top1conf * 100)
+    elif len(results[0].boxes) > 0:
         probs = results[0].boxes.conf.cpu().numpy()
         classes_pred = results[0].boxes.cls.cpu().numpy()
 
         top_idx = np.argmax(probs)
         disease_name = class_names[int(classes_pred[top_idx])]
         confidence = float(probs[top_idx] * 100)
+    else:
+        return None, 0
 
-        img = cv2.imread(image_path)
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-        plt.figure(figsize=(10, 6))
-        plt.imshow(img)
-        plt.title(f"{disease_name} ({confidence:.1f}%)", fontsize=14, fontweight='bold')
-        plt.axis('off')
-        plt.tight_layout()
-        plt.show()
+    img = cv2.imread(image_path)
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
-        print(f"\n🌿 Detected: {disease_name}")
-        print(f"📊 Confidence: {confidence:.2f}%\n")
+    plt.figure(figsize=(10, 6))
+    plt.imshow(img)
+    plt.title(f"{disease_name} ({confidence:.1f}%)", fontsize=14, fontweight='bold')
+    plt.axis('off')
+    plt.tight_layout()
+    plt.show()
 
-        return disease_name, confidence
+    print(f"\n🌿 Detected: {disease_name}")
+    print(f"📊 Confidence: {confidence:.2f}%\n")
 
-    return None, 0
+    return disease_name, confidence
 
 # Test
 if len(test_imgs) > 0:
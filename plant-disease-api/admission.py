@@ -0,0 +1,153 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """The request was shed instead of run; answer 503 with Retry-After."""
+
+    def __init__(self, reason, retry_after=1):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Overloaded):
+    """The request's deadline passed before its inference started; its client has given up."""
+
+    def __init__(self, retry_after=1):
+        super().__init__('deadline', retry_after)
+
+
+class UploadGate:
+    """Bound how many uploads a worker receives at once; beyond `limit`, `hold()` raises Overloaded.
+
+    Kept apart from AdmissionController's tickets, so clients slowly sending
+    their bodies never use up the capacity of requests ready to run.
+    """
+
+    def __init__(self, limit=256):
+        self.limit = max(1, int(limit))
+        self.receiving = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self):
+        with self._lock:
+            if self.receiving >= self.limit:
+                self.shed += 1
+                raise Overloaded('uploads_full')
+            self.receiving += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.receiving -= 1
+
+    def stats(self):
+        with self._lock:
+            return {'receiving': self.receiving, 'limit': self.limit, 'shed': self.shed}
+
+
+class AdmissionController:
+    """Bound how much image work a worker accepts, so overload is refused instead of queued.
+
+    A request takes a ticket once its upload has been received: at most
+    `max_active + max_queue` tickets exist, and beyond that `ticket()` raises
+    Overloaded at once. Ticket holders then wait in `slot()` for one of
+    `max_active` inference slots, for at most `max_wait` seconds and never past
+    their deadline. Admitted requests therefore queue behind a bounded amount
+    of work however much traffic arrives.
+    """
+
+    def __init__(self, max_active=8, max_queue=16, max_wait=5.0):
+        self.max_active = max(1, int(max_active))
+        self.max_queue = max(0, int(max_queue))
+        self.max_wait = max(0.0, float(max_wait))
+        self.tickets = 0
+        self.active = 0
+        self.shed = {}
+        self._service_time = None
+        self._cond = threading.Condition()
+
+    @property
+    def queued(self):
+        return self.tickets - self.active
+
+    def retry_after(self):
+        """Whole seconds until the work ahead of a new request should have drained (at least 1)."""
+        per_request = self._service_time or 1.0
+        return max(1, math.ceil(self.tickets * per_request / self.max_active))
+
+    def _shed(self, reason):
+        # Caller holds self._cond
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+        return self.retry_after()
+
+    @contextmanager
+    def ticket(self):
+        with self._cond:
+            if self.tickets >= self.max_active + self.max_queue:
+                raise Overloaded('queue_full', self._shed('queue_full'))
+            self.tickets += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.tickets -= 1
+
+    def check(self):
+        """Raise Overloaded now if `ticket()` would, for work that is admitted piece by piece later."""
+        with self._cond:
+            if self.tickets >= self.max_active + self.max_queue:
+                raise Overloaded('queue_full', self._shed('queue_full'))
+
+    @contextmanager
+    def slot(self, deadline=None, max_wait=None):
+        """Hold one of the inference slots; `deadline` is a time.monotonic() value.
+
+        `max_wait` overrides the controller's; math.inf waits for a slot
+        however long it takes (background work that should queue, not be shed).
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        wait_until = time.monotonic() + max_wait
+        if deadline is not None:
+            wait_until = min(wait_until, deadline)
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    raise DeadlineExceeded(self._shed('deadline'))
+                if self.active < self.max_active:
+                    break
+                if now >= wait_until:
+                    raise Overloaded('queue_timeout', self._shed('queue_timeout'))
+                self._cond.wait(None if math.isinf(wait_until) else wait_until - now)
+            self.active += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self.active -= 1
+                # EWMA of slot hold time, for Retry-After
+                if self._service_time is None:
+                    self._service_time = elapsed
+                else:
+                    self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+                self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active': self.active,
+                'queued': self.queued,
+                'max_active': self.max_active,
+                'max_queue': self.max_queue,
+                'shed': dict(self.shed),
+                'service_ms': round(self._service_time * 1000, 1) if self._service_time else None,
+            }
@@ -0,0 +1,269 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import inference
+import metrics
+from admission import Overloaded
+from cpu_partition import available_cpus
+from preprocessing import UndecodableImageError
+from leaf_gate import ImageRejected
+
+# --- ASYNC SERVING CONFIGURATION ---
+# Uploads are read on the event loop; decode + inference run on a bounded pool,
+# so slow mobile uploads hold a connection but never an inference slot.
+# INFERENCE_THREADS defaults to this worker's share of the CPU quota: the
+# MODEL_THREADS gunicorn's post_fork sets, else the whole cgroup quota.
+def inference_threads():
+    for name in ('INFERENCE_THREADS', 'MODEL_THREADS'):
+        if os.environ.get(name):
+            return int(os.environ[name])
+    _, usable = available_cpus()
+    return usable
+
+# Created at startup, in the worker: a preloaded import runs before post_fork sets MODEL_THREADS
+executor = None
+# --- END CONFIGURATION ---
+
+class UploadTooLarge(HTTPException):
+    # An HTTPException, so FastAPI lets it through body parsing instead of turning it into a 400
+    def __init__(self, limit):
+        super().__init__(status_code=413)
+        self.limit = limit
+
+
+class UploadLimit:
+    """Refuse uploads over the route's limit: from Content-Length before the body is read,
+    otherwise as soon as more than the limit has been received."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limit = inference.UPLOAD_LIMITS.get(scope['path']) if scope['type'] == 'http' else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        declared = dict(scope['headers']).get(b'content-length', b'')
+        if declared.isdigit() and int(declared) > limit:
+            return await upload_too_large_response(limit)(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    raise UploadTooLarge(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def upload_too_large_response(limit):
+    metrics.ERRORS.labels('upload_too_large').inc()
+    return JSONResponse({'error': 'Upload too large', 'max_bytes': limit}, status_code=413)
+
+
+app = FastAPI(title="Plant Disease API")
+# Innermost, so 413s still get CORS headers and request metrics
+app.add_middleware(UploadLimit)
+# expose_headers lets the web app read Retry-After on 503s
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+                   expose_headers=["Retry-After"])
+
+@app.exception_handler(UploadTooLarge)
+async def upload_too_large(request: Request, e: UploadTooLarge):
+    return upload_too_large_response(e.limit)
+
+@app.on_event("startup")
+def start_executor():
+    global executor
+    threads = inference_threads()
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="inference")
+    print(f"✓ {threads} inference thread(s)")
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    executor.shutdown(wait=False, cancel_futures=True)
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    started = time.perf_counter()
+    metrics.IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.IN_FLIGHT.dec()
+    route = request.scope.get('route')
+    endpoint = route.path if route else 'unmatched'
+    metrics.observe_request(endpoint, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.get("/")
+async def health():
+    return inference.health_status()
+
+@app.get("/health/live")
+async def health_live():
+    alive, body = inference.liveness()
+    return JSONResponse(body, status_code=200 if alive else 500)
+
+@app.get("/health/ready")
+async def health_ready():
+    ready, body = inference.readiness()
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+def not_ready_response():
+    if inference.loader.failed:
+        # Retrying won't help until the container restarts (see /health/live)
+        return JSONResponse({'error': 'Model failed to load', 'reason': inference.loader.error}, status_code=500)
+    return JSONResponse(
+        {'error': 'Model is still loading', 'loading': inference.loader.progress()},
+        status_code=503,
+        headers={'Retry-After': '5'},
+    )
+
+def shed_response(e):
+    metrics.SHED.labels(e.reason).inc()
+    return JSONResponse(
+        {'error': 'Server busy, retry later', 'reason': e.reason, 'retry_after': e.retry_after},
+        status_code=503,
+        headers={'Retry-After': str(e.retry_after)},
+    )
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    metrics.QUEUE_DEPTH.set(inference.router.pending())
+    metrics.ADMISSION_ACTIVE.set(inference.admission.active)
+    metrics.ADMISSION_QUEUED.set(inference.admission.queued)
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+async def handle_image_upload(request, run):
+    """Shared body of /predict and /diagnose: run `run` on the 'image' upload's spooled file, off the loop."""
+    if not inference.loader.ready:
+        return not_ready_response()
+    deadline = inference.request_deadline(request.headers.get('X-Client-Timeout'))
+
+    try:
+        # Received before taking a ticket, so slow uploads never hold inference capacity
+        with inference.uploads.hold():
+            # Parse the multipart body ourselves so upload time is measured as its own stage
+            with metrics.STAGE_LATENCY.labels('upload_read').time():
+                form = await request.form()
+                image = form.get('image')
+                upload = image.file if hasattr(image, 'file') else None
+
+        if upload is None:
+            metrics.ERRORS.labels('missing_image').inc()
+            return JSONResponse({'error': 'No image provided'}, status_code=400)
+
+        if await request.is_disconnected():
+            # The client gave up during the upload; nobody will read the answer
+            metrics.SHED.labels('disconnected').inc()
+            return Response(status_code=499)
+
+        with inference.admission.ticket():
+            loop = asyncio.get_running_loop()
+            # Decoded straight from the parsed upload, without reading it into a bytes copy
+            return await loop.run_in_executor(executor, inference.run_admitted, run, upload, deadline)
+    except Overloaded as e:
+        return shed_response(e)
+    except UndecodableImageError:
+        return JSONResponse({'error': 'Could not decode image'}, status_code=400)
+    except ImageRejected as e:
+        # 422: a valid image, but not one the model should score
+        return JSONResponse(inference.rejection_body(e), status_code=422)
+
+@app.post("/predict")
+async def predict(request: Request):
+    return await handle_image_upload(request, inference.predict_upload)
+
+@app.post("/predict/tiled")
+async def predict_tiled(request: Request):
+    """Opt-in tiled mode for whole-plant and crop-row photos; see inference.predict_tiled."""
+    return await handle_image_upload(request, inference.predict_tiled)
+
+@app.post("/diagnose")
+async def diagnose(request: Request):
+    return await handle_image_upload(request, inference.diagnose_upload)
+
+@app.post("/recommend")
+async def recommend(request: Request):
+    """Same request and response as the recommendation space's /predict, served from cache."""
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    if not isinstance(body, dict) or not body.get('crop') or not body.get('disease'):
+        return JSONResponse({'error': "JSON body needs 'crop' and 'disease'"}, status_code=400)
+
+    # A miss blocks on the upstream LLM for seconds, so keep it off the event loop,
+    # and out of the CPU-sized inference pool
+    loop = asyncio.get_running_loop()
+    try:
+        value, source = await loop.run_in_executor(
+            None, inference.recommendation_cache.get, body['crop'], body['disease']
+        )
+    except Exception as e:
+        metrics.ERRORS.labels('recommender_error').inc()
+        return JSONResponse(
+            {'error': 'Recommendation service failed', 'detail': f"{type(e).__name__}: {e}"}, status_code=502
+        )
+    return Response(value['body'], media_type=value['content_type'], headers={'X-Cache': source})
+
+@app.post("/predict/batch")
+async def predict_batch(request: Request):
+    if not inference.loader.ready:
+        return not_ready_response()
+
+    try:
+        with inference.uploads.hold():
+            form = await request.form()
+        # Refused like /predict when this worker is saturated; the images are
+        # then admitted one by one through the bulk lane
+        inference.admission.check()
+    except Overloaded as e:
+        return shed_response(e)
+
+    images = [f for f in form.getlist('images') if hasattr(f, 'file')]
+    if not images:
+        metrics.ERRORS.labels('missing_image').inc()
+        return JSONResponse({'error': 'No images provided'}, status_code=400)
+
+    # A sync generator: Starlette iterates it in its threadpool, off the event loop
+    uploads = [(f.filename, f.file) for f in images]
+    lines = (json.dumps(result) + '\n' for result in inference.predict_stream(inference.iter_uploads(uploads)))
+    return StreamingResponse(lines, media_type='application/x-ndjson')
+
+def admin_denied(request):
+    if not inference.admin_authorized(request.headers.get('Authorization')):
+        return JSONResponse({'error': 'Admin token required'}, status_code=403)
+    return None
+
+@app.get("/admin/models")
+async def admin_models(request: Request):
+    """Registered versions, the requested serving state and this worker's reload progress."""
+    return admin_denied(request) or JSONResponse(inference.models_status())
+
+@app.post("/admin/models/activate")
+async def admin_activate(request: Request):
+    """Hot-swap to a registered version, optionally splitting traffic with a candidate."""
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    try:
+        return JSONResponse(inference.activate_models(body), status_code=202)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
@@ -0,0 +1,133 @@
+import fcntl
+import shutil
+from pathlib import Path
+from ultralytics import YOLO
+
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+
+
+def artifact_path(weights, backend, int8=False):
+    """Return where the exported artifact for `backend` lives next to `weights`."""
+    weights = Path(weights)
+    suffix = '_int8' if int8 else ''
+    if backend == 'pytorch':
+        return weights
+    if backend == 'onnx':
+        return weights.with_name(f"{weights.stem}{suffix}.onnx")
+    if backend == 'openvino':
+        # Matches the directory name Ultralytics writes on export
+        return weights.with_name(f"{weights.stem}{suffix}_openvino_model")
+    raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+
+class InferenceBackend:
+    """A loaded model plus the predict arguments its runtime requires."""
+
+    def __init__(self, name, model, imgsz, int8=False, path=None, num_threads=None):
+        self.name = name
+        self.model = model
+        self.imgsz = imgsz
+        self.int8 = int8
+        self.path = path
+        self.num_threads = num_threads
+        self._threads_applied = num_threads is None or name == 'pytorch'
+
+    @property
+    def names(self):
+        return self.model.names
+
+    @property
+    def task(self):
+        return self.model.task
+
+    def predict(self, images, **kwargs):
+        # Always infer at the training / export size; exported graphs have a static input shape
+        kwargs.setdefault('imgsz', self.imgsz)
+        results = self.model.predict(images, **kwargs)
+        if not self._threads_applied:
+            self._apply_num_threads()
+        return results
+
+    def _apply_num_threads(self):
+        """Rebuild the ONNX Runtime session / OpenVINO compiled model with `num_threads` threads.
+
+        Ultralytics creates them on the first predict with a thread per core,
+        which oversubscribes the CPU once several workers share it.
+        """
+        self._threads_applied = True
+        runtime = self.model.predictor.model
+        if self.name == 'onnx':
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = self.num_threads
+            options.inter_op_num_threads = 1
+            runtime.session = ort.InferenceSession(
+                str(self.path), sess_options=options, providers=runtime.session.get_providers()
+            )
+        elif self.name == 'openvino':
+            import openvino as ov
+
+            xml = next(Path(self.path).glob('*.xml'))
+            runtime.ov_compiled_model = ov.Core().compile_model(
+                str(xml), device_name='CPU',
+                config={
+                    'PERFORMANCE_HINT': getattr(runtime, 'inference_mode', 'LATENCY'),
+                    'INFERENCE_NUM_THREADS': self.num_threads,
+                },
+            )
+
+    def describe(self):
+        return {'backend': self.name, 'task': self.task, 'int8': self.int8, 'imgsz': self.imgsz}
+
+
+def find_or_export(weights, backend, int8=False, imgsz=512, export_dir=None):
+    """Locate the artifact for `backend`, exporting it into `export_dir` if missing.
+
+    Artifacts shipped next to the weights win. Otherwise an export cached in
+    `export_dir` (e.g. cache_dir/exports) is reused, so only the first start
+    after a deploy pays for the export. INT8 artifacts need calibration data
+    and are never exported implicitly.
+    """
+    path = artifact_path(weights, backend, int8)
+    if path.exists():
+        return path
+    if backend == 'pytorch' or export_dir is None:
+        raise FileNotFoundError(f"No {backend} artifact at {path}; run export_model.py first")
+
+    export_dir = Path(export_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    cached_weights = export_dir / Path(weights).name
+    cached_path = artifact_path(cached_weights, backend, int8)
+
+    # Workers that don't share a preloaded model start together; export only once
+    with open(export_dir / ".export.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if cached_path.exists():
+            return cached_path
+        if int8:
+            raise FileNotFoundError(f"No {backend} INT8 artifact at {path}; run export_model.py --int8 first")
+
+        print(f"Exporting {weights} to {backend} in {export_dir} (first start only)...")
+        shutil.copy2(weights, cached_weights)
+        YOLO(str(cached_weights)).export(format=backend, imgsz=imgsz, dynamic=False)
+        return cached_path
+
+
+def load_backend(weights='best_model.pt', backend='pytorch', int8=False, imgsz=512, task='detect', export_dir=None,
+                 num_threads=None):
+    """Load `weights` on `backend`; `num_threads` caps ONNX Runtime / OpenVINO intra-op threads."""
+    backend = backend.lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    path = find_or_export(weights, backend, int8, imgsz, export_dir)
+
+    if backend == 'pytorch':
+        model = YOLO(str(path))
+        # Serve at the imgsz the checkpoint was trained with (512 in Model training code.py)
+        ckpt = getattr(model, 'ckpt', None) or {}
+        train_imgsz = ckpt.get('train_args', {}).get('imgsz', imgsz)
+        return InferenceBackend(backend, model, imgsz=train_imgsz)
+
+    return InferenceBackend(backend, YOLO(str(path), task=task), imgsz=imgsz, int8=int8, path=path,
+                            num_threads=num_threads)
@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from queue import Queue, Empty
+
+from admission import DeadlineExceeded
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-image requests into one batched forward pass.
+
+    Callers block on `predict()` while a background thread drains the queue,
+    waiting at most `max_wait_ms` to fill a batch of `max_batch_size` items,
+    then hands the whole batch to `predict_batch` and fans the per-item
+    results back out to the waiting callers. Items whose deadline has passed
+    by the time their batch forms are dropped rather than run.
+
+    `predict_many()` queues a group (e.g. the tiles of one photo) that is
+    never split across forward passes, so a batch can exceed
+    `max_batch_size` by up to one group.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=8, max_wait_ms=10):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._closed = False
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def submit(self, item, deadline=None):
+        """Queue one item; `deadline` is a time.monotonic() value after which it is not worth running."""
+        return self._enqueue([item], deadline, single=True)
+
+    def submit_many(self, items, deadline=None):
+        """Queue items that run in the same forward pass; the future's result is their outputs, in order."""
+        return self._enqueue(list(items), deadline, single=False)
+
+    def _enqueue(self, items, deadline, single):
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((items, future, deadline, single))
+        return future
+
+    def predict(self, item, timeout=None, deadline=None):
+        return self._wait(self.submit(item, deadline), timeout, deadline)
+
+    def predict_many(self, items, timeout=None, deadline=None):
+        return self._wait(self.submit_many(items, deadline), timeout, deadline)
+
+    def _wait(self, future, timeout, deadline):
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            if not future.cancel():
+                # Already in a forward pass, which may still be reading the inputs: wait it out
+                return future.result()
+            if deadline is not None:
+                raise DeadlineExceeded() from None
+            raise
+
+    def close(self):
+        """Stop the batch thread once everything already queued has run."""
+        self._closed = True
+        self._queue.put(None)
+
+    def _ensure_worker(self):
+        # Started lazily so the thread is created in the serving process,
+        # not in a parent that may fork workers afterwards.
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="micro-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except Empty:
+                break
+            if entry is None:
+                # close(): run this batch, stop on the next round
+                self._queue.put(None)
+                break
+            batch.append(entry)
+            size += len(entry[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            now = time.monotonic()
+            live = []
+            for items, future, deadline, single in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if deadline is not None and now >= deadline:
+                    future.set_exception(DeadlineExceeded())
+                    continue
+                live.append((items, future, single))
+            batch = live
+            if not batch:
+                continue
+
+            try:
+                outputs = self.predict_batch([item for items, _, _ in batch for item in items])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for items, future, single in batch:
+                group = outputs[offset:offset + len(items)]
+                offset += len(items)
+                future.set_result(group[0] if single else list(group))
@@ -0,0 +1,326 @@
+"""
+Load benchmark for /predict: throughput, latency percentiles and per-stage timing.
+
+Starts the API locally through start.sh (same gunicorn config as production)
+against a small fixture classifier, posts synthetic leaf photos at phone
+resolutions and formats at each concurrency level, and writes the results as
+JSON. With --baseline it exits non-zero when a level regresses past
+--threshold, so performance changes can be checked on any Linux CPU box.
+
+    python benchmarks/bench_api.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_api.py --baseline benchmarks/baseline.json
+
+The prediction cache is disabled so every request runs the full pipeline;
+pass --with-cache to measure it too, or --url to benchmark a running server.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+from cpu_partition import available_cpus  # noqa: E402
+
+FIXTURE_PATH = Path(__file__).resolve().parent / "fixtures" / "bench_cls.pt"
+FIXTURE_CLASSES = [
+    'Apple___Apple_scab', 'Apple___healthy', 'Corn_(maize)___Common_rust_', 'Corn_(maize)___healthy',
+    'Potato___Early_blight', 'Potato___Late_blight', 'Tomato___Bacterial_spot', 'Tomato___healthy',
+]
+
+# (width, height, format, save options): typical phone camera and gallery uploads
+PHONE_IMAGES = [
+    (4032, 3024, 'JPEG', {'quality': 90}),
+    (3024, 4032, 'JPEG', {'quality': 85}),
+    (1920, 1080, 'JPEG', {'quality': 80}),
+    (2048, 1536, 'PNG', {}),
+    (1600, 1200, 'WEBP', {'quality': 80}),
+]
+CONTENT_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+
+STAGE_PATTERN = re.compile(r'^plant_api_stage_seconds_(sum|count)\{stage="(\w+)"\} ([0-9.eE+-]+)$')
+METRICS = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def make_fixture(path=FIXTURE_PATH):
+    """Save a randomly initialised YOLOv8n-cls with plant class names; built offline, no download."""
+    from ultralytics import YOLO
+    from ultralytics.nn.tasks import ClassificationModel
+
+    model = YOLO('yolov8n-cls.yaml', task='classify')
+    model.model = ClassificationModel('yolov8n-cls.yaml', nc=len(FIXTURE_CLASSES), verbose=False)
+    model.model.names = dict(enumerate(FIXTURE_CLASSES))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    model.save(str(path))
+    return path
+
+
+def synthetic_leaf(width, height, rng):
+    """A textured green leaf with brown lesions on soil; passes the API's leaf gate."""
+    background = rng.integers(60, 110, size=(height // 8, width // 8, 3), dtype=np.uint8)
+    background[..., 2] //= 2
+    img = Image.fromarray(background).resize((width, height), Image.BILINEAR)
+
+    draw = ImageDraw.Draw(img)
+    cx, cy = width / 2 + rng.uniform(-0.1, 0.1) * width, height / 2 + rng.uniform(-0.1, 0.1) * height
+    rx, ry = width * rng.uniform(0.3, 0.42), height * rng.uniform(0.3, 0.42)
+    green = tuple(int(v) for v in (rng.integers(30, 70), rng.integers(120, 180), rng.integers(30, 70)))
+    draw.ellipse((cx - rx, cy - ry, cx + rx, cy + ry), fill=green)
+    draw.line((cx - rx, cy, cx + rx, cy), fill=(150, 190, 110), width=max(2, width // 300))
+    for _ in range(rng.integers(5, 20)):
+        sx, sy = cx + rng.uniform(-0.7, 0.7) * rx, cy + rng.uniform(-0.7, 0.7) * ry
+        r = rng.uniform(0.01, 0.04) * width
+        draw.ellipse((sx - r, sy - r, sx + r, sy + r), fill=(110, 80, 40))
+
+    # Texture in 16 px cells survives the gate's downscale, like real leaf veins and grain
+    noise = rng.normal(0, 12, size=(height // 16 + 1, width // 16 + 1, 3)).astype(np.float32)
+    noise = np.repeat(np.repeat(noise, 16, axis=0), 16, axis=1)[:height, :width]
+    pixels = np.clip(np.asarray(img, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels)
+
+
+def make_images(count, seed=0):
+    """(filename, content type, bytes) for `count` distinct images cycling through PHONE_IMAGES."""
+    rng = np.random.default_rng(seed)
+    images = []
+    for i in range(count):
+        width, height, fmt, options = PHONE_IMAGES[i % len(PHONE_IMAGES)]
+        buffer = io.BytesIO()
+        synthetic_leaf(width, height, rng).save(buffer, format=fmt, **options)
+        images.append((f"leaf_{i}.{fmt.lower()}", CONTENT_TYPES[fmt], buffer.getvalue()))
+    return images
+
+
+def multipart(filename, content_type, data):
+    boundary = uuid.uuid4().hex
+    head = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode()
+    return head + data + f'\r\n--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+def post_image(url, image, timeout=120):
+    """Return (status, seconds) for one /predict call."""
+    body, content_type = multipart(*image)
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type}, method='POST')
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - started
+
+
+def stage_totals(base_url):
+    """{stage: (sum seconds, count)} from the server's /metrics."""
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+        text = response.read().decode()
+    totals = {}
+    for line in text.splitlines():
+        match = STAGE_PATTERN.match(line)
+        if match:
+            kind, stage, value = match.groups()
+            total, count = totals.get(stage, (0.0, 0.0))
+            totals[stage] = (total + float(value), count) if kind == 'sum' else (total, count + float(value))
+    return totals
+
+
+def run_level(base_url, images, concurrency, requests, warmup):
+    url = f"{base_url}/predict"
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: post_image(url, images[i % len(images)]), range(warmup)))
+        before = stage_totals(base_url)
+        started = time.perf_counter()
+        results = list(pool.map(lambda i: post_image(url, images[i % len(images)]), range(requests)))
+        elapsed = time.perf_counter() - started
+        after = stage_totals(base_url)
+
+    latencies = np.array([seconds for status, seconds in results if status == 200]) * 1000
+    stages = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, (0.0, 0.0))
+        if count > prev_count:
+            stages[stage] = round((total - prev_total) / (count - prev_count) * 1000, 3)
+
+    ok = len(latencies)
+    # 503s are admission control shedding load, not failures
+    shed = sum(1 for status, _ in results if status == 503)
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': requests - ok - shed,
+        'shed': shed,
+        'throughput_rps': round(ok / elapsed, 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2) if ok else None,
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2) if ok else None,
+        'p99_ms': round(float(np.percentile(latencies, 99)), 2) if ok else None,
+        'stages_ms': stages,
+    }
+
+
+def start_server(port, weights, app_server, workers, with_cache):
+    metrics_dir = tempfile.mkdtemp(prefix="bench-metrics-")
+    env = {
+        **os.environ,
+        'PORT': str(port),
+        'MODEL_WEIGHTS': str(weights),
+        'APP_SERVER': app_server,
+        'WORKERS': str(workers),
+        'PROMETHEUS_MULTIPROC_DIR': metrics_dir,
+    }
+    if not with_cache:
+        env.update(PRED_CACHE_SIZE='0', PRED_CACHE_MAX_DISTANCE='-1', PRED_CACHE_PERSIST='0')
+    # Own process group, so stopping it also stops the gunicorn workers
+    return subprocess.Popen(['sh', 'start.sh'], cwd=API_DIR, env=env, start_new_session=True)
+
+
+def wait_ready(base_url, server=None, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"API exited with code {server.returncode} before becoming ready")
+        try:
+            with urllib.request.urlopen(f"{base_url}/health/ready", timeout=5) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(1)
+    raise TimeoutError(f"API not ready after {timeout}s")
+
+
+def stop_server(server):
+    try:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(server.pid, signal.SIGKILL)
+
+
+def compare(results, baseline, threshold):
+    """Regressions of more than `threshold` (fraction) against the baseline, as messages."""
+    previous = {level['concurrency']: level for level in baseline['levels']}
+    failures = []
+    for level in results['levels']:
+        base = previous.get(level['concurrency'])
+        if base is None:
+            continue
+        for metric in METRICS:
+            new, old = level.get(metric), base.get(metric)
+            if new is None or not old:
+                continue
+            # Throughput regresses downwards, latency upwards
+            change = (old - new) / old if metric == 'throughput_rps' else (new - old) / old
+            if change > threshold:
+                failures.append(
+                    f"concurrency {level['concurrency']}: {metric} {old} -> {new} ({change:+.0%} worse)"
+                )
+        if level['errors'] > base.get('errors', 0):
+            failures.append(f"concurrency {level['concurrency']}: errors {base.get('errors', 0)} -> {level['errors']}")
+    return failures
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=API_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--requests', type=int, default=100, help='Measured requests per concurrency level')
+    parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests before each level')
+    parser.add_argument('--images', type=int, default=20, help='Distinct synthetic images to cycle through')
+    parser.add_argument('--weights', type=Path, help='Model to serve (default: fixture classifier)')
+    parser.add_argument('--app-server', choices=['flask', 'asgi'], default='flask')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--port', type=int, default=7861)
+    parser.add_argument('--url', help='Benchmark an already running API instead of starting one')
+    parser.add_argument('--with-cache', action='store_true', help='Leave the prediction cache enabled')
+    parser.add_argument('--out', type=Path, default=Path(__file__).resolve().parent / 'results' / 'latest.json')
+    parser.add_argument('--baseline', type=Path, help='Fail if this run regresses against the saved results')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Allowed regression as a fraction')
+    parser.add_argument('--save-baseline', type=Path, help='Also write the results here as the new baseline')
+    args = parser.parse_args(argv)
+
+    print(f"Generating {args.images} synthetic leaf images...")
+    images = make_images(args.images)
+
+    server = None
+    base_url = args.url.rstrip('/') if args.url else f"http://127.0.0.1:{args.port}"
+    weights = args.weights
+    if args.url is None:
+        if weights is None:
+            weights = FIXTURE_PATH if FIXTURE_PATH.exists() else make_fixture()
+        print(f"Starting {args.app_server} API on {base_url} with {weights}...")
+        server = start_server(args.port, weights.resolve(), args.app_server, args.workers, args.with_cache)
+
+    try:
+        wait_ready(base_url, server)
+        levels = []
+        for concurrency in args.concurrency:
+            level = run_level(base_url, images, concurrency, args.requests, args.warmup)
+            levels.append(level)
+            print(f"✓ concurrency {concurrency}: {level['throughput_rps']} req/s, "
+                  f"p50 {level['p50_ms']} ms, p95 {level['p95_ms']} ms, p99 {level['p99_ms']} ms, "
+                  f"{level['errors']} error(s), {level['shed']} shed")
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    cores, usable = available_cpus()
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpus': {'cores': len(cores), 'usable': usable},
+            'app_server': args.app_server,
+            'workers': args.workers,
+            'weights': str(weights) if weights else args.url,
+            'prediction_cache': args.with_cache,
+            'images': [f"{w}x{h} {fmt}" for w, h, fmt, _ in PHONE_IMAGES],
+        },
+        'levels': levels,
+    }
+    for path in filter(None, (args.out, args.save_baseline)):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2))
+        print(f"Results written to {path}")
+
+    if args.baseline:
+        failures = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+        if failures:
+            print(f"❌ Regressed more than {args.threshold:.0%} against {args.baseline}:")
+            for failure in failures:
+                print(f"   {failure}")
+            return 1
+        print(f"✓ Within {args.threshold:.0%} of {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
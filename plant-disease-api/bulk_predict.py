@@ -0,0 +1,325 @@
+"""
+Headless bulk inference over directories and ZIP archives, for field surveys and model audits.
+
+Images are decoded and resized in a pool of worker processes, at most
+--prefetch ahead of the model, and scored in batches in this process. Rows
+(path, top-k classes and confidences, timing) are appended to a CSV file or
+to a directory of Parquet parts as they are produced.
+
+Every --checkpoint-every images the output is flushed and progress is
+recorded next to it, so an interrupted run continues where it stopped:
+
+    python bulk_predict.py survey/ batch2.zip --weights best_model.pt --out survey.csv
+    python bulk_predict.py survey/ batch2.zip --weights best_model.pt --out survey.csv --resume
+"""
+import argparse
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+from PIL import Image
+
+from backends import BACKENDS, load_backend
+from preprocessing import IMAGE_EXTENSIONS, UndecodableImageError, decode_image, letterbox, to_bgr
+
+
+# --- INPUTS ---
+
+def iter_sources(inputs):
+    """Yield (archive or None, path) for every image, in a stable order so runs can resume."""
+    for path in map(Path, inputs):
+        if path.is_dir():
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield None, os.path.join(root, name)
+        elif zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                names = sorted(m.filename for m in archive.infolist()
+                               if not m.is_dir() and m.filename.lower().endswith(IMAGE_EXTENSIONS))
+            for name in names:
+                yield str(path), name
+        elif path.suffix.lower() in IMAGE_EXTENSIONS:
+            yield None, str(path)
+        else:
+            raise ValueError(f"Not a directory, ZIP archive or image: {path}")
+
+
+def display_path(source):
+    archive, name = source
+    return name if archive is None else f"{archive}!{name}"
+
+
+# --- DECODE WORKERS ---
+
+# Each worker process keeps its own handle on every archive it reads from
+_archives = {}
+
+
+def init_worker():
+    # The pool already uses every core; OpenCV's own threads would oversubscribe them
+    cv2.setNumThreads(1)
+
+
+def load_image(source, imgsz, task):
+    """Decode + resize one image; returns (BGR array or None, error or None, seconds)."""
+    started = time.perf_counter()
+    archive, name = source
+    try:
+        if archive is None:
+            fp = name
+        else:
+            if archive not in _archives:
+                _archives[archive] = zipfile.ZipFile(archive)
+            fp = io.BytesIO(_archives[archive].read(name))
+        img = decode_image(fp, imgsz)
+    except (UndecodableImageError, Image.DecompressionBombError, OSError, ValueError, zipfile.BadZipFile) as e:
+        # Recorded as a failed row; the run and its resume state carry on
+        return None, f"{type(e).__name__}: {e}", time.perf_counter() - started
+
+    if task == 'classify':
+        # Ultralytics resizes the short side to imgsz anyway; doing it here keeps
+        # the arrays sent back to the main process small
+        array = to_bgr(img)
+        h, w = array.shape[:2]
+        scale = imgsz / min(h, w)
+        if scale < 1:
+            array = cv2.resize(array, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    else:
+        # letterbox() reuses a per-thread buffer; copy before it leaves the worker
+        array = letterbox(img, imgsz).copy()
+    return array, None, time.perf_counter() - started
+
+
+# --- OUTPUT ---
+
+def result_columns(top_k):
+    columns = ['path']
+    for i in range(1, top_k + 1):
+        columns += [f'top{i}_class', f'top{i}_confidence']
+    return columns + ['decode_ms', 'inference_ms', 'error']
+
+
+def top_classes(result, names, top_k):
+    """[(class name, confidence)] best first: classifier probabilities, or the most confident boxes."""
+    if result.probs is not None:
+        return [(names[i], float(c)) for i, c in zip(result.probs.top5[:top_k], result.probs.top5conf.tolist())]
+    ranked = []
+    for cls, conf in sorted(zip(result.boxes.cls.tolist(), result.boxes.conf.tolist()), key=lambda x: -x[1]):
+        if names[int(cls)] not in (name for name, _ in ranked):
+            ranked.append((names[int(cls)], float(conf)))
+    return ranked[:top_k]
+
+
+class CsvOutput:
+    def __init__(self, path, columns, state=None):
+        self.path = path
+        if state is None:
+            self.file = open(path, 'w', newline='')
+            self.writer = csv.DictWriter(self.file, fieldnames=columns)
+            self.writer.writeheader()
+        else:
+            # Drop rows written after the last checkpoint; they are produced again
+            self.file = open(path, 'r+', newline='')
+            self.file.truncate(state['offset'])
+            self.file.seek(state['offset'])
+            self.writer = csv.DictWriter(self.file, fieldnames=columns)
+
+    def write(self, rows):
+        """Append `rows`; returns the writer state that includes them."""
+        self.writer.writerows(rows)
+        self.file.flush()
+        return {'offset': self.file.tell()}
+
+    def commit(self, state):
+        # Rows past state['offset'] are truncated on resume, so they need not be durable
+        os.fsync(self.file.fileno())
+        return state
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetOutput:
+    """A directory of part files; each commit writes the rows since the last one as a new part."""
+
+    def __init__(self, path, columns, state=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow), or use a .csv --out") from e
+        self.pa, self.pq = pa, pq
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.schema = pa.schema(
+            [(c, pa.float64() if c.endswith(('_confidence', '_ms')) else pa.string()) for c in columns]
+        )
+        self.parts = state['parts'] if state else 0
+        # Parts written after the last checkpoint (or by an earlier run) are stale
+        for part in self.path.glob('part-*.parquet'):
+            if int(part.stem.split('-')[1]) >= self.parts:
+                part.unlink()
+        self.rows = []
+
+    def write(self, rows):
+        """Buffer `rows`; returns the writer state that includes them."""
+        self.rows.extend(rows)
+        return {'parts': self.parts, 'rows': len(self.rows)}
+
+    def commit(self, state):
+        """Write the first state['rows'] buffered rows as a part; later ones are produced again on resume."""
+        rows, self.rows = self.rows[:state['rows']], []
+        if rows:
+            table = self.pa.Table.from_pylist(rows, schema=self.schema)
+            self.pq.write_table(table, self.path / f'part-{self.parts:05d}.parquet')
+            self.parts += 1
+        return {'parts': self.parts, 'rows': 0}
+
+    def close(self):
+        pass
+
+
+def load_checkpoint(path):
+    if path.exists():
+        return json.loads(path.read_text())
+    return None
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(json.dumps(checkpoint))
+    os.replace(tmp_path, path)
+
+
+# --- MAIN ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help='Image directories, ZIP archives or single images')
+    parser.add_argument('--weights', default='best_model.pt')
+    parser.add_argument('--backend', choices=BACKENDS, default='pytorch')
+    parser.add_argument('--int8', action='store_true')
+    parser.add_argument('--imgsz', type=int, default=512)
+    parser.add_argument('--task', choices=['classify', 'detect'], default='classify')
+    parser.add_argument('--top-k', type=int, default=3, help='Classes per image in the output (at most 5)')
+    parser.add_argument('--conf', type=float, default=0.25, help='Box confidence threshold (detect only)')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help='Decode processes')
+    parser.add_argument('--prefetch', type=int, help='Images decoded ahead of the model (default 4 batches)')
+    parser.add_argument('--out', type=Path, default=Path('predictions.csv'),
+                        help='.csv file, or .parquet for a directory of Parquet parts')
+    parser.add_argument('--checkpoint-every', type=int, default=1000)
+    parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint next to --out')
+    args = parser.parse_args(argv)
+
+    prefetch = args.prefetch or 4 * args.batch_size
+    columns = result_columns(args.top_k)
+    output_class = ParquetOutput if args.out.suffix == '.parquet' else CsvOutput
+
+    checkpoint_path = args.out.with_name(args.out.name + '.checkpoint.json')
+    fingerprint = hashlib.sha1(json.dumps([
+        [str(Path(p).resolve()) for p in args.inputs], str(Path(args.weights).resolve()),
+        args.backend, args.int8, args.imgsz, args.task, args.top_k, args.conf,
+    ]).encode()).hexdigest()
+
+    checkpoint = load_checkpoint(checkpoint_path) if args.resume else None
+    if checkpoint is not None and checkpoint['fingerprint'] != fingerprint:
+        print(f"❌ {checkpoint_path} was written for different inputs or model settings; "
+              f"rerun without --resume to start over")
+        return 2
+    done = checkpoint['done'] if checkpoint else 0
+    if done:
+        print(f"Resuming after {done} images")
+
+    backend = load_backend(args.weights, args.backend, int8=args.int8, imgsz=args.imgsz, task=args.task)
+    names = backend.names
+    print(f"Model: {backend.describe()}")
+
+    output = output_class(args.out, columns, checkpoint['writer'] if checkpoint else None)
+    # Images done and the writer state holding their rows, always replaced together
+    position = {'done': done, 'writer': output.write([])}
+    started = time.perf_counter()
+    processed = errors = 0
+    last_checkpoint = done
+
+    def run_batch(batch):
+        """Score one batch and append its rows; returns how many images it held."""
+        nonlocal errors, position
+        decoded = [i for i, (_, array, _, _) in enumerate(batch) if array is not None]
+        predictions = {}
+        inference_ms = None
+        if decoded:
+            infer_started = time.perf_counter()
+            results = backend.predict([batch[i][1] for i in decoded], conf=args.conf, verbose=False)
+            inference_ms = round((time.perf_counter() - infer_started) * 1000 / len(decoded), 2)
+            predictions = {i: top_classes(r, names, args.top_k) for i, r in zip(decoded, results)}
+
+        rows = []
+        for i, (source, array, error, decode_seconds) in enumerate(batch):
+            row = {'path': display_path(source), 'decode_ms': round(decode_seconds * 1000, 2),
+                   'inference_ms': inference_ms if array is not None else None, 'error': error}
+            for rank, (name, confidence) in enumerate(predictions.get(i, []), 1):
+                row[f'top{rank}_class'] = name
+                row[f'top{rank}_confidence'] = round(confidence, 5)
+            errors += error is not None
+            rows.append(row)
+        # One assignment: an interrupt leaves the rows and their count recorded together or not at all,
+        # and rows written past the recorded writer state are dropped on resume
+        position = {'done': position['done'] + len(batch), 'writer': output.write(rows)}
+        return len(batch)
+
+    def checkpoint_now():
+        nonlocal position
+        position = {'done': position['done'], 'writer': output.commit(position['writer'])}
+        save_checkpoint(checkpoint_path, {'fingerprint': fingerprint, **position})
+
+    sources = itertools.islice(iter_sources(args.inputs), done, None)
+    pending = deque()
+    batch = []
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as pool:
+            for source in itertools.chain(sources, [None]):
+                if source is not None:
+                    pending.append((source, pool.submit(load_image, source, args.imgsz, args.task)))
+                # Bounded prefetch: decoding never runs more than `prefetch` images ahead;
+                # the trailing None drains what's left
+                while pending and (len(pending) >= prefetch or source is None):
+                    queued, future = pending.popleft()
+                    batch.append((queued, *future.result()))
+                    if len(batch) < args.batch_size and pending:
+                        continue
+                    count = run_batch(batch)
+                    batch = []
+                    done = position['done']
+                    processed += count
+                    if done - last_checkpoint >= args.checkpoint_every:
+                        checkpoint_now()
+                        last_checkpoint = done
+                        elapsed = time.perf_counter() - started
+                        print(f"  {done} images ({processed / elapsed:.1f} img/s, {errors} error(s))")
+    finally:
+        # Finished or interrupted: record every completed batch so --resume skips it
+        checkpoint_now()
+        output.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"✓ {processed} images in {elapsed:.1f}s ({processed / max(elapsed, 1e-6):.1f} img/s), "
+          f"{errors} error(s) -> {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
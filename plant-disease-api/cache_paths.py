@@ -0,0 +1,17 @@
+import os
+from pathlib import Path
+
+DATA_DIR = Path("/data")
+FALLBACK_DIR = Path("/tmp/ultralytics-cache")
+
+
+def default_cache_dir():
+    """The API's cache directory: the persistent /data volume when writable, else a temp directory.
+
+    Shared by the API and the CLIs, so models registered and caches warmed
+    from the command line land where the API reads them.
+    """
+    if DATA_DIR.exists() and os.access(DATA_DIR, os.W_OK):
+        return DATA_DIR
+    FALLBACK_DIR.mkdir(parents=True, exist_ok=True)
+    return FALLBACK_DIR
@@ -0,0 +1,42 @@
+import os
+from pathlib import Path
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+
+def cgroup_cpu_limit():
+    """CPU quota of the container in cores, or None when it is unlimited."""
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    try:
+        quota, period = (CGROUP_ROOT / "cpu.max").read_text().split()
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+
+    # cgroup v1: quota of -1 means unlimited
+    try:
+        quota = int((CGROUP_ROOT / "cpu" / "cpu.cfs_quota_us").read_text())
+        period = int((CGROUP_ROOT / "cpu" / "cpu.cfs_period_us").read_text())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus():
+    """Return (cores we may run on, how many of them the quota lets us use)."""
+    cores = sorted(os.sched_getaffinity(0))
+    limit = cgroup_cpu_limit()
+    if limit is None:
+        return cores, len(cores)
+    return cores, max(1, min(len(cores), int(limit)))
+
+
+def partition_cores(index, workers, cores, usable):
+    """Cores for worker `index` when `usable` cores are split evenly across `workers`."""
+    per_worker = max(1, usable // max(1, workers))
+    start = (index * per_worker) % len(cores)
+    return [cores[(start + i) % len(cores)] for i in range(per_worker)]
@@ -0,0 +1,200 @@
+"""
+Export best_model.pt to ONNX / OpenVINO IR for faster CPU serving.
+
+Optionally applies post-training INT8 quantization calibrated on a sample of
+the yolo_dataset val split, then checks the exported model against the
+PyTorch one on the test split before it is adopted.
+
+Example:
+    python export_model.py --weights best_model.pt --formats onnx openvino \
+        --int8 --data /teamspace/studios/this_studio/yolo_dataset
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+from PIL import Image
+from ultralytics import YOLO
+from ultralytics.data.augment import LetterBox, classify_transforms
+
+from backends import artifact_path, load_backend
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def list_images(folder):
+    return sorted(p for p in Path(folder).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def split_images(data, split):
+    """Resolve the images of `split` from a YOLO data.yaml or a classification dataset folder"""
+    if Path(data).is_dir():
+        # ImageFolder layout: {split}/{class}/img.jpg
+        return list_images(Path(data) / split)
+    with open(data) as f:
+        config = yaml.safe_load(f)
+    root = Path(config.get('path', Path(data).parent))
+    return list_images(root / config[split])
+
+
+def sample_images(images, samples, seed=42):
+    images = list(images)
+    if samples and len(images) > samples:
+        images = random.Random(seed).sample(images, samples)
+    return images
+
+
+def preprocess(image_path, imgsz, task='detect'):
+    """Preprocess an image exactly like Ultralytics does before inference for `task`"""
+    img = cv2.imread(str(image_path))
+    if task == 'classify':
+        # ClassificationPredictor: resize the short side + center crop, no letterbox
+        rgb = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        return classify_transforms(imgsz)(rgb).numpy()[None].astype(np.float32)
+    img = LetterBox((imgsz, imgsz), auto=False)(image=img)
+    img = img[..., ::-1].transpose(2, 0, 1)  # BGR HWC -> RGB CHW
+    return np.ascontiguousarray(img, dtype=np.float32)[None] / 255.0
+
+
+class ValCalibrationReader:
+    """Feeds sampled val images to onnxruntime's static quantizer"""
+
+    def __init__(self, onnx_path, images, imgsz, task):
+        import onnxruntime as ort
+        session = ort.InferenceSession(str(onnx_path), providers=['CPUExecutionProvider'])
+        self.input_name = session.get_inputs()[0].name
+        self.images = iter(images)
+        self.imgsz = imgsz
+        self.task = task
+
+    def get_next(self):
+        image = next(self.images, None)
+        if image is None:
+            return None
+        return {self.input_name: preprocess(image, self.imgsz, self.task)}
+
+
+def export_onnx(model, weights, imgsz, int8, calib_images):
+    fp32_path = Path(model.export(format='onnx', imgsz=imgsz, dynamic=False, simplify=True))
+    print(f"✓ ONNX export: {fp32_path}")
+    if not int8:
+        return fp32_path
+
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    int8_path = artifact_path(weights, 'onnx', int8=True)
+    print(f"Calibrating ONNX INT8 on {len(calib_images)} val images...")
+    quantize_static(
+        str(fp32_path),
+        str(int8_path),
+        # Calibrate on the input distribution the model is served with
+        ValCalibrationReader(fp32_path, calib_images, imgsz, model.task),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    print(f"✓ ONNX INT8 export: {int8_path}")
+    return int8_path
+
+
+def export_openvino(model, imgsz, int8, data_yaml, calib_fraction):
+    kwargs = {'format': 'openvino', 'imgsz': imgsz, 'dynamic': False}
+    if int8:
+        # Ultralytics runs NNCF calibration on the val split of data.yaml
+        kwargs.update(int8=True, data=data_yaml, fraction=calib_fraction)
+    path = Path(model.export(**kwargs))
+    print(f"✓ OpenVINO{' INT8' if int8 else ''} export: {path}")
+    return path
+
+
+def top1(result):
+    if result.probs is not None:
+        return int(result.probs.top1), float(result.probs.top1conf)
+    if len(result.boxes) == 0:
+        return None, 0.0
+    box = result.boxes[0]
+    return int(box.cls), float(box.conf)
+
+
+def parity_check(weights, backend, int8, images, imgsz):
+    """Compare top-1 class and confidence of an exported backend against PyTorch"""
+    reference = load_backend(weights, 'pytorch')
+    candidate = load_backend(weights, backend, int8=int8, imgsz=imgsz, task=reference.task)
+
+    agree = 0
+    conf_deltas = []
+    for image in images:
+        ref_cls, ref_conf = top1(reference.predict(str(image), conf=0.25, imgsz=imgsz, verbose=False)[0])
+        cand_cls, cand_conf = top1(candidate.predict(str(image), conf=0.25, verbose=False)[0])
+        if ref_cls == cand_cls:
+            agree += 1
+            conf_deltas.append(abs(ref_conf - cand_conf))
+
+    agreement = agree / len(images) if images else 0.0
+    mean_delta = float(np.mean(conf_deltas)) if conf_deltas else 0.0
+    max_delta = float(np.max(conf_deltas)) if conf_deltas else 0.0
+    label = f"{backend}{' INT8' if int8 else ''}"
+    print(f"  {label}: top-1 agreement {agreement*100:.2f}% "
+          f"({agree}/{len(images)}), mean |Δconf| {mean_delta:.4f}, max |Δconf| {max_delta:.4f}")
+    return agreement, mean_delta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weights', default='best_model.pt')
+    parser.add_argument('--formats', nargs='+', default=['onnx', 'openvino'], choices=['onnx', 'openvino'])
+    parser.add_argument('--imgsz', type=int, default=512, help='Must match the training imgsz')
+    parser.add_argument('--int8', action='store_true', help='Post-training INT8 quantization')
+    parser.add_argument('--data', help='YOLO data.yaml or classification dataset folder; '
+                                       'val split is used for INT8 calibration, test split for parity')
+    parser.add_argument('--calib-samples', type=int, default=300)
+    parser.add_argument('--parity-samples', type=int, default=500, help='0 = whole test split')
+    parser.add_argument('--min-agreement', type=float, default=0.99)
+    parser.add_argument('--max-conf-delta', type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    if args.int8 and not args.data:
+        parser.error('--int8 needs --data for calibration images')
+
+    model = YOLO(args.weights)
+    calib_images = []
+    calib_fraction = 1.0
+    if args.int8:
+        val_images = split_images(args.data, 'val')
+        calib_images = sample_images(val_images, args.calib_samples)
+        calib_fraction = min(1.0, args.calib_samples / max(1, len(val_images)))
+
+    exported = []
+    for fmt in args.formats:
+        if fmt == 'onnx':
+            export_onnx(model, args.weights, args.imgsz, args.int8, calib_images)
+        else:
+            export_openvino(model, args.imgsz, args.int8, args.data, calib_fraction)
+        exported.append(fmt)
+
+    if not args.data:
+        print("⚠️  No --data given, skipping parity check")
+        return 0
+
+    test_images = sample_images(split_images(args.data, 'test'), args.parity_samples)
+    print(f"\nParity check vs PyTorch on {len(test_images)} test images:")
+    failed = False
+    for fmt in exported:
+        agreement, mean_delta = parity_check(args.weights, fmt, args.int8, test_images, args.imgsz)
+        if agreement < args.min_agreement or mean_delta > args.max_conf_delta:
+            print(f"❌ {fmt} failed parity (need ≥{args.min_agreement*100:.1f}% agreement, "
+                  f"≤{args.max_conf_delta} mean |Δconf|)")
+            failed = True
+        else:
+            print(f"✓ {fmt} passed parity")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Gunicorn settings shared by the Flask and ASGI servers (see start.sh).
+
+The model is loaded once in the master before fork (preload_app), so workers
+share the weights copy-on-write instead of each holding their own copy. Each
+worker then gets an even share of the container's CPU quota as torch (or
+ONNX Runtime / OpenVINO) intra-op threads, optionally pinned to its own cores.
+"""
+import gc
+import os
+from cpu_partition import available_cpus, partition_cores
+
+# --- WORKER CONFIGURATION ---
+# WORKERS=auto sizes the pool from the cgroup CPU quota, THREADS_PER_WORKER cores each.
+# CPU_AFFINITY=1 pins every worker to its own slice of cores.
+THREADS_PER_WORKER = int(os.environ.get('THREADS_PER_WORKER', 4))
+CPU_AFFINITY = os.environ.get('CPU_AFFINITY', '0') == '1'
+
+cores, usable_cpus = available_cpus()
+if os.environ.get('WORKERS', 'auto') == 'auto':
+    workers = max(1, usable_cpus // THREADS_PER_WORKER)
+else:
+    workers = int(os.environ['WORKERS'])
+# --- END CONFIGURATION ---
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 7860)}"
+# Threads let concurrent requests share one micro-batched forward pass (gthread only).
+# There must be more than ADMISSION_MAX_ACTIVE + ADMISSION_MAX_QUEUE of them, so
+# requests beyond the admission queue reach the app and get an immediate 503
+# instead of waiting unseen in gunicorn's backlog.
+threads = int(os.environ.get('REQUEST_THREADS', 32))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+# ONNX Runtime / OpenVINO start their thread pools when the session is created,
+# and those threads do not survive fork, so only PyTorch weights are preloaded.
+preload_app = (
+    os.environ.get('PRELOAD_MODEL', '1') == '1'
+    and os.environ.get('MODEL_BACKEND', 'pytorch') == 'pytorch'
+)
+if preload_app:
+    # Tells inference.py to load synchronously in the master and leave warm-up to workers
+    os.environ['MODEL_PRELOAD'] = '1'
+
+
+# CPU slots held by live workers. pre_fork and child_exit both run in the
+# master, so a restarted worker takes over the cores of the one that exited
+# instead of doubling up on a live worker's.
+taken_slots = set()
+
+
+def pre_fork(server, worker):
+    worker.cpu_slot = min(set(range(len(taken_slots) + 1)) - taken_slots)
+    taken_slots.add(worker.cpu_slot)
+
+
+def when_ready(server):
+    server.log.info(
+        f"{workers} worker(s) over {usable_cpus} usable CPU(s), "
+        f"preload={'on' if preload_app else 'off'}, affinity={'on' if CPU_AFFINITY else 'off'}"
+    )
+    if preload_app:
+        # Move everything allocated while loading the model out of the GC's
+        # reach, so collections in workers don't dirty the shared pages.
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    import torch
+
+    worker_cores = partition_cores(worker.cpu_slot % workers, workers, cores, usable_cpus)
+    torch.set_num_threads(len(worker_cores))
+    # Read by inference.py for the ONNX Runtime / OpenVINO thread pools, which load after fork
+    os.environ['MODEL_THREADS'] = str(len(worker_cores))
+    if CPU_AFFINITY:
+        os.sched_setaffinity(0, worker_cores)
+    server.log.info(
+        f"Worker {worker.pid} (slot {worker.cpu_slot}): {len(worker_cores)} intra-op thread(s) on cores {worker_cores}"
+    )
+
+    if preload_app:
+        # Warm-up runs torch ops, which must happen after fork, in each worker
+        import inference
+        inference.loader.start()
+        inference.watcher.start()
+
+
+def child_exit(server, worker):
+    taken_slots.discard(getattr(worker, 'cpu_slot', None))
+    import metrics
+    metrics.mark_process_dead(worker.pid)
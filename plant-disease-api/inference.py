@@ -0,0 +1,651 @@
+"""
+Shared inference core for the Flask (model_api.py) and ASGI (asgi_app.py) servers.
+
+Holds the cache directory setup, the served model versions (each with its
+micro-batcher and prediction cache) and the request pipeline, so both servers
+keep identical /predict behaviour.
+"""
+import hmac
+import math
+import os
+import io
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import numpy as np
+from admission import AdmissionController, DeadlineExceeded, UploadGate
+from batching import MicroBatcher
+from cache_paths import DATA_DIR, default_cache_dir
+from backends import load_backend
+from model_loader import ModelLoader
+from model_registry import ModelRegistry, ModelRouter, RegistryWatcher, ServedModel
+from leaf_gate import ImageRejected, LeafGate
+from knowledge_base import KnowledgeBase, format_recommendation
+from prediction_cache import PredictionCache, file_content_key, perceptual_hash
+from recommendation_cache import RecommendationCache
+from preprocessing import (
+    IMAGE_EXTENSIONS, UndecodableImageError, accepted_formats, decode_image, letterbox, to_bgr
+)
+from tiling import aggregate, fit_for_tiling, max_long_side, tile_grid
+import metrics
+
+# --- SAFE CACHE DIRECTORY CONFIGURATION ---
+cache_dir = default_cache_dir()
+if cache_dir != DATA_DIR:
+    print(f"⚠️  {DATA_DIR} not writable, using {cache_dir} instead")
+
+print(f"Using cache directory: {cache_dir}")
+
+# Set environment variables
+os.environ['YOLO_CONFIG_DIR'] = str(cache_dir)
+os.environ['HF_HOME'] = str(cache_dir)
+os.environ['HUGGINGFACE_HUB_CACHE'] = str(cache_dir / "hub")
+# --- END CONFIGURATION ---
+
+# --- INFERENCE BACKEND CONFIGURATION ---
+# MODEL_BACKEND selects pytorch (default), onnx or openvino; see export_model.py
+MODEL_WEIGHTS = os.environ.get('MODEL_WEIGHTS', 'best_model.pt')
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'pytorch')
+MODEL_INT8 = os.environ.get('MODEL_INT8', '0') == '1'
+# Exported models are served at MODEL_IMGSZ; .pt checkpoints use their recorded training imgsz
+MODEL_IMGSZ = int(os.environ.get('MODEL_IMGSZ', 512))
+# Exported models don't record their task: 'classify' for YOLOv8-cls, 'detect' for the box model
+MODEL_TASK = os.environ.get('MODEL_TASK', 'detect')
+# Intra-op threads for ONNX Runtime / OpenVINO; gunicorn.conf.py sets it to each worker's share of the CPUs
+MODEL_THREADS = int(os.environ['MODEL_THREADS']) if os.environ.get('MODEL_THREADS') else None
+# Classification responses include this many ranked classes (at most 5) in `top_k`
+TOP_K = int(os.environ.get('TOP_K', 3))
+
+# Exports made on first start (when none ship with the image) are kept here for restarts
+EXPORT_DIR = cache_dir / "exports"
+# --- END CONFIGURATION ---
+
+# --- MICRO-BATCHING CONFIGURATION ---
+# Concurrent /predict calls are coalesced into one batched forward pass.
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 10))
+# --- END CONFIGURATION ---
+
+# --- ADMISSION CONTROL CONFIGURATION ---
+# Per worker, ADMISSION_MAX_ACTIVE uploads decode + infer at once and up to
+# ADMISSION_MAX_QUEUE more wait for a slot. Anything beyond that gets 503 +
+# Retry-After once its upload is read; a request still waiting after
+# ADMISSION_MAX_WAIT_S, or past its deadline, is dropped the same way.
+# Uploads still being received count against UPLOADS_MAX_INFLIGHT instead.
+ADMISSION_MAX_ACTIVE = int(os.environ.get('ADMISSION_MAX_ACTIVE', BATCH_MAX_SIZE))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 2 * BATCH_MAX_SIZE))
+ADMISSION_MAX_WAIT_S = float(os.environ.get('ADMISSION_MAX_WAIT_S', 5))
+UPLOADS_MAX_INFLIGHT = int(os.environ.get(
+    'UPLOADS_MAX_INFLIGHT', 4 * (ADMISSION_MAX_ACTIVE + ADMISSION_MAX_QUEUE)))
+# Deadline for /predict and /diagnose; clients can ask for a shorter one with X-Client-Timeout (seconds)
+REQUEST_DEADLINE_S = float(os.environ.get('REQUEST_DEADLINE_S', 30))
+
+# Uploads larger than this are refused (413) from their Content-Length, before the body is read
+MAX_UPLOAD_BYTES = int(float(os.environ.get('MAX_UPLOAD_MB', 15)) * 1024 * 1024)
+MAX_BATCH_UPLOAD_BYTES = int(float(os.environ.get('MAX_BATCH_UPLOAD_MB', 200)) * 1024 * 1024)
+UPLOAD_LIMITS = {
+    '/predict': MAX_UPLOAD_BYTES,
+    '/predict/tiled': MAX_UPLOAD_BYTES,
+    '/diagnose': MAX_UPLOAD_BYTES,
+    '/predict/batch': MAX_BATCH_UPLOAD_BYTES,
+}
+
+admission = AdmissionController(ADMISSION_MAX_ACTIVE, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT_S)
+uploads = UploadGate(UPLOADS_MAX_INFLIGHT)
+# --- END CONFIGURATION ---
+
+# --- KNOWLEDGE BASE CONFIGURATION ---
+# /diagnose answers known classes from the fertilizer RAG records in-process.
+# KB_PATH overrides the default lookup (next to this file, then the repo root).
+try:
+    knowledge_base = KnowledgeBase.load(os.environ.get('KB_PATH'))
+    print(f"Loaded {len(knowledge_base.records)} knowledge-base records")
+except FileNotFoundError as e:
+    knowledge_base = None
+    print(f"⚠️  {e}; /diagnose will return predictions without recommendations")
+# --- END CONFIGURATION ---
+
+# --- PREDICTION CACHE CONFIGURATION ---
+# Retried uploads and re-encodes of the same leaf are answered without inference.
+# Each served model version has its own cache (see serve()).
+PRED_CACHE_SIZE = int(os.environ.get('PRED_CACHE_SIZE', 2048))
+PRED_CACHE_TTL = float(os.environ.get('PRED_CACHE_TTL', 86400))
+PRED_CACHE_MAX_DISTANCE = int(os.environ.get('PRED_CACHE_MAX_DISTANCE', 4))
+PRED_CACHE_PERSIST = os.environ.get('PRED_CACHE_PERSIST', '0') == '1'
+# --- END CONFIGURATION ---
+
+# --- MODEL REGISTRY CONFIGURATION ---
+# Versions registered with model_registry.py live in cache_dir/models; once
+# models/active.json exists it replaces MODEL_WEIGHTS. Each worker checks it
+# every REGISTRY_POLL_S, loads and warms up new versions in the background and
+# swaps them in while in-flight requests finish on the old one. ADMIN_TOKEN
+# (sent as "Authorization: Bearer <token>") enables the /admin/models endpoints.
+REGISTRY_POLL_S = float(os.environ.get('REGISTRY_POLL_S', 5))
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+registry = ModelRegistry(cache_dir / "models")
+router = ModelRouter()
+# --- END CONFIGURATION ---
+
+# --- MODEL LOADING & WARM-UP CONFIGURATION ---
+# The model loads on a background thread and runs WARMUP_RUNS throwaway inferences
+# at the serving resolution, so the first real request doesn't pay predictor setup.
+# /health/ready stays 503 until this finishes.
+WARMUP_RUNS = int(os.environ.get('WARMUP_RUNS', 2))
+
+def open_backend(weights, imgsz, task, export_dir):
+    backend = load_backend(
+        weights, MODEL_BACKEND, int8=MODEL_INT8, imgsz=imgsz, task=task, export_dir=export_dir,
+        num_threads=MODEL_THREADS
+    )
+    metrics.MODEL_BACKEND.labels(backend.name, str(backend.int8), str(backend.imgsz)).set(1)
+    if knowledge_base is not None:
+        unmatched = knowledge_base.index_classes(backend.names)
+        if unmatched:
+            print(f"⚠️  No knowledge-base record for: {', '.join(unmatched)}")
+    return backend
+
+def open_version(version):
+    meta = registry.meta(version)
+    backend = open_backend(registry.weights(version), meta['imgsz'], meta['task'], registry.path(version) / "exports")
+    if [backend.names[i] for i in sorted(backend.names)] != registry.class_names(version):
+        print(f"⚠️  {version}: model class names differ from its class_names.json")
+    return backend
+
+def serve(version, backend):
+    """Wrap a loaded backend with its own micro-batcher and prediction cache."""
+    def run_batch(images):
+        metrics.BATCH_SIZE.observe(len(images))
+        metrics.QUEUE_DEPTH.set(router.pending())
+        return backend.predict(images, conf=0.25, verbose=False)
+
+    cache = PredictionCache(
+        namespace=f"{version}:{backend.name}:{int(backend.int8)}",
+        max_entries=PRED_CACHE_SIZE,
+        ttl=PRED_CACHE_TTL,
+        max_distance=PRED_CACHE_MAX_DISTANCE,
+        persist_path=cache_dir / "prediction-cache.sqlite" if PRED_CACHE_PERSIST else None,
+    )
+    batcher = MicroBatcher(run_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+    return ServedModel(version, backend, batcher, cache)
+
+def load_model():
+    state = registry.read_state()
+    if state is not None:
+        version = state['version']
+        backend = open_version(version)
+    else:
+        version = MODEL_WEIGHTS
+        backend = open_backend(MODEL_WEIGHTS, MODEL_IMGSZ, MODEL_TASK, EXPORT_DIR)
+    print(f"Serving {version} with backend: {backend.describe()}")
+    router.install(serve(version, backend))
+    return backend
+
+def load_version(version):
+    """Load and warm up a registered version for a hot swap; runs on the watcher thread."""
+    backend = open_version(version)
+    for _ in range(WARMUP_RUNS):
+        warm_up(backend)
+    print(f"✓ Loaded model {version}: {backend.describe()}")
+    return serve(version, backend)
+
+def warm_up(backend):
+    dummy = np.full((backend.imgsz, backend.imgsz, 3), 114, dtype=np.uint8)
+    backend.predict([dummy], conf=0.25, verbose=False)
+
+loader = ModelLoader(load_model, warm_up, warmup_runs=WARMUP_RUNS)
+watcher = RegistryWatcher(registry, router, load_version, poll_seconds=REGISTRY_POLL_S)
+
+if os.environ.get('MODEL_PRELOAD') == '1':
+    # gunicorn master (preload_app): load now so workers share the weights;
+    # each worker warms up after fork (see post_fork in gunicorn.conf.py)
+    loader.load()
+else:
+    loader.start()
+    watcher.start()
+# --- END CONFIGURATION ---
+
+# --- RECOMMENDATION CACHE CONFIGURATION ---
+# /recommend proxies the LLM recommendation space and caches its answers by
+# (crop, disease, knowledge-base hash, PROMPT_VERSION); see recommendation_cache.py
+# for the settings and the pre-warm command.
+recommendation_cache = RecommendationCache.from_env(cache_dir / "recommendation-cache.sqlite")
+# --- END CONFIGURATION ---
+
+# --- LEAF GATE CONFIGURATION ---
+# Rejects non-leaf, blurred and badly exposed photos before they reach the model.
+# GATE_MIN_GREEN_PCT uses the same green-pixel rule as the app's LeafDetectorService.
+LEAF_GATE_ENABLED = os.environ.get('LEAF_GATE', '1') == '1'
+
+leaf_gate = LeafGate(
+    min_green_pct=float(os.environ.get('GATE_MIN_GREEN_PCT', 15)),
+    min_blur=float(os.environ.get('GATE_MIN_BLUR', 20)),
+    min_brightness=float(os.environ.get('GATE_MIN_BRIGHTNESS', 25)),
+    max_brightness=float(os.environ.get('GATE_MAX_BRIGHTNESS', 235)),
+)
+if LEAF_GATE_ENABLED:
+    for name, value in leaf_gate.thresholds().items():
+        metrics.GATE_THRESHOLD.labels(name).set(value)
+# --- END CONFIGURATION ---
+
+# --- TILED PREDICTION CONFIGURATION ---
+# /predict/tiled is for whole-plant and crop-row photos: overlapping tiles at
+# the model's native imgsz, tiles failing the leaf gate skipped, the rest
+# scored together in one batched forward pass. The photo is downscaled so its
+# long side spans at most TILE_MAX_ACROSS tiles (4 -> 12 tiles for a 4:3 shot).
+TILE_OVERLAP = float(os.environ.get('TILE_OVERLAP', 0.25))
+TILE_MAX_ACROSS = int(os.environ.get('TILE_MAX_ACROSS', 4))
+# A disease only sets the overall diagnosis if some tile shows it with this confidence
+TILE_MIN_CONFIDENCE = float(os.environ.get('TILE_MIN_CONFIDENCE', 0.5))
+# --- END CONFIGURATION ---
+
+# --- BULK PREDICTION CONFIGURATION ---
+# /predict/batch decodes this many images in parallel; each one then joins the
+# micro-batcher, so inference runs in batches of BATCH_MAX_SIZE.
+BULK_DECODE_THREADS = int(os.environ.get('BULK_DECODE_THREADS', max(BATCH_MAX_SIZE, 2)))
+# Batch images take admission slots like /predict, but never more than
+# BULK_MAX_ACTIVE at once across all batch requests, so a survey upload can't
+# starve /predict. They wait for a slot instead of being shed.
+BULK_MAX_ACTIVE = int(os.environ.get('BULK_MAX_ACTIVE', max(1, ADMISSION_MAX_ACTIVE // 2)))
+
+bulk_lane = threading.BoundedSemaphore(BULK_MAX_ACTIVE)
+bulk_pool = ThreadPoolExecutor(max_workers=BULK_DECODE_THREADS, thread_name_prefix="bulk-decode")
+# --- END CONFIGURATION ---
+
+def format_prediction(result, names):
+    if result.probs is not None:
+        # Classifier: always a class, plus the runners-up for the app to show
+        top_indices = result.probs.top5[:TOP_K]
+        top_confidences = result.probs.top5conf.tolist()[:TOP_K]
+        disease_name = names[top_indices[0]]
+        return {
+            'disease_name': disease_name,
+            'confidence': float(top_confidences[0]),
+            'is_healthy': 'healthy' in disease_name.lower(),
+            'top_k': [
+                {'disease_name': names[i], 'confidence': float(c)}
+                for i, c in zip(top_indices, top_confidences)
+            ]
+        }
+
+    if len(result.boxes) == 0:
+        return {
+            'disease_name': 'No Detection',
+            'confidence': 0.0,
+            'is_healthy': False
+        }
+
+    top_prediction = result.boxes[0]
+    disease_class = int(top_prediction.cls)
+    disease_name = names[disease_class]
+    confidence = float(top_prediction.conf)
+    is_healthy = 'healthy' in disease_name.lower()
+
+    return {
+        'disease_name': disease_name,
+        'confidence': confidence,
+        'is_healthy': is_healthy
+    }
+
+def request_deadline(client_timeout=None):
+    """time.monotonic() deadline for a request arriving now; `client_timeout` can only shorten it."""
+    timeout = REQUEST_DEADLINE_S
+    try:
+        timeout = min(timeout, float(client_timeout))
+    except (TypeError, ValueError):
+        pass
+    return time.monotonic() + max(0.0, timeout)
+
+def run_admitted(run, upload, deadline):
+    """`run(upload, deadline)` in an admission slot; raises Overloaded when the request is shed.
+
+    Call while holding an `admission.ticket()`.
+    """
+    started = time.perf_counter()
+    with admission.slot(deadline):
+        metrics.STAGE_LATENCY.labels('admission_wait').observe(time.perf_counter() - started)
+        return run(upload, deadline)
+
+def predict_upload(upload, deadline=None):
+    """Run the full prediction pipeline on an uploaded image file.
+
+    `upload` is a seekable binary file, e.g. the request's spooled upload; it
+    is hashed and decoded in place, never copied into one bytes buffer.
+    Only call once `loader.ready`. Raises UndecodableImageError if it is not
+    an image, ImageRejected if it fails the leaf gate and DeadlineExceeded if
+    `deadline` passes before its batch runs.
+
+    The request runs start to finish on one model version (named in
+    `model_version`), even if a swap happens meanwhile.
+    """
+    with router.use() as served:
+        started = time.perf_counter()
+        prediction = _predict_served(served, upload, deadline)
+        metrics.MODEL_LATENCY.labels(served.version).observe(time.perf_counter() - started)
+        return prediction
+
+def _predict_served(served, upload, deadline):
+    stage = metrics.STAGE_LATENCY
+    backend = served.backend
+    prediction_cache = served.cache
+
+    # Exact re-upload: skip decode and inference entirely
+    started = time.perf_counter()
+    key = file_content_key(upload)
+    cached = prediction_cache.get_exact(key)
+    lookup_seconds = time.perf_counter() - started
+    if cached is not None:
+        stage.labels('cache_lookup').observe(lookup_seconds)
+        metrics.CACHE_LOOKUPS.labels('exact_hit').inc()
+        return cached
+
+    # Decode + letterbox on the calling thread so the batch thread only runs the model
+    with stage.labels('decode').time():
+        try:
+            img = decode_image(upload, backend.imgsz)
+        except UndecodableImageError:
+            metrics.ERRORS.labels('undecodable_image').inc()
+            raise
+
+    # Non-leaf / unusable shot: answer without spending a forward pass
+    if LEAF_GATE_ENABLED:
+        with stage.labels('gate').time():
+            try:
+                leaf_gate.check(img)
+            except ImageRejected as e:
+                metrics.GATE_REJECTIONS.labels(e.reason).inc()
+                raise
+
+    # Re-encode or near-identical reshoot: skip inference
+    started = time.perf_counter()
+    phash = perceptual_hash(img)
+    cached = prediction_cache.get_near(key, phash)
+    stage.labels('cache_lookup').observe(lookup_seconds + time.perf_counter() - started)
+    if cached is not None:
+        metrics.CACHE_LOOKUPS.labels('near_hit').inc()
+        return cached
+    metrics.CACHE_LOOKUPS.labels('miss').inc()
+
+    with stage.labels('preprocess').time():
+        if backend.task == 'classify':
+            batch_input = to_bgr(img)
+        else:
+            batch_input = letterbox(img, backend.imgsz)
+    with stage.labels('inference').time():
+        try:
+            result = served.batcher.predict(batch_input, deadline=deadline)
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            metrics.ERRORS.labels('inference_error').inc()
+            raise
+    with stage.labels('postprocess').time():
+        prediction = format_prediction(result, backend.names)
+    prediction['model_version'] = served.version
+    metrics.MODEL_CONFIDENCE.labels(served.version).observe(prediction['confidence'])
+
+    prediction_cache.put(key, phash, prediction)
+    return prediction
+
+def predict_tiled(upload, deadline=None):
+    """Tiled prediction of a wide field photo: per-tile results, per-class severity and a diagnosis.
+
+    Tiles are cropped at the model's native scale; those failing the leaf
+    gate are reported as skipped without inference, and the rest go to the
+    micro-batcher as one group so they share a forward pass. Tile boxes are
+    (left, top, right, bottom) fractions of the photo. Raises ImageRejected
+    when no tile passes the gate; otherwise like predict_upload(), minus the
+    prediction cache.
+    """
+    stage = metrics.STAGE_LATENCY
+    with router.use() as served:
+        started = time.perf_counter()
+        backend = served.backend
+        tile = backend.imgsz
+
+        with stage.labels('decode').time():
+            try:
+                img = decode_image(upload, max_long_side(tile, TILE_OVERLAP, TILE_MAX_ACROSS), long_side=True)
+            except UndecodableImageError:
+                metrics.ERRORS.labels('undecodable_image').inc()
+                raise
+            img = fit_for_tiling(img, tile, TILE_OVERLAP, TILE_MAX_ACROSS)
+
+        width, height = img.size
+        grid = tile_grid(width, height, tile, TILE_OVERLAP)
+        scored, skipped = [], []
+        with stage.labels('gate').time():
+            for row, col, box in grid:
+                crop = img.crop(box)
+                entry = {
+                    'row': row,
+                    'col': col,
+                    'box': [round(box[0] / width, 4), round(box[1] / height, 4),
+                            round(box[2] / width, 4), round(box[3] / height, 4)],
+                }
+                if LEAF_GATE_ENABLED:
+                    try:
+                        leaf_gate.check(crop)
+                    except ImageRejected as e:
+                        metrics.TILES.labels(e.reason).inc()
+                        skipped.append({**entry, 'skipped': e.reason})
+                        continue
+                scored.append((entry, crop))
+
+        if not scored:
+            metrics.GATE_REJECTIONS.labels('no_leaf_tiles').inc()
+            reasons = {}
+            for entry in skipped:
+                reasons[entry['skipped']] = reasons.get(entry['skipped'], 0) + 1
+            raise ImageRejected('no_leaf_tiles', {'tiles': len(grid), 'skipped': reasons})
+
+        with stage.labels('preprocess').time():
+            if backend.task == 'classify':
+                inputs = [to_bgr(crop) for _, crop in scored]
+            else:
+                # letterbox() reuses one buffer per thread, so each tile needs its own copy
+                inputs = [letterbox(crop, tile).copy() for _, crop in scored]
+        with stage.labels('inference').time():
+            try:
+                results = served.batcher.predict_many(inputs, deadline=deadline)
+            except DeadlineExceeded:
+                raise
+            except Exception:
+                metrics.ERRORS.labels('inference_error').inc()
+                raise
+        metrics.TILES.labels('scored').inc(len(scored))
+
+        with stage.labels('postprocess').time():
+            tiles = []
+            for (entry, _), result in zip(scored, results):
+                prediction = format_prediction(result, backend.names)
+                prediction.pop('top_k', None)
+                tiles.append({**entry, **prediction})
+            summary = aggregate(tiles, TILE_MIN_CONFIDENCE)
+
+        metrics.MODEL_LATENCY.labels(served.version).observe(time.perf_counter() - started)
+        return {
+            **summary,
+            'model_version': served.version,
+            'grid': {'rows': grid[-1][0] + 1, 'cols': grid[-1][1] + 1},
+            'tiles': sorted(tiles + skipped, key=lambda t: (t['row'], t['col'])),
+        }
+
+def predict_bytes(img_bytes, deadline=None):
+    return predict_upload(io.BytesIO(img_bytes), deadline)
+
+def diagnose_upload(upload, deadline=None):
+    """Prediction plus the knowledge-base recommendation for the predicted class.
+
+    `recommendation` is None for healthy plants and for classes the knowledge
+    base doesn't cover, in which case the app falls back to the LLM service.
+    """
+    prediction = predict_upload(upload, deadline)
+    record = None
+    if knowledge_base is not None and not prediction['is_healthy']:
+        record = knowledge_base.for_class(prediction['disease_name'])
+    return {
+        **prediction,
+        'recommendation': format_recommendation(record) if record else None
+    }
+
+class ImageTooLarge(Exception):
+    """A /predict/batch image, or ZIP member, over MAX_UPLOAD_BYTES once uncompressed."""
+
+
+def iter_uploads(uploads):
+    """Yield (filename, bytes) for uploaded images, expanding any ZIP archives.
+
+    `uploads` is an iterable of (filename, seekable file object). Archive
+    members are read one at a time so a large survey ZIP is never fully
+    buffered in memory. An image over MAX_UPLOAD_BYTES, declared or as read,
+    is yielded as (filename, ImageTooLarge) instead of its bytes, and a
+    corrupt member as (filename, zipfile.BadZipFile).
+    """
+    for filename, fileobj in uploads:
+        if zipfile.is_zipfile(fileobj):
+            fileobj.seek(0)
+            with zipfile.ZipFile(fileobj) as archive:
+                for member in archive.infolist():
+                    if member.is_dir() or not member.filename.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    if member.file_size > MAX_UPLOAD_BYTES:
+                        yield member.filename, ImageTooLarge()
+                        continue
+                    # Capped read: the header's file_size may lie about what inflates
+                    try:
+                        with archive.open(member) as f:
+                            data = _read_capped(f)
+                    except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                        data = zipfile.BadZipFile(str(e))
+                    yield member.filename, data
+        else:
+            fileobj.seek(0)
+            yield filename, _read_capped(fileobj)
+
+def _read_capped(f):
+    data = f.read(MAX_UPLOAD_BYTES + 1)
+    return ImageTooLarge() if len(data) > MAX_UPLOAD_BYTES else data
+
+def predict_bulk_item(img_bytes):
+    """predict_bytes() for one /predict/batch image, admitted through the bulk lane."""
+    with bulk_lane:
+        started = time.perf_counter()
+        with admission.slot(max_wait=math.inf):
+            metrics.STAGE_LATENCY.labels('admission_wait').observe(time.perf_counter() - started)
+            return predict_bytes(img_bytes)
+
+def _predict_named(index, filename, img_bytes):
+    try:
+        result = predict_bulk_item(img_bytes)
+    except UndecodableImageError:
+        return {'index': index, 'filename': filename, 'error': 'Could not decode image'}
+    except ImageRejected as e:
+        return {'index': index, 'filename': filename, **rejection_body(e)}
+    except Exception as e:
+        return {'index': index, 'filename': filename, 'error': f"{type(e).__name__}: {e}"}
+    return {'index': index, 'filename': filename, **result}
+
+def predict_stream(images):
+    """Predict (filename, bytes) pairs in parallel, yielding results as each finishes.
+
+    At most BULK_DECODE_THREADS images are in flight, which bounds memory for
+    large surveys. Results come back in completion order and carry the
+    image's `index` in the request.
+    """
+    pending = set()
+    for index, (filename, img_bytes) in enumerate(images):
+        if isinstance(img_bytes, ImageTooLarge):
+            yield {'index': index, 'filename': filename, 'error': 'Image too large', 'max_bytes': MAX_UPLOAD_BYTES}
+            continue
+        if isinstance(img_bytes, zipfile.BadZipFile):
+            yield {'index': index, 'filename': filename, 'error': f"Could not read archive member: {img_bytes}"}
+            continue
+        if len(pending) >= BULK_DECODE_THREADS:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        pending.add(bulk_pool.submit(_predict_named, index, filename, img_bytes))
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+def rejection_body(e):
+    return {'error': 'Image rejected', 'reason': e.reason, 'scores': e.scores}
+
+def input_spec():
+    """What clients should upload, published on `/` so they can downscale before sending.
+
+    Anything larger than `resize` is scaled down server-side anyway, so a
+    client that resizes first (and picks the most compact format it can
+    encode) saves upload time without changing the prediction.
+    """
+    backend = router.active.backend if router.active else None
+    task = backend.task if backend else MODEL_TASK
+    imgsz = backend.imgsz if backend else MODEL_IMGSZ
+    return {
+        'formats': accepted_formats(),
+        'max_upload_bytes': MAX_UPLOAD_BYTES,
+        # Classifiers resize the short side to imgsz and center-crop; the box model letterboxes the long side
+        'resize': {'edge': 'short' if task == 'classify' else 'long', 'pixels': imgsz},
+        'task': task,
+    }
+
+def health_status():
+    return {
+        "status": "running" if loader.ready else loader.status,
+        "cache_dir": str(cache_dir),
+        "model": router.describe(),
+        "loading": loader.progress(),
+        "input_spec": input_spec(),
+        "prediction_cache": {m.version: m.cache.stats() for m in router.models()},
+        "recommendation_cache": recommendation_cache.stats(),
+        "admission": admission.stats(),
+        "uploads": uploads.stats(),
+        "leaf_gate": leaf_gate.thresholds() if LEAF_GATE_ENABLED else None
+    }
+
+def admin_authorized(authorization):
+    """Whether an Authorization header grants the /admin endpoints; they are off without ADMIN_TOKEN."""
+    if not ADMIN_TOKEN or not authorization:
+        return False
+    scheme, _, token = authorization.partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip(), ADMIN_TOKEN)
+
+def models_status():
+    return {
+        "versions": registry.versions(),
+        "state": registry.read_state(),
+        "serving": router.describe(),
+        "reload": watcher.progress(),
+    }
+
+def activate_models(body):
+    """Point every worker at a registered version, optionally with a candidate on a share of traffic.
+
+    `body` is {"version", "candidate"?, "candidate_weight"?}. The swap happens
+    in the background; poll GET /admin/models for its progress. Raises
+    ValueError for a malformed body or unknown version.
+    """
+    if not isinstance(body, dict) or not isinstance(body.get('version'), str):
+        raise ValueError("Body must be JSON with a 'version'")
+    candidate = body.get('candidate')
+    try:
+        weight = float(body.get('candidate_weight', 0.1 if candidate else 0.0))
+        state = registry.activate(body['version'], candidate, weight)
+    except (KeyError, TypeError) as e:
+        raise ValueError(e.args[0] if e.args else str(e)) from None
+    watcher.request_reload()
+    return {"state": state, "reload": watcher.progress()}
+
+def readiness():
+    """(is ready, body) for the readiness probe."""
+    return loader.ready, {"ready": loader.ready, **loader.progress()}
+
+def liveness():
+    """(is alive, body) for the liveness probe; a failed model load should restart the container."""
+    return not loader.failed, {"alive": not loader.failed, "status": loader.status}
@@ -0,0 +1,123 @@
+"""
+In-process lookup of fertilizer / treatment records for predicted disease classes.
+
+Loads `Fertilizer Recommendation RAG.json` once and resolves every model class
+name (e.g. "Pepper,_bell___Bacterial_spot") to its (crop, disease) record up
+front, so /diagnose answers known classes without a round trip to the LLM space.
+"""
+import json
+import re
+from pathlib import Path
+
+KB_FILENAME = "Fertilizer Recommendation RAG.json"
+
+# Looked up in order: next to the API, then the repository root
+DEFAULT_KB_PATHS = (
+    Path(__file__).resolve().parent / KB_FILENAME,
+    Path(__file__).resolve().parent.parent / KB_FILENAME,
+)
+
+
+def normalize(text):
+    """Lowercase and collapse punctuation/underscores: 'Pepper,_bell___Bacterial_spot' -> 'pepper bell bacterial spot'"""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+
+def locate(path=None):
+    """Return the knowledge-base file to use: `path` if given, else the first default that exists."""
+    candidates = [Path(path)] if path else DEFAULT_KB_PATHS
+    for candidate in candidates:
+        if candidate.exists():
+            return candidate
+    raise FileNotFoundError(f"Knowledge base not found in: {', '.join(map(str, candidates))}")
+
+
+def format_recommendation(record):
+    """Map a knowledge-base record to the sections the app shows on the result screen."""
+    return {
+        'crop': record['crop'],
+        'disease': record['disease'],
+        'symptoms': record.get('symptoms'),
+        'cause': record.get('cause'),
+        'chemical': record.get('chemical_treatment', []),
+        'organic': record.get('organic_treatment', []),
+        'fertilizer': record.get('recommended_fertilizers', []),
+        'prevention': record.get('preventive_measures'),
+        'references': record.get('references_used'),
+    }
+
+
+class KnowledgeBase:
+    def __init__(self, records):
+        self.records = records
+        # Exact index: normalized crop -> normalized disease -> record
+        self.index = {}
+        for record in records:
+            crop, disease = normalize(record['crop']), normalize(record['disease'])
+            self.index.setdefault(crop, {})[disease] = record
+        # Longest first, so "pepper bell" wins over a hypothetical "pepper"
+        self.crops = sorted(self.index, key=len, reverse=True)
+        self.class_records = {}
+
+    @classmethod
+    def load(cls, path=None):
+        with open(locate(path), encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def lookup(self, crop, disease):
+        return self.index.get(normalize(crop), {}).get(normalize(disease))
+
+    def resolve(self, class_name):
+        """Find the record for a model class name, or None (healthy / unknown classes).
+
+        The crop is the longest known crop prefix, so multi-word crops like
+        "pepper bell" aren't split after the first word. The rest is the
+        disease: matched exactly (ignoring spaces), then by one name
+        containing the other's words ("corn maize common rust" ->
+        "common rust"), then by the closest word overlap.
+        """
+        name = normalize(class_name)
+        for crop in self.crops:
+            if name == crop or name.startswith(crop + " "):
+                diseases = self.index[crop]
+                rest = name[len(crop):].strip()
+                break
+        else:
+            return None
+
+        if not rest or 'healthy' in rest.split():
+            return None
+        if rest in diseases:
+            return diseases[rest]
+        # "red rot" vs "redrot"
+        compact = {d.replace(' ', ''): d for d in diseases}
+        if rest.replace(' ', '') in compact:
+            return diseases[compact[rest.replace(' ', '')]]
+
+        rest_words = set(rest.split())
+        contained = [d for d in diseases if set(d.split()) <= rest_words or rest_words <= set(d.split())]
+        if contained:
+            return diseases[max(contained, key=len)]
+
+        def overlap(disease):
+            words = set(disease.split())
+            return len(words & rest_words) / len(words | rest_words)
+
+        best = max(diseases, key=overlap)
+        return diseases[best] if overlap(best) >= 0.5 else None
+
+    def index_classes(self, class_names):
+        """Precompute the record for every model class; returns the unmatched non-healthy names."""
+        names = class_names.values() if isinstance(class_names, dict) else class_names
+        unmatched = []
+        for name in names:
+            record = self.resolve(name)
+            self.class_records[name] = record
+            if record is None and 'healthy' not in normalize(name).split():
+                unmatched.append(name)
+        return unmatched
+
+    def for_class(self, class_name):
+        if class_name not in self.class_records:
+            self.class_records[class_name] = self.resolve(class_name)
+        return self.class_records[class_name]
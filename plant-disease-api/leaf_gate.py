@@ -0,0 +1,79 @@
+"""
+Cheap server-side checks that reject non-leaf and unusable photos before inference.
+
+Mirrors the client's LeafDetectorService green-pixel rule so web and
+third-party clients that skip the app's own check can't spend a YOLO
+forward pass on cars, selfies or badly blurred shots.
+"""
+import cv2
+import numpy as np
+
+# Images are scored at this size so blur scores don't depend on upload resolution
+GATE_SIZE = 256
+
+
+class ImageRejected(ValueError):
+    """The image failed the pre-inference gate; `reason` says which check."""
+
+    def __init__(self, reason, scores):
+        super().__init__(reason)
+        self.reason = reason
+        self.scores = scores
+
+
+def green_percentage(rgb):
+    """Percentage of green-dominant pixels, same rule as LeafDetectorService._calculateGreenPercentage."""
+    r, g, b = (rgb[..., i].astype(np.int16) for i in range(3))
+    green = (g > r) & (g > b) & (g > 50) & ((r + g + b) < 700)
+    return float(green.mean() * 100.0)
+
+
+def blur_score(gray):
+    """Variance of the Laplacian; low values mean few edges, i.e. a blurred shot."""
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def brightness(gray):
+    return float(gray.mean())
+
+
+class LeafGate:
+    def __init__(self, min_green_pct=15.0, min_blur=20.0, min_brightness=25.0, max_brightness=235.0):
+        self.min_green_pct = min_green_pct
+        self.min_blur = min_blur
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+
+    def thresholds(self):
+        return {
+            'min_green_pct': self.min_green_pct,
+            'min_blur': self.min_blur,
+            'min_brightness': self.min_brightness,
+            'max_brightness': self.max_brightness,
+        }
+
+    def score(self, img):
+        """Score an RGB PIL image; returns the green %, blur and brightness."""
+        rgb = np.asarray(img)
+        h, w = rgb.shape[:2]
+        scale = GATE_SIZE / max(h, w)
+        if scale < 1:
+            rgb = cv2.resize(rgb, (max(1, round(w * scale)), max(1, round(h * scale))),
+                             interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        return {
+            'green_pct': round(green_percentage(rgb), 2),
+            'blur': round(blur_score(gray), 2),
+            'brightness': round(brightness(gray), 2),
+        }
+
+    def check(self, img):
+        """Return the scores, or raise ImageRejected for the first failing check."""
+        scores = self.score(img)
+        if not self.min_brightness <= scores['brightness'] <= self.max_brightness:
+            raise ImageRejected('bad_exposure', scores)
+        if scores['blur'] < self.min_blur:
+            raise ImageRejected('too_blurry', scores)
+        if scores['green_pct'] < self.min_green_pct:
+            raise ImageRejected('not_a_leaf', scores)
+        return scores
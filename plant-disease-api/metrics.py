@@ -0,0 +1,115 @@
+"""
+Prometheus metrics for the prediction API, served on /metrics.
+
+With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR (the Dockerfile
+does) so every worker's samples are aggregated into one scrape.
+"""
+import os
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUESTS = Counter(
+    'plant_api_requests_total', 'Requests handled, by endpoint and HTTP status', ['endpoint', 'status']
+)
+ERRORS = Counter(
+    'plant_api_errors_total', 'Rejected or failed images, by error type', ['type']
+)
+REQUEST_LATENCY = Histogram(
+    'plant_api_request_seconds', 'End-to-end request latency', ['endpoint'], buckets=LATENCY_BUCKETS
+)
+# upload_read, admission_wait, cache_lookup, decode, gate, preprocess, inference, postprocess
+STAGE_LATENCY = Histogram(
+    'plant_api_stage_seconds', 'Latency of each prediction stage', ['stage'], buckets=LATENCY_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    'plant_api_batch_size', 'Images per batched forward pass', buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+CACHE_LOOKUPS = Counter(
+    'plant_api_cache_lookups_total', 'Prediction cache lookups by outcome', ['outcome']
+)
+IN_FLIGHT = Gauge(
+    'plant_api_in_flight_requests', 'Requests currently being handled', multiprocess_mode='livesum'
+)
+QUEUE_DEPTH = Gauge(
+    'plant_api_batch_queue_depth', 'Images waiting for the micro-batcher', multiprocess_mode='livesum'
+)
+SHED = Counter(
+    'plant_api_shed_requests_total', 'Requests answered 503 by admission control, by reason', ['reason']
+)
+ADMISSION_ACTIVE = Gauge(
+    'plant_api_admission_active', 'Requests holding an inference slot', multiprocess_mode='livesum'
+)
+ADMISSION_QUEUED = Gauge(
+    'plant_api_admission_queued', 'Admitted requests waiting for an inference slot', multiprocess_mode='livesum'
+)
+MODEL_BACKEND = Gauge(
+    'plant_api_model_backend', 'Model backend in use (always 1)', ['backend', 'int8', 'imgsz'],
+    multiprocess_mode='max'
+)
+MODEL_LATENCY = Histogram(
+    'plant_api_model_seconds', 'Prediction latency by model version, for comparing a candidate',
+    ['version'], buckets=LATENCY_BUCKETS
+)
+MODEL_CONFIDENCE = Histogram(
+    'plant_api_model_confidence', 'Top-1 confidence by model version', ['version'],
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)
+)
+GATE_REJECTIONS = Counter(
+    'plant_api_gate_rejections_total', 'Images rejected before inference, by reason', ['reason']
+)
+TILES = Counter(
+    'plant_api_tiles_total', 'Tiles of /predict/tiled photos: scored, or the gate check they failed',
+    ['outcome']
+)
+GATE_THRESHOLD = Gauge(
+    'plant_api_gate_threshold', 'Configured pre-inference gate thresholds', ['name'],
+    multiprocess_mode='max'
+)
+RSS = Gauge(
+    'plant_api_process_resident_memory_bytes', 'Resident memory of each serving process',
+    multiprocess_mode='all'
+)
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def observe_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            RSS.set(int(f.read().split()[1]) * _PAGE_SIZE)
+    except OSError:
+        pass
+
+
+def observe_request(endpoint, status, seconds):
+    REQUESTS.labels(endpoint, str(status)).inc()
+    REQUEST_LATENCY.labels(endpoint).observe(seconds)
+    observe_rss()
+
+
+def render():
+    """Return (body, content type) for a /metrics response."""
+    observe_rss()
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
@@ -1,66 +1,204 @@
-import os
-from pathlib import Path
-from flask import Flask, request, jsonify
-from ultralytics import YOLO
-from PIL import Image
 import io
+import json
+import time
+from flask import Flask, Response, abort, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+import inference
+import metrics
+from admission import Overloaded
+from preprocessing import UndecodableImageError
+from leaf_gate import ImageRejected
 
-# --- SAFE CACHE DIRECTORY CONFIGURATION ---
-data_path = Path("/data")
-if data_path.exists() and os.access(data_path, os.W_OK):
-    cache_dir = data_path
-else:
-    cache_dir = Path("/tmp/ultralytics-cache")
-    cache_dir.mkdir(parents=True, exist_ok=True)
-    print("⚠️  /data not writable, using /tmp/ultralytics-cache instead")
-
-print(f"Using cache directory: {cache_dir}")
+app = Flask(__name__)
+# Default body cap; upload routes get their own limit in start_request
+app.config['MAX_CONTENT_LENGTH'] = inference.MAX_UPLOAD_BYTES
+# Lets the web app read Retry-After on 503s
+CORS(app, expose_headers=['Retry-After'])
 
-# Set environment variables
-os.environ['YOLO_CONFIG_DIR'] = str(cache_dir)
-os.environ['HF_HOME'] = str(cache_dir)
-os.environ['HUGGINGFACE_HUB_CACHE'] = str(cache_dir / "hub")
-# --- END CONFIGURATION ---
+@app.before_request
+def start_request():
+    g.request_started = time.perf_counter()
+    metrics.IN_FLIGHT.inc()
+    if request.url_rule is not None and request.url_rule.rule in inference.UPLOAD_LIMITS:
+        # Enforced by Werkzeug while the body is read, so chunked uploads are cut off at the route's limit too
+        request.max_content_length = inference.UPLOAD_LIMITS[request.url_rule.rule]
 
-app = Flask(__name__)
-CORS(app)
+@app.after_request
+def record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe_request(endpoint, response.status_code, time.perf_counter() - g.request_started)
+    return response
 
-model = YOLO('best_model.pt')
+@app.teardown_request
+def finish_request(exc):
+    metrics.IN_FLIGHT.dec()
 
 @app.route('/')
 def health():
-    return jsonify({"status": "running", "cache_dir": str(cache_dir)})
+    return jsonify(inference.health_status())
+
+@app.route('/health/live')
+def health_live():
+    alive, body = inference.liveness()
+    return jsonify(body), 200 if alive else 500
+
+@app.route('/health/ready')
+def health_ready():
+    ready, body = inference.readiness()
+    return jsonify(body), 200 if ready else 503
+
+def not_ready_response():
+    if inference.loader.failed:
+        # Retrying won't help until the container restarts (see /health/live)
+        return jsonify({'error': 'Model failed to load', 'reason': inference.loader.error}), 500
+    response = jsonify({'error': 'Model is still loading', 'loading': inference.loader.progress()})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+def shed_response(e):
+    metrics.SHED.labels(e.reason).inc()
+    response = jsonify({'error': 'Server busy, retry later', 'reason': e.reason, 'retry_after': e.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    metrics.ERRORS.labels('upload_too_large').inc()
+    return jsonify({'error': 'Upload too large', 'max_bytes': request.max_content_length}), 413
+
+def check_upload_size():
+    """Refuse an oversized upload from its Content-Length, before any of the body is read."""
+    if request.content_length is not None and request.content_length > request.max_content_length:
+        abort(413)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    metrics.QUEUE_DEPTH.set(inference.router.pending())
+    metrics.ADMISSION_ACTIVE.set(inference.admission.active)
+    metrics.ADMISSION_QUEUED.set(inference.admission.queued)
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+def handle_image_upload(run):
+    """Shared body of /predict and /diagnose: pass the 'image' upload's spooled file to `run`."""
+    if not inference.loader.ready:
+        return not_ready_response()
+    check_upload_size()
+    deadline = inference.request_deadline(request.headers.get('X-Client-Timeout'))
+
+    try:
+        # Received before taking a ticket, so slow uploads never hold inference capacity
+        with inference.uploads.hold():
+            with metrics.STAGE_LATENCY.labels('upload_read').time():
+                file = request.files.get('image')
+
+        if file is None:
+            metrics.ERRORS.labels('missing_image').inc()
+            return jsonify({'error': 'No image provided'}), 400
+
+        with inference.admission.ticket():
+            # Decoded straight from the parsed upload, without reading it into a bytes copy
+            return jsonify(inference.run_admitted(run, file.stream, deadline))
+    except Overloaded as e:
+        return shed_response(e)
+    except UndecodableImageError:
+        return jsonify({'error': 'Could not decode image'}), 400
+    except ImageRejected as e:
+        # 422: a valid image, but not one the model should score
+        return jsonify(inference.rejection_body(e)), 422
 
 @app.route('/predict', methods=['POST'])
 def predict():
-    if 'image' not in request.files:
-        return jsonify({'error': 'No image provided'}), 400
-    
-    file = request.files['image']
-    img_bytes = file.read()
-    img = Image.open(io.BytesIO(img_bytes))
-
-    results = model.predict(img, conf=0.25, verbose=False)
-    
-    if len(results[0].boxes) == 0:
-        return jsonify({
-            'disease_name': 'No Detection',
-            'confidence': 0.0,
-            'is_healthy': False
-        })
-    
-    top_prediction = results[0].boxes[0]
-    disease_class = int(top_prediction.cls)
-    disease_name = model.names[disease_class]
-    confidence = float(top_prediction.conf)
-    is_healthy = 'healthy' in disease_name.lower()
-    
-    return jsonify({
-        'disease_name': disease_name,
-        'confidence': confidence,
-        'is_healthy': is_healthy
-    })
+    return handle_image_upload(inference.predict_upload)
+
+@app.route('/predict/tiled', methods=['POST'])
+def predict_tiled():
+    """Opt-in tiled mode for whole-plant and crop-row photos; see inference.predict_tiled."""
+    return handle_image_upload(inference.predict_tiled)
+
+@app.route('/diagnose', methods=['POST'])
+def diagnose():
+    return handle_image_upload(inference.diagnose_upload)
+
+@app.route('/recommend', methods=['POST'])
+def recommend():
+    """Same request and response as the recommendation space's /predict, served from cache."""
+    body = request.get_json(silent=True) or {}
+    crop, disease = body.get('crop'), body.get('disease')
+    if not crop or not disease:
+        return jsonify({'error': "JSON body needs 'crop' and 'disease'"}), 400
+
+    try:
+        value, source = inference.recommendation_cache.get(crop, disease)
+    except Exception as e:
+        metrics.ERRORS.labels('recommender_error').inc()
+        return jsonify({'error': 'Recommendation service failed', 'detail': f"{type(e).__name__}: {e}"}), 502
+    return Response(value['body'], content_type=value['content_type'], headers={'X-Cache': source})
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    if not inference.loader.ready:
+        return not_ready_response()
+    check_upload_size()
+
+    try:
+        with inference.uploads.hold():
+            files = request.files.getlist('images')
+        # Refused like /predict when this worker is saturated; the images are
+        # then admitted one by one through the bulk lane
+        inference.admission.check()
+    except Overloaded as e:
+        return shed_response(e)
+
+    if not files:
+        metrics.ERRORS.labels('missing_image').inc()
+        return jsonify({'error': 'No images provided'}), 400
+
+    return Response(stream_with_context(ndjson_results(detach_uploads(files))), mimetype='application/x-ndjson')
+
+def detach_uploads(files):
+    """Take the uploads' spooled files away from the request.
+
+    The NDJSON body is generated after the view returns, by which time the
+    request has closed its files; detached, they stay open until
+    ndjson_results() is done with them.
+    """
+    uploads = []
+    for f in files:
+        uploads.append((f.filename, f.stream))
+        f.stream = io.BytesIO()
+    return uploads
+
+def ndjson_results(uploads):
+    try:
+        for result in inference.predict_stream(inference.iter_uploads(uploads)):
+            yield json.dumps(result) + '\n'
+    finally:
+        for _, stream in uploads:
+            stream.close()
+
+def admin_denied():
+    if not inference.admin_authorized(request.headers.get('Authorization')):
+        return jsonify({'error': 'Admin token required'}), 403
+    return None
+
+@app.route('/admin/models', methods=['GET'])
+def admin_models():
+    """Registered versions, the requested serving state and this worker's reload progress."""
+    return admin_denied() or jsonify(inference.models_status())
+
+@app.route('/admin/models/activate', methods=['POST'])
+def admin_activate():
+    """Hot-swap to a registered version, optionally splitting traffic with a candidate."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        return jsonify(inference.activate_models(request.get_json(silent=True))), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=7860)
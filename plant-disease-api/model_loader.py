@@ -0,0 +1,87 @@
+import threading
+import time
+import traceback
+
+
+class ModelLoader:
+    """Load an inference backend off the request path, then warm it up.
+
+    `load()` returns an InferenceBackend and `warm_up(backend)` runs one
+    throwaway inference. Progress is exposed through `progress()` for the
+    readiness probe; requests should only be served once `ready` is set.
+    """
+
+    def __init__(self, load, warm_up, warmup_runs=2):
+        self._load = load
+        self._warm_up = warm_up
+        self.warmup_runs = warmup_runs
+        self.backend = None
+        self.status = 'pending'
+        self.error = None
+        self.warmup_done = 0
+        self.started_at = None
+        self.loaded_at = None
+        self.ready_at = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def failed(self):
+        return self.status == 'failed'
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def load(self):
+        """Load synchronously (e.g. in a gunicorn master before fork) without warming up."""
+        with self._lock:
+            if self.backend is None:
+                self.started_at = self.started_at or time.time()
+                self.status = 'loading'
+                self.backend = self._load()
+                self.loaded_at = time.time()
+                self.status = 'loaded'
+        return self.backend
+
+    def start(self):
+        """Load (if needed) and warm up on a background thread; safe to call repeatedly."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self.ready:
+            return
+        self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        self.started_at = self.started_at or time.time()
+        try:
+            backend = self.load()
+            self.status = 'warming_up'
+            for run in range(self.warmup_runs):
+                self._warm_up(backend)
+                self.warmup_done = run + 1
+        except Exception as e:
+            self.status = 'failed'
+            self.error = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+            return
+
+        self.ready_at = time.time()
+        self.status = 'ready'
+        self._ready.set()
+        print(f"✓ Model ready in {self.ready_at - self.started_at:.1f}s "
+              f"({self.warmup_runs} warm-up run(s))")
+
+    def progress(self):
+        return {
+            'status': self.status,
+            'warmup': f"{self.warmup_done}/{self.warmup_runs}",
+            'load_seconds': round(self.loaded_at - self.started_at, 2) if self.loaded_at and self.started_at else None,
+            'ready_seconds': round(self.ready_at - self.started_at, 2) if self.ready_at and self.started_at else None,
+            'error': self.error,
+        }
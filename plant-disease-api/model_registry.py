@@ -0,0 +1,345 @@
+"""
+Versioned model registry under the cache directory, and hot swapping between its versions.
+
+    models/<version>/model.pt           weights
+    models/<version>/class_names.json   class names in index order
+    models/<version>/meta.json          training imgsz, task, sha256, source
+    models/active.json                  {"version", "candidate", "candidate_weight"}
+
+active.json is what every gunicorn worker serves: each worker's
+RegistryWatcher notices a change, loads and warms up the new version in the
+background, then swaps it in. Requests already running finish on the model
+they started with.
+
+Register a retrained model, then switch to it (or send it 10% of traffic):
+    python model_registry.py add outputs/best_model.pt --class-names outputs/class_names.json
+    python model_registry.py activate 20261017-093000-1a2b3c4d
+    python model_registry.py activate <current> --candidate 20261017-093000-1a2b3c4d --weight 0.1
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+
+from cache_paths import default_cache_dir
+
+WEIGHTS_NAME = 'model.pt'
+VERSION_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+
+def write_json_atomic(path, value):
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(json.dumps(value, indent=2))
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, version):
+        return self.root / version
+
+    def weights(self, version):
+        return self.root / version / WEIGHTS_NAME
+
+    def meta(self, version):
+        if not VERSION_PATTERN.match(version or ''):
+            raise KeyError(f"Invalid model version '{version}'")
+        try:
+            return json.loads((self.path(version) / 'meta.json').read_text())
+        except FileNotFoundError:
+            raise KeyError(f"Unknown model version '{version}'") from None
+
+    def class_names(self, version):
+        return json.loads((self.path(version) / 'class_names.json').read_text())
+
+    def versions(self):
+        """Metadata of every registered version, oldest first."""
+        if not self.root.exists():
+            return []
+        metas = [json.loads(p.read_text()) for p in self.root.glob('*/meta.json')]
+        return sorted(metas, key=lambda m: m['created'])
+
+    def add(self, weights, class_names=None, imgsz=None, task=None, version=None):
+        """Copy `weights` into a new version; imgsz, task and class names default to the checkpoint's."""
+        weights = Path(weights)
+        digest = hashlib.sha256()
+        with open(weights, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        version = version or f"{time.strftime('%Y%m%d-%H%M%S')}-{sha256[:8]}"
+        if not VERSION_PATTERN.match(version):
+            raise ValueError(f"Invalid model version '{version}'")
+        if self.path(version).exists():
+            raise ValueError(f"Model version '{version}' already exists")
+
+        if class_names is None or imgsz is None or task is None:
+            from ultralytics import YOLO
+
+            model = YOLO(str(weights))
+            ckpt = getattr(model, 'ckpt', None) or {}
+            imgsz = imgsz or ckpt.get('train_args', {}).get('imgsz')
+            task = task or model.task
+            if class_names is None:
+                class_names = [model.names[i] for i in sorted(model.names)]
+        if imgsz is None:
+            raise ValueError(f"{weights} doesn't record its training imgsz; pass it explicitly")
+
+        meta = {
+            'version': version,
+            'imgsz': int(imgsz),
+            'task': task,
+            'classes': len(class_names),
+            'sha256': sha256,
+            'source': str(weights.resolve()),
+            'created': time.time(),
+        }
+        # Built in a temp directory and renamed, so a version is either complete or absent
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_dir = self.root / f".{version}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir()
+        shutil.copy2(weights, tmp_dir / WEIGHTS_NAME)
+        (tmp_dir / 'class_names.json').write_text(json.dumps(list(class_names), indent=2))
+        (tmp_dir / 'meta.json').write_text(json.dumps(meta, indent=2))
+        os.replace(tmp_dir, self.path(version))
+        return meta
+
+    # --- Serving state shared by all workers ---
+
+    def read_state(self):
+        try:
+            return json.loads((self.root / 'active.json').read_text())
+        except FileNotFoundError:
+            return None
+
+    def activate(self, version, candidate=None, candidate_weight=0.0):
+        """Point every worker at `version`, optionally routing `candidate_weight` of requests to `candidate`."""
+        self.meta(version)
+        if candidate is not None:
+            self.meta(candidate)
+            if candidate == version:
+                raise ValueError("candidate must differ from the active version")
+            if not 0.0 <= candidate_weight <= 1.0:
+                raise ValueError("candidate_weight must be between 0 and 1")
+        state = {
+            'version': version,
+            'candidate': candidate,
+            'candidate_weight': float(candidate_weight) if candidate else 0.0,
+            'updated': time.time(),
+        }
+        self.root.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.root / 'active.json', state)
+        return state
+
+
+class ServedModel:
+    """One loaded version with its own micro-batcher and prediction cache."""
+
+    def __init__(self, version, backend, batcher, cache):
+        self.version = version
+        self.backend = backend
+        self.batcher = batcher
+        self.cache = cache
+        self.inflight = 0
+        self.retired = False
+
+    def close(self):
+        self.batcher.close()
+
+    def describe(self):
+        return {'version': self.version, **self.backend.describe()}
+
+
+class ModelRouter:
+    """Picks the ServedModel for each request and swaps models without dropping requests.
+
+    A model that is swapped out keeps serving the requests that already hold
+    it; its batch thread stops once the last of them finishes.
+    """
+
+    def __init__(self):
+        self.active = None
+        self.candidate = None
+        self.candidate_weight = 0.0
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    @contextmanager
+    def use(self):
+        with self._lock:
+            model = self.active
+            if self.candidate is not None and self._random.random() < self.candidate_weight:
+                model = self.candidate
+            model.inflight += 1
+        try:
+            yield model
+        finally:
+            with self._lock:
+                model.inflight -= 1
+                finished = model.retired and model.inflight == 0
+            if finished:
+                model.close()
+
+    def install(self, active, candidate=None, candidate_weight=0.0):
+        """Atomically route to `active` (and `candidate`); models no longer routed to are retired."""
+        with self._lock:
+            previous = {m for m in (self.active, self.candidate) if m is not None}
+            self.active = active
+            self.candidate = candidate
+            self.candidate_weight = candidate_weight if candidate is not None else 0.0
+            idle = []
+            for model in previous - {active, candidate}:
+                model.retired = True
+                if model.inflight == 0:
+                    idle.append(model)
+        for model in idle:
+            model.close()
+
+    def models(self):
+        with self._lock:
+            return [m for m in (self.active, self.candidate) if m is not None]
+
+    def pending(self):
+        return sum(m.batcher.pending for m in self.models())
+
+    def describe(self):
+        with self._lock:
+            return {
+                'active': self.active.describe() if self.active else None,
+                'candidate': self.candidate.describe() if self.candidate else None,
+                'candidate_weight': self.candidate_weight,
+            }
+
+
+class RegistryWatcher:
+    """Keep this worker's router in line with active.json, loading versions off the request path.
+
+    `load(version)` returns a warmed-up ServedModel. Versions already loaded
+    are reused, so moving a candidate to active costs nothing. A version that
+    fails to load is reported and not retried until active.json changes again.
+    """
+
+    def __init__(self, registry, router, load, poll_seconds=5.0):
+        self.registry = registry
+        self.router = router
+        self.load = load
+        self.poll_seconds = poll_seconds
+        self.applied = None
+        self.status = 'idle'
+        self.error = None
+        self.swapped_at = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        # Started in the serving process: threads don't survive a gunicorn fork
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="registry-watcher", daemon=True)
+            self._thread.start()
+
+    def request_reload(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                traceback.print_exc()
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def check(self):
+        with self._lock:
+            state = self.registry.read_state()
+            # Nothing served yet: the first model is ModelLoader's to load
+            if state is None or state == self.applied or self.router.active is None:
+                return
+            loaded = {m.version: m for m in self.router.models()}
+            self.status = 'loading'
+            try:
+                active = loaded.get(state['version']) or self.load(state['version'])
+                candidate = None
+                if state.get('candidate'):
+                    candidate = loaded.get(state['candidate']) or self.load(state['candidate'])
+            except Exception as e:
+                self.status = 'failed'
+                self.error = f"{type(e).__name__}: {e}"
+                self.applied = state
+                traceback.print_exc()
+                return
+
+            self.router.install(active, candidate, state.get('candidate_weight', 0.0))
+            self.applied = state
+            self.status = 'idle'
+            self.error = None
+            self.swapped_at = time.time()
+            print(f"✓ Serving model {state['version']}"
+                  + (f" with {state['candidate']} on {state['candidate_weight']:.0%}" if candidate else ""))
+
+    def progress(self):
+        return {
+            'status': self.status,
+            'error': self.error,
+            'applied': self.applied,
+            'swapped_at': self.swapped_at,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--root', type=Path, help='Registry directory (default: the API cache_dir/models)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add_cmd = commands.add_parser('add', help='Register a trained checkpoint as a new version')
+    add_cmd.add_argument('weights')
+    add_cmd.add_argument('--class-names', help='class_names.json written by the training script')
+    add_cmd.add_argument('--imgsz', type=int, help='Training imgsz (default: read from the checkpoint)')
+    add_cmd.add_argument('--task', choices=['classify', 'detect'])
+    add_cmd.add_argument('--version')
+
+    activate_cmd = commands.add_parser('activate', help='Serve a version, optionally splitting traffic')
+    activate_cmd.add_argument('version')
+    activate_cmd.add_argument('--candidate')
+    activate_cmd.add_argument('--weight', type=float, default=0.1, help="Candidate's share of requests")
+
+    commands.add_parser('list', help='Show registered versions and the serving state')
+
+    args = parser.parse_args(argv)
+
+    if args.root is None:
+        args.root = default_cache_dir() / "models"
+    registry = ModelRegistry(args.root)
+
+    if args.command == 'add':
+        class_names = None
+        if args.class_names:
+            with open(args.class_names) as f:
+                class_names = json.load(f)
+            if isinstance(class_names, dict):
+                class_names = [class_names[k] for k in sorted(class_names, key=int)]
+        meta = registry.add(args.weights, class_names, imgsz=args.imgsz, task=args.task, version=args.version)
+        print(f"✓ Registered {meta['version']} ({meta['task']}, imgsz {meta['imgsz']}, {meta['classes']} classes)")
+    elif args.command == 'activate':
+        state = registry.activate(args.version, args.candidate, args.weight if args.candidate else 0.0)
+        print(json.dumps(state, indent=2))
+    else:
+        print(json.dumps({'versions': registry.versions(), 'state': registry.read_state()}, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
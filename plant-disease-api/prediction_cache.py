@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+
+def content_key(img_bytes):
+    return hashlib.sha256(img_bytes).hexdigest()
+
+
+def file_content_key(fp, chunk_size=1 << 16):
+    """content_key() of a seekable binary file, hashed in chunks; leaves `fp` at the start."""
+    fp.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fp.read(chunk_size), b''):
+        digest.update(chunk)
+    fp.seek(0)
+    return digest.hexdigest()
+
+
+def perceptual_hash(img, hash_size=8):
+    """64-bit difference hash of a downscaled grayscale image.
+
+    Re-encodes, small resizes and recompression of the same shot land within
+    a few bits of each other, so the Hamming distance finds near-duplicates.
+    """
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR, reducing_gap=2.0)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+class _LRU:
+    """Thread-unsafe LRU with per-entry expiry; PredictionCache holds the lock."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < now:
+            del self.entries[key]
+            self.evictions += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, now, created=None):
+        expires_at = (created if created is not None else now) + self.ttl
+        self.entries[key] = (value, expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def items(self, now):
+        return [(k, v) for k, (v, expires_at) in self.entries.items() if expires_at >= now]
+
+
+class PredictionCache:
+    """Two-tier prediction cache: exact image bytes, then perceptual near-duplicates.
+
+    Keys are scoped by `namespace` (the serving model) so a model change never
+    returns stale predictions. With `persist_path`, entries are written through
+    to SQLite and reloaded on start, which also lets gunicorn workers share hits.
+    """
+
+    def __init__(self, namespace, max_entries=2048, ttl=86400, max_distance=4, persist_path=None):
+        self.namespace = namespace
+        self.max_distance = max_distance
+        self.exact = _LRU(max_entries, ttl)
+        self.near = _LRU(max_entries, ttl)
+        self.hits_exact = 0
+        self.hits_near = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_path = persist_path
+        self._db_pid = None
+        if persist_path is not None:
+            self._load_db()
+
+    # --- Lookup ---
+
+    def get_exact(self, key):
+        now = time.time()
+        with self._lock:
+            value = self.exact.get(key, now)
+            if value is None and self._db_path is not None:
+                value = self._load_row(key)
+                if value is not None:
+                    self.exact.put(key, value, now)
+            if value is not None:
+                self.hits_exact += 1
+            return value
+
+    def get_near(self, key, phash):
+        """Look up by perceptual hash; counts a miss when nothing is close enough."""
+        now = time.time()
+        with self._lock:
+            if self.max_distance >= 0:
+                best, best_distance = None, self.max_distance + 1
+                for other, (other_hash, value) in self.near.items(now):
+                    distance = (other_hash ^ phash).bit_count()
+                    if distance < best_distance:
+                        best, best_distance = (other, value), distance
+                if best is not None:
+                    self.near.get(best[0], now)
+                    self.exact.put(key, best[1], now)
+                    self.hits_near += 1
+                    return best[1]
+            self.misses += 1
+            return None
+
+    # --- Store ---
+
+    def put(self, key, phash, value):
+        now = time.time()
+        with self._lock:
+            self.exact.put(key, value, now)
+            self.near.put(key, (phash, value), now)
+            if self._db_path is not None:
+                db = self._connection()
+                db.execute(
+                    "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, str(phash), json.dumps(value), now),
+                )
+                db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits_exact + self.hits_near + self.misses
+            return {
+                'hits_exact': self.hits_exact,
+                'hits_near': self.hits_near,
+                'misses': self.misses,
+                'hit_rate': round((self.hits_exact + self.hits_near) / lookups, 4) if lookups else 0.0,
+                'entries': len(self.exact.entries),
+                'evictions': self.exact.evictions + self.near.evictions,
+                'persistent': self._db_path is not None,
+            }
+
+    # --- Persistence ---
+
+    def _connection(self):
+        # SQLite connections must not cross fork(), so preloaded workers reconnect
+        if self._db is None or self._db_pid != os.getpid():
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self._db_path), check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "namespace TEXT, key TEXT, phash TEXT, value TEXT, created REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._db_pid = os.getpid()
+        return self._db
+
+    def _load_db(self):
+        db = self._connection()
+        now = time.time()
+        cutoff = now - self.exact.ttl
+        db.execute("DELETE FROM predictions WHERE created < ?", (cutoff,))
+        db.commit()
+
+        rows = db.execute(
+            "SELECT key, phash, value, created FROM predictions WHERE namespace = ? "
+            "ORDER BY created DESC LIMIT ?",
+            (self.namespace, self.exact.max_entries),
+        ).fetchall()
+        for key, phash, value, created in reversed(rows):
+            value = json.loads(value)
+            self.exact.put(key, value, now, created=created)
+            self.near.put(key, (int(phash), value), now, created=created)
+
+    def _load_row(self, key):
+        row = self._connection().execute(
+            "SELECT value, created FROM predictions WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None or row[1] + self.exact.ttl < time.time():
+            return None
+        return json.loads(row[0])
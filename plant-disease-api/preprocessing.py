@@ -0,0 +1,111 @@
+import math
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+# Ultralytics pads letterboxed images with this grey value
+PAD_VALUE = 114
+
+# Files picked out of ZIP uploads and directories
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp', '.avif')
+
+# Upload formats advertised to clients, most compact first, with the Pillow
+# feature that decodes each (None: always built in)
+UPLOAD_FORMATS = (
+    ('image/avif', 'avif'),
+    ('image/webp', 'webp'),
+    ('image/jpeg', 'jpg'),
+    ('image/png', 'zlib'),
+    ('image/bmp', None),
+)
+
+_buffers = threading.local()
+
+
+class UndecodableImageError(ValueError):
+    """The upload is not an image PIL can decode."""
+
+
+def decode_image(fp, target_size, long_side=False):
+    """Decode an upload straight to roughly `target_size`, upright and in RGB.
+
+    For JPEGs the decoder is put in draft mode, so DCT scaling (1/2, 1/4, 1/8)
+    skips most of a 12 MP photo's pixels instead of decoding them and
+    throwing them away; the result is still at least `target_size` on its
+    short side, or on its long side with `long_side`. EXIF orientation is
+    applied so portrait phone shots reach the model the right way up. `fp` is
+    read in place, so an upload's spooled file can be passed straight in.
+    """
+    try:
+        img = Image.open(fp)
+        if img.format == 'JPEG':
+            if long_side:
+                # Keep the aspect ratio, so only the long side is held to target_size
+                w, h = img.size
+                scale = target_size / max(w, h)
+                img.draft('RGB', (math.ceil(w * scale), math.ceil(h * scale)))
+            else:
+                img.draft('RGB', (target_size, target_size))
+        img = ImageOps.exif_transpose(img)
+        return img.convert('RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        # ValueError: malformed headers and chunks some decoders only notice while loading
+        raise UndecodableImageError(str(e)) from e
+
+
+def accepted_formats():
+    """MIME types of the UPLOAD_FORMATS this Pillow build can decode."""
+    def available(feature):
+        # Older Pillow releases don't know the 'avif' feature at all
+        known = feature in features.modules or feature in features.codecs
+        return known and features.check(feature)
+
+    return [mime for mime, feature in UPLOAD_FORMATS if feature is None or available(feature)]
+
+
+def client_downscale(img, edge, pixels):
+    """Resize so the input spec's `edge` ('short' or 'long') is `pixels`, the way a client should; never upscales."""
+    w, h = img.size
+    scale = pixels / (min(w, h) if edge == 'short' else max(w, h))
+    if scale >= 1:
+        return img
+    return img.resize((round(w * scale), round(h * scale)), Image.LANCZOS, reducing_gap=3.0)
+
+
+def to_bgr(img):
+    """RGB PIL image -> contiguous BGR array, the numpy layout Ultralytics expects.
+
+    Classification models resize + center-crop inside Ultralytics, matching
+    how they were validated, so they get the decoded image as-is.
+    """
+    return np.ascontiguousarray(np.asarray(img)[..., ::-1])
+
+
+def letterbox(img, size):
+    """Resize + pad an RGB PIL image to `size` x `size` exactly like Ultralytics' LetterBox.
+
+    Returns a BGR uint8 array (what Ultralytics expects for numpy input) backed
+    by a per-thread buffer. The buffer is reused by the next call on the same
+    thread, so callers must be done with the array (i.e. have their
+    prediction back) before preprocessing another image.
+    """
+    w, h = img.size
+    r = min(size / h, size / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    dw, dh = (size - new_w) / 2, (size - new_h) / 2
+    top, left = int(round(dh - 0.1)), int(round(dw - 0.1))
+
+    rgb = np.asarray(img)
+    if (new_w, new_h) != (w, h):
+        rgb = cv2.resize(rgb, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    buffer = getattr(_buffers, 'letterbox', None)
+    if buffer is None or buffer.shape[0] != size:
+        buffer = np.empty((size, size, 3), dtype=np.uint8)
+        _buffers.letterbox = buffer
+
+    buffer.fill(PAD_VALUE)
+    buffer[top:top + new_h, left:left + new_w] = rgb[..., ::-1]
+    return buffer
@@ -0,0 +1,460 @@
+"""
+Validate and compile the fertilizer RAG corpus into a memory-mapped retrieval index.
+
+The corpus is a hand-edited JSON array, so `validate` reports JSON syntax
+errors and schema problems with exact line/column locations. `build` then
+compiles it into a directory of flat arrays:
+
+    meta.json            corpus stats, BM25 parameters, crop list, source hash
+    vocab.json           term -> term id
+    idf.npy              float32 idf per term
+    postings_offsets.npy int64, postings of term t are [offsets[t], offsets[t+1])
+    postings_docs.npy    int32 doc ids
+    postings_weights.npy float32 precomputed BM25 weight of the term in the doc
+    dense.npy            float32 (docs x DENSE_DIM) L2-normalized vectors
+    doc_crops.npy        int32 crop id per doc
+    records.jsonl        one record per line
+    record_offsets.npy   int64 byte offset of each record line
+
+`RagIndex.open()` memory-maps the arrays, so startup is near-constant as the
+corpus grows and only the top-k records are ever parsed.
+
+The dense vectors are TF-IDF weights hashed into DENSE_DIM signed buckets; no
+embedding model ships with the API. They capture overlap that BM25 misses on
+short queries, and an embedding model could write the same dense.npy later.
+
+Usage:
+    python rag_index.py validate "../Fertilizer Recommendation RAG.json"
+    python rag_index.py build "../Fertilizer Recommendation RAG.json" rag_index/
+    python rag_index.py query rag_index/ "orange pustules on leaves" --crop corn
+    python rag_index.py benchmark "../Fertilizer Recommendation RAG.json" --sizes 36 1000 10000
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import re
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from knowledge_base import normalize
+
+INDEX_VERSION = 1
+DENSE_DIM = 256
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it of on or per the to under with "
+    "e g eg etc where if via".split()
+)
+
+STRING_FIELDS = ('crop', 'disease', 'symptoms', 'cause', 'preventive_measures', 'references_used')
+LIST_FIELDS = {
+    'recommended_fertilizers': ('name', 'npk_ratio', 'dosage', 'application_method'),
+    'chemical_treatment': ('chemical_name', 'dosage', 'spray_interval', 'notes'),
+    'organic_treatment': ('solution', 'preparation', 'application'),
+}
+
+
+class CorpusError(ValueError):
+    """The corpus failed validation; `problems` lists every issue found with its location."""
+
+    def __init__(self, problems):
+        super().__init__("\n".join(problems))
+        self.problems = problems
+
+
+# --- VALIDATION ---
+
+def _line_starts(text):
+    """Offset where each line of `text` starts, for _location()."""
+    return [0] + [m.end() for m in re.finditer('\n', text)]
+
+
+def _location(line_starts, pos):
+    """1-based (line, column) of offset `pos`; a binary search, so locating every record stays linear."""
+    line = bisect.bisect_right(line_starts, pos)
+    return line, pos - line_starts[line - 1] + 1
+
+
+def _parse_records(text, path):
+    """Parse the top-level array element by element, remembering where each record starts."""
+    decoder = json.JSONDecoder()
+    ws = re.compile(r'[ \t\n\r]*')
+
+    def fail(msg, pos):
+        line_starts = _line_starts(text)
+        line, column = _location(line_starts, pos)
+        end = line_starts[line] - 1 if line < len(line_starts) else len(text)
+        snippet = text[line_starts[line - 1]:end].rstrip('\r')
+        raise CorpusError([f"{path}:{line}:{column}: {msg}\n    {snippet}\n    {' ' * (column - 1)}^"])
+
+    pos = ws.match(text, 0).end()
+    if text[pos:pos + 1] != '[':
+        fail("expected the corpus to be a JSON array", pos)
+    pos = ws.match(text, pos + 1).end()
+
+    records, starts = [], []
+    if text[pos:pos + 1] == ']':
+        return records, starts
+    while True:
+        try:
+            record, end = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError as e:
+            fail(e.msg, e.pos)
+        records.append(record)
+        starts.append(pos)
+        pos = ws.match(text, end).end()
+        if text[pos:pos + 1] == ',':
+            pos = ws.match(text, pos + 1).end()
+        elif text[pos:pos + 1] == ']':
+            break
+        else:
+            fail("expected ',' or ']' after record", pos)
+
+    rest = ws.match(text, pos + 1).end()
+    if rest != len(text):
+        fail("unexpected data after the corpus array", rest)
+    return records, starts
+
+
+def _record_issues(record, index, seen):
+    """Schema problems of one record; `seen` maps (crop, disease) to the first record index."""
+    if not isinstance(record, dict):
+        return [f"expected an object, got {type(record).__name__}"]
+
+    issues = []
+    for field in STRING_FIELDS:
+        value = record.get(field)
+        if not isinstance(value, str) or not value.strip():
+            issues.append(f"'{field}' must be a non-empty string")
+    for field, keys in LIST_FIELDS.items():
+        value = record.get(field)
+        if not isinstance(value, list) or not value:
+            issues.append(f"'{field}' must be a non-empty list")
+            continue
+        for j, item in enumerate(value):
+            missing = [k for k in keys if not isinstance(item, dict) or k not in item]
+            if missing:
+                issues.append(f"'{field}'[{j}] is missing {', '.join(missing)}")
+    unknown = set(record) - set(STRING_FIELDS) - set(LIST_FIELDS)
+    if unknown:
+        issues.append(f"unknown field(s) {', '.join(sorted(unknown))}")
+
+    key = (normalize(record.get('crop', '')), normalize(record.get('disease', '')))
+    if all(key):
+        if key in seen:
+            issues.append(f"duplicate of record {seen[key]} ({key[0]} / {key[1]})")
+        else:
+            seen[key] = index
+    return issues
+
+
+def validate(path):
+    """Parse + schema-check the corpus; returns the records or raises CorpusError."""
+    text = Path(path).read_text(encoding='utf-8')
+    records, starts = _parse_records(text, path)
+
+    problems = []
+    seen = {}
+    line_starts = None
+    for i, (record, start) in enumerate(zip(records, starts)):
+        issues = _record_issues(record, i, seen)
+        if issues:
+            if line_starts is None:
+                line_starts = _line_starts(text)
+            line, _ = _location(line_starts, start)
+            problems.extend(f"{path}:{line}: record {i}: {issue}" for issue in issues)
+
+    if problems:
+        raise CorpusError(problems)
+    return records
+
+
+# --- TEXT PROCESSING ---
+
+def tokenize(text):
+    return [t for t in normalize(text).split() if len(t) > 1 and t not in STOPWORDS]
+
+
+def document_text(record):
+    # Crop and disease names are short but decisive, so they count twice
+    names = f"{record['crop']} {record['disease']}"
+    return f"{names} {names} {record['symptoms']} {record['cause']}"
+
+
+def _bucket(term):
+    h = zlib.crc32(term.encode('utf-8'))
+    return h % DENSE_DIM, 1.0 if (h >> 16) & 1 else -1.0
+
+
+def _dense(term_counts, vocab, idf):
+    vector = np.zeros(DENSE_DIM, dtype=np.float32)
+    for term, count in term_counts.items():
+        term_id = vocab.get(term)
+        if term_id is None:
+            continue
+        bucket, sign = _bucket(term)
+        vector[bucket] += sign * (1.0 + np.log(count)) * idf[term_id]
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# --- BUILD ---
+
+def build(source, out_dir):
+    """Validate `source` and write the compiled index to `out_dir`; returns meta."""
+    records = validate(source)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    docs = [Counter(tokenize(document_text(r))) for r in records]
+    lengths = np.array([sum(d.values()) for d in docs], dtype=np.float32)
+    avgdl = float(lengths.mean()) if len(docs) else 0.0
+
+    vocab = {}
+    for doc in docs:
+        for term in doc:
+            vocab.setdefault(term, len(vocab))
+
+    df = np.zeros(len(vocab), dtype=np.float32)
+    for doc in docs:
+        for term in doc:
+            df[vocab[term]] += 1
+    idf = np.log(1.0 + (len(docs) - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    postings = [[] for _ in vocab]
+    for doc_id, doc in enumerate(docs):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_id] / avgdl)
+        for term, tf in doc.items():
+            term_id = vocab[term]
+            postings[term_id].append((doc_id, idf[term_id] * tf * (BM25_K1 + 1) / (tf + norm)))
+
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(p) for p in postings])
+    postings_docs = np.fromiter((d for p in postings for d, _ in p), dtype=np.int32, count=int(offsets[-1]))
+    postings_weights = np.fromiter((w for p in postings for _, w in p), dtype=np.float32, count=int(offsets[-1]))
+
+    dense = np.stack([_dense(doc, vocab, idf) for doc in docs]) if docs else np.zeros((0, DENSE_DIM), np.float32)
+
+    crops = sorted({normalize(r['crop']) for r in records})
+    crop_ids = {c: i for i, c in enumerate(crops)}
+    doc_crops = np.array([crop_ids[normalize(r['crop'])] for r in records], dtype=np.int32)
+
+    record_offsets = []
+    with open(out_dir / 'records.jsonl', 'wb') as f:
+        for record in records:
+            record_offsets.append(f.tell())
+            f.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    np.save(out_dir / 'idf.npy', idf)
+    np.save(out_dir / 'postings_offsets.npy', offsets)
+    np.save(out_dir / 'postings_docs.npy', postings_docs)
+    np.save(out_dir / 'postings_weights.npy', postings_weights)
+    np.save(out_dir / 'dense.npy', dense.astype(np.float32))
+    np.save(out_dir / 'doc_crops.npy', doc_crops)
+    np.save(out_dir / 'record_offsets.npy', np.array(record_offsets, dtype=np.int64))
+    with open(out_dir / 'vocab.json', 'w') as f:
+        json.dump(vocab, f)
+
+    meta = {
+        'version': INDEX_VERSION,
+        'docs': len(records),
+        'terms': len(vocab),
+        'avgdl': avgdl,
+        'k1': BM25_K1,
+        'b': BM25_B,
+        'dense_dim': DENSE_DIM,
+        'crops': crops,
+        'source_sha256': hashlib.sha256(Path(source).read_bytes()).hexdigest(),
+    }
+    # Written last: an index without meta.json is incomplete
+    with open(out_dir / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# --- QUERY ---
+
+class RagIndex:
+    """Read-only view of a compiled index; arrays are memory-mapped, records read on demand."""
+
+    def __init__(self, index_dir):
+        index_dir = Path(index_dir)
+        with open(index_dir / 'meta.json') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != INDEX_VERSION:
+            raise ValueError(f"Index version {self.meta['version']} != {INDEX_VERSION}; rebuild it")
+        with open(index_dir / 'vocab.json') as f:
+            self.vocab = json.load(f)
+
+        def load(name):
+            return np.load(index_dir / name, mmap_mode='r')
+
+        self.idf = load('idf.npy')
+        self.offsets = load('postings_offsets.npy')
+        self.postings_docs = load('postings_docs.npy')
+        self.postings_weights = load('postings_weights.npy')
+        self.dense = load('dense.npy')
+        self.doc_crops = load('doc_crops.npy')
+        self.record_offsets = load('record_offsets.npy')
+        self.crop_ids = {c: i for i, c in enumerate(self.meta['crops'])}
+        self._records = open(index_dir / 'records.jsonl', 'rb')
+
+    @classmethod
+    def open(cls, index_dir):
+        return cls(index_dir)
+
+    def __len__(self):
+        return self.meta['docs']
+
+    def record(self, doc_id):
+        self._records.seek(int(self.record_offsets[doc_id]))
+        return json.loads(self._records.readline())
+
+    def scores(self, query, alpha=0.7):
+        """Hybrid score per doc: BM25 (scaled to [0, 1]) blended with dense cosine."""
+        terms = Counter(tokenize(query))
+        bm25 = np.zeros(len(self), dtype=np.float32)
+        for term in terms:
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            np.add.at(bm25, self.postings_docs[start:end], self.postings_weights[start:end])
+        if bm25.max() > 0:
+            bm25 /= bm25.max()
+
+        dense = self.dense @ _dense(terms, self.vocab, self.idf)
+        return alpha * bm25 + (1 - alpha) * np.clip(dense, 0, None)
+
+    def search(self, query, k=5, crop=None, alpha=0.7):
+        """Top-k (score, record) pairs for a free-text query, optionally limited to one crop."""
+        scores = self.scores(query, alpha)
+        if crop is not None:
+            crop_id = self.crop_ids.get(normalize(crop))
+            if crop_id is None:
+                return []
+            scores = np.where(self.doc_crops == crop_id, scores, -1.0)
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.record(int(i))) for i in top if scores[i] > 0]
+
+
+# --- BENCHMARK ---
+
+def synthesize(records, size, seed=0):
+    """Grow the corpus to `size` records: copies get a distinct disease name and shuffled symptoms."""
+    rng = np.random.default_rng(seed)
+    out = list(records)
+    while len(out) < size:
+        base = records[len(out) % len(records)]
+        words = base['symptoms'].split()
+        rng.shuffle(words)
+        variant = len(out) // len(records)
+        out.append({**base, 'disease': f"{base['disease']} variant {variant}",
+                    'symptoms': " ".join(words) + f" strain{variant}"})
+    return out[:size]
+
+
+def benchmark(source, sizes, queries=200, k=5, seed=0):
+    """Build synthetic corpora of each size; report build/open time, query latency and recall@k."""
+    records = validate(source)
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in sizes:
+        corpus = synthesize(records, size, seed)
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus_path = Path(tmp) / 'corpus.json'
+            corpus_path.write_text(json.dumps(corpus))
+            start = time.perf_counter()
+            build(corpus_path, Path(tmp) / 'index')
+            build_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            index = RagIndex.open(Path(tmp) / 'index')
+            open_s = time.perf_counter() - start
+
+            # Query with a random half of a record's symptom words; the hit must be that record's disease
+            latencies, hits = [], 0
+            for doc_id in rng.integers(0, size, min(queries, size)):
+                target = corpus[doc_id]
+                words = target['symptoms'].split()
+                query = " ".join(rng.choice(words, max(1, len(words) // 2), replace=False))
+                query = f"{target['crop']} {query}"
+                start = time.perf_counter()
+                found = index.search(query, k=k)
+                latencies.append(time.perf_counter() - start)
+                hits += any(r['disease'] == target['disease'] for _, r in found)
+
+        latencies = np.array(latencies) * 1000
+        results.append({
+            'docs': size,
+            'build_s': round(build_s, 3),
+            'open_ms': round(open_s * 1000, 2),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+            f'recall@{k}': round(hits / len(latencies), 3),
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    validate_cmd = commands.add_parser('validate', help='Check JSON syntax and record schema')
+    validate_cmd.add_argument('source')
+
+    build_cmd = commands.add_parser('build', help='Validate and compile the corpus')
+    build_cmd.add_argument('source')
+    build_cmd.add_argument('out_dir')
+
+    query_cmd = commands.add_parser('query', help='Search a compiled index')
+    query_cmd.add_argument('index_dir')
+    query_cmd.add_argument('text')
+    query_cmd.add_argument('-k', type=int, default=5)
+    query_cmd.add_argument('--crop')
+
+    bench_cmd = commands.add_parser('benchmark', help='Latency and recall on synthetic corpora')
+    bench_cmd.add_argument('source')
+    bench_cmd.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    bench_cmd.add_argument('--queries', type=int, default=200)
+    bench_cmd.add_argument('-k', type=int, default=5)
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == 'validate':
+            records = validate(args.source)
+            print(f"✓ {len(records)} records OK")
+        elif args.command == 'build':
+            meta = build(args.source, args.out_dir)
+            print(f"✓ Indexed {meta['docs']} records, {meta['terms']} terms, {len(meta['crops'])} crops -> {args.out_dir}")
+        elif args.command == 'benchmark':
+            for row in benchmark(args.source, args.sizes, args.queries, args.k):
+                print(json.dumps(row))
+        else:
+            index = RagIndex.open(args.index_dir)
+            for score, record in index.search(args.text, k=args.k, crop=args.crop):
+                print(f"{score:.3f}  {record['crop']} / {record['disease']}")
+    except CorpusError as e:
+        print(f"❌ Corpus has {len(e.problems)} problem(s):", file=sys.stderr)
+        for problem in e.problems:
+            print(problem, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""
+Cache for the LLM fertilizer recommendations the app shows on the disease result screen.
+
+The recommendation space runs a full Llama-3 generation per request, but its
+answer for ("corn", "common rust") only changes when the knowledge base or the
+prompt does. Entries are therefore keyed by normalized crop + disease, the
+knowledge-base content hash and PROMPT_VERSION: editing the RAG JSON or bumping
+the prompt version invalidates everything without a manual flush.
+
+Lookups go memory LRU -> SQLite store -> recommendation space. Concurrent
+misses for the same key share one upstream call.
+
+Pre-warm every class the model knows (run where the cache directory lives):
+    python recommendation_cache.py warm class_names.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from cache_paths import default_cache_dir
+from knowledge_base import locate, normalize
+from prediction_cache import _LRU
+
+# --- RECOMMENDATION CACHE CONFIGURATION ---
+RECOMMENDER_URL = os.environ.get('RECOMMENDER_URL', 'https://ravina0912-fertilizer-recomm.hf.space/predict')
+RECOMMENDER_TIMEOUT = float(os.environ.get('RECOMMENDER_TIMEOUT', 120))
+# Bump whenever the recommendation space's prompt changes
+PROMPT_VERSION = os.environ.get('PROMPT_VERSION', '1')
+REC_CACHE_SIZE = int(os.environ.get('REC_CACHE_SIZE', 512))
+REC_CACHE_MAX_MB = float(os.environ.get('REC_CACHE_MAX_MB', 64))
+# --- END CONFIGURATION ---
+
+
+def file_hash(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()[:16]
+
+
+def kb_hash(path=None):
+    """Content hash of the knowledge base, or 'none' when there isn't one."""
+    try:
+        return file_hash(locate(path))
+    except FileNotFoundError:
+        return 'none'
+
+
+def app_query(class_name):
+    """(crop, disease) exactly as RecommendationService sends them for a model class name.
+
+    The app replaces underscores with spaces and splits off the first word as
+    the crop, so pre-warmed entries hit the same upstream prompt.
+    """
+    parts = class_name.replace('_', ' ').strip().split(' ')
+    crop = parts[0]
+    disease = ' '.join(parts[1:]) if len(parts) > 1 else 'general issue'
+    return crop, disease
+
+
+def fetch_recommendation(crop, disease, url=RECOMMENDER_URL, timeout=RECOMMENDER_TIMEOUT):
+    """POST to the recommendation space; returns the raw body and content type. Raises on non-2xx."""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps({'crop': crop, 'disease': disease}).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return {
+            'body': response.read().decode('utf-8'),
+            'content_type': response.headers.get('Content-Type', 'application/json'),
+        }
+
+
+class RecommendationCache:
+    """Memory LRU over a size-bounded SQLite store, with single-flight misses.
+
+    `fetch(crop, disease)` is only called on a miss in both tiers; entries
+    never expire, they are replaced when the key (KB hash / prompt) changes.
+    """
+
+    def __init__(self, fetch, path, kb_hash, prompt_version, max_entries=512, max_bytes=64 * 1024 * 1024):
+        self.fetch = fetch
+        self.kb_hash = kb_hash
+        self.prompt_version = prompt_version
+        self.max_bytes = max_bytes
+        self.memory = _LRU(max_entries, ttl=float('inf'))
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.coalesced = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._db = None
+        self._db_path = Path(path) if path is not None else None
+        self._db_pid = None
+        self._db_lock = threading.Lock()
+        if self._db_path is not None:
+            self._purge_stale()
+
+    @classmethod
+    def from_env(cls, path, fetch=fetch_recommendation):
+        return cls(
+            fetch, path,
+            kb_hash=kb_hash(os.environ.get('KB_PATH')),
+            prompt_version=PROMPT_VERSION,
+            max_entries=REC_CACHE_SIZE,
+            max_bytes=int(REC_CACHE_MAX_MB * 1024 * 1024),
+        )
+
+    def key(self, crop, disease):
+        parts = [normalize(crop), normalize(disease), self.kb_hash, self.prompt_version]
+        return hashlib.sha256("\0".join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, crop, disease):
+        """Return (value, source); source is 'memory', 'disk', 'coalesced' or 'miss'."""
+        key = self.key(crop, disease)
+        with self._lock:
+            value = self.memory.get(key, time.time())
+            if value is not None:
+                self.hits_memory += 1
+                return value, 'memory'
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result(), 'coalesced'
+
+        try:
+            value = self._load_row(key)
+            source = 'disk'
+            if value is None:
+                value = self.fetch(crop, disease)
+                source = 'miss'
+                self._store(key, crop, disease, value)
+            with self._lock:
+                self.memory.put(key, value, time.time())
+                if source == 'disk':
+                    self.hits_disk += 1
+                else:
+                    self.misses += 1
+            future.set_result(value)
+            return value, source
+        except BaseException as e:
+            # Waiters see the same error; nothing is cached, so the next request retries
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.coalesced + self.misses
+            stats = {
+                'hits_memory': self.hits_memory,
+                'hits_disk': self.hits_disk,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'hit_rate': round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+                'entries': len(self.memory.entries),
+                'kb_hash': self.kb_hash,
+                'prompt_version': self.prompt_version,
+            }
+        if self._db_path is not None:
+            with self._db_lock:
+                rows, size = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM recommendations"
+                ).fetchone()
+            stats['disk_entries'] = rows
+            stats['disk_bytes'] = size
+        return stats
+
+    # --- Persistence ---
+
+    def _connection(self):
+        # SQLite connections must not cross fork(), so preloaded workers reconnect
+        if self._db is None or self._db_pid != os.getpid():
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self._db_path), check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS recommendations ("
+                "key TEXT PRIMARY KEY, crop TEXT, disease TEXT, kb_hash TEXT, prompt_version TEXT, "
+                "value TEXT, size INTEGER, created REAL, accessed REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS recommendations_accessed ON recommendations (accessed)")
+            self._db_pid = os.getpid()
+        return self._db
+
+    def _purge_stale(self):
+        """Drop entries written for another knowledge base or prompt; they can never hit again."""
+        with self._db_lock:
+            db = self._connection()
+            db.execute(
+                "DELETE FROM recommendations WHERE kb_hash != ? OR prompt_version != ?",
+                (self.kb_hash, self.prompt_version),
+            )
+            db.commit()
+
+    def _load_row(self, key):
+        if self._db_path is None:
+            return None
+        with self._db_lock:
+            db = self._connection()
+            row = db.execute("SELECT value FROM recommendations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE recommendations SET accessed = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+        return json.loads(row[0])
+
+    def _store(self, key, crop, disease, value):
+        if self._db_path is None:
+            return
+        encoded = json.dumps(value)
+        now = time.time()
+        with self._db_lock:
+            db = self._connection()
+            db.execute(
+                "INSERT OR REPLACE INTO recommendations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, normalize(crop), normalize(disease), self.kb_hash, self.prompt_version,
+                 encoded, len(encoded), now, now),
+            )
+            # Evict least recently used rows until the store fits in max_bytes
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM recommendations").fetchone()[0]
+            if total > self.max_bytes:
+                for old_key, size in db.execute(
+                    "SELECT key, size FROM recommendations WHERE key != ? ORDER BY accessed", (key,)
+                ).fetchall():
+                    db.execute("DELETE FROM recommendations WHERE key = ?", (old_key,))
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+            db.commit()
+
+
+def warm(cache, class_names, workers=4):
+    """Generate an entry for every non-healthy class; returns the (class, error) pairs that failed."""
+    queries = {}
+    for name in class_names:
+        if 'healthy' not in normalize(name).split():
+            queries.setdefault(app_query(name), name)
+
+    failed = []
+    done = 0
+
+    def run(query):
+        started = time.perf_counter()
+        _, source = cache.get(*query)
+        return source, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run, query): name for query, name in queries.items()}
+        for future, name in futures.items():
+            done += 1
+            try:
+                source, seconds = future.result()
+                print(f"✓ [{done}/{len(futures)}] {name}: {source} ({seconds:.2f}s)")
+            except Exception as e:
+                failed.append((name, f"{type(e).__name__}: {e}"))
+                print(f"❌ [{done}/{len(futures)}] {name}: {type(e).__name__}: {e}")
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', type=Path, default=default_cache_dir() / "recommendation-cache.sqlite")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    warm_cmd = commands.add_parser('warm', help='Generate entries for every class in class_names.json')
+    warm_cmd.add_argument('class_names', help='class_names.json written by the training script')
+    warm_cmd.add_argument('--workers', type=int, default=4, help='Concurrent requests to the recommendation space')
+
+    commands.add_parser('stats', help='Show store size and key scope')
+
+    args = parser.parse_args(argv)
+
+    cache = RecommendationCache.from_env(args.db)
+    if args.command == 'stats':
+        print(json.dumps(cache.stats(), indent=2))
+        return 0
+
+    with open(args.class_names) as f:
+        class_names = json.load(f)
+    if isinstance(class_names, dict):
+        class_names = class_names.values()
+    failed = warm(cache, class_names, workers=args.workers)
+    print(json.dumps(cache.stats(), indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
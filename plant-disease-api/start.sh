@@ -0,0 +1,16 @@
+#!/bin/sh
+# Select the server with APP_SERVER=flask (default, threaded gunicorn) or asgi (uvicorn workers).
+# Worker count, threads and CPU partitioning come from gunicorn.conf.py.
+set -e
+
+# Per-worker Prometheus samples live here; stale files from a previous run would be double counted
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+if [ "$APP_SERVER" = "asgi" ]; then
+    exec gunicorn --config gunicorn.conf.py --worker-class uvicorn.workers.UvicornWorker asgi_app:app
+fi
+
+exec gunicorn --config gunicorn.conf.py model_api:app
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The API modules are run from plant-disease-api/, not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,26 @@
+"""
+bulk_predict --resume must not repeat rows written after the last recorded
+checkpoint position, e.g. by a batch interrupted before its count was saved.
+"""
+import pytest
+
+pytest.importorskip('ultralytics')
+
+from bulk_predict import CsvOutput
+
+COLUMNS = ['path', 'error']
+
+
+def test_csv_rows_past_the_recorded_state_are_dropped_on_resume(tmp_path):
+    path = tmp_path / 'survey.csv'
+    output = CsvOutput(path, COLUMNS)
+    state = output.write([{'path': 'a.jpg'}, {'path': 'b.jpg'}])
+    # Written, but interrupted before its state was recorded
+    output.write([{'path': 'c.jpg'}])
+    state = output.commit(state)
+    output.close()
+
+    output = CsvOutput(path, COLUMNS, state)
+    output.write([{'path': 'c.jpg'}])
+    output.close()
+    assert path.read_text().splitlines() == ['path,error', 'a.jpg,', 'b.jpg,', 'c.jpg,']
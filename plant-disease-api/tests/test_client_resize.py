@@ -0,0 +1,53 @@
+"""
+A client that downscales to the input spec before uploading must reach the
+model with the same tensor as the original photo, resized server-side.
+"""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, features
+
+from preprocessing import client_downscale, decode_image, letterbox
+
+IMGSZ = 512
+
+
+def synthetic_leaf(w=4032, h=3024):
+    """A 12 MP phone-sized photo: a leaf with a midrib and brown lesions on soil."""
+    img = Image.new('RGB', (w, h), (120, 90, 60))
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((w * 0.15, h * 0.1, w * 0.85, h * 0.9), fill=(60, 140, 50))
+    draw.line((w * 0.15, h * 0.5, w * 0.85, h * 0.5), fill=(150, 190, 110), width=w // 150)
+    for i, (x, y) in enumerate([(0.35, 0.3), (0.6, 0.65), (0.5, 0.4), (0.7, 0.35)]):
+        r = w * (0.03 + 0.01 * i)
+        draw.ellipse((x * w - r, y * h - r, x * w + r, y * h + r), fill=(110, 70, 30))
+    return img
+
+
+def encode(img, fmt, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, quality=quality)
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.fixture(scope='module')
+def server_input():
+    # The original photo as a phone uploads it, resized by the server
+    return letterbox(decode_image(encode(synthetic_leaf(), 'JPEG', 95), IMGSZ), IMGSZ).astype(np.int16)
+
+
+@pytest.mark.parametrize('fmt', ['JPEG', 'PNG', 'WEBP'])
+def test_client_downscale_matches_server_resize(server_input, fmt):
+    if fmt == 'WEBP' and not features.check('webp'):
+        pytest.skip('Pillow built without WebP')
+    upload = client_downscale(synthetic_leaf(), 'long', IMGSZ)
+    assert max(upload.size) == IMGSZ
+
+    client_input = letterbox(decode_image(encode(upload, fmt, 85), IMGSZ), IMGSZ).astype(np.int16)
+    assert client_input.shape == server_input.shape
+    diff = np.abs(client_input - server_input)
+    # Resampling and re-encoding only move edges by a few levels
+    assert diff.mean() < 2.0
+    assert np.percentile(diff, 99) < 16
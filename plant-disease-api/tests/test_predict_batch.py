@@ -0,0 +1,68 @@
+"""
+/predict/batch streams its NDJSON body after the view returns, so the uploads
+must still be readable then (Flask 3.1 closes the request's files first).
+"""
+import io
+import json
+import threading
+import zipfile
+
+import pytest
+
+pytest.importorskip('ultralytics')
+
+import inference
+import model_api
+
+
+@pytest.fixture
+def client(monkeypatch):
+    ready = threading.Event()
+    ready.set()
+    monkeypatch.setattr(inference.loader, '_ready', ready)
+    # Echo what was read, so the test checks the upload bytes reached the pipeline
+    monkeypatch.setattr(inference, 'predict_bytes', lambda img_bytes, deadline=None: {'size': len(img_bytes)})
+    return model_api.app.test_client()
+
+
+def read_ndjson(response):
+    assert response.status_code == 200, response.get_data(as_text=True)
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return sorted(results, key=lambda r: r['index'])
+
+
+def test_multi_image_upload_streams_every_result(client):
+    images = [(io.BytesIO(b'x' * n), f'leaf{n}.jpg') for n in (10, 20, 30)]
+    response = client.post('/predict/batch', data={'images': images}, content_type='multipart/form-data')
+    results = read_ndjson(response)
+    assert [(r['filename'], r['size']) for r in results] == [('leaf10.jpg', 10), ('leaf20.jpg', 20), ('leaf30.jpg', 30)]
+
+
+def test_zip_upload_streams_every_member(client):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('a.jpg', b'a' * 5)
+        zf.writestr('notes.txt', b'skipped')
+        # Large enough that Werkzeug spools the upload to a temp file
+        zf.writestr('b.png', b'b' * (1 << 20))
+    archive.seek(0)
+    response = client.post('/predict/batch', data={'images': [(archive, 'survey.zip')]},
+                           content_type='multipart/form-data')
+    results = read_ndjson(response)
+    assert [(r['filename'], r['size']) for r in results] == [('a.jpg', 5), ('b.png', 1 << 20)]
+
+
+def test_oversized_images_are_error_rows_not_read(client, monkeypatch):
+    monkeypatch.setattr(inference, 'MAX_UPLOAD_BYTES', 1000)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('ok.jpg', b'a' * 10)
+        # Compresses to a few bytes, but inflates past the per-image limit
+        zf.writestr('bomb.jpg', b'\0' * 5000)
+    archive.seek(0)
+    images = [(archive, 'survey.zip'), (io.BytesIO(b'x' * 2000), 'big.jpg')]
+    response = client.post('/predict/batch', data={'images': images}, content_type='multipart/form-data')
+    results = read_ndjson(response)
+    assert results[0] == {'index': 0, 'filename': 'ok.jpg', 'size': 10}
+    assert results[1] == {'index': 1, 'filename': 'bomb.jpg', 'error': 'Image too large', 'max_bytes': 1000}
+    assert results[2] == {'index': 2, 'filename': 'big.jpg', 'error': 'Image too large', 'max_bytes': 1000}
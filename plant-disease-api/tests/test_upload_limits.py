@@ -0,0 +1,58 @@
+"""
+Per-route upload limits must hold for chunked bodies too, not only for
+requests that declare a Content-Length.
+"""
+import io
+import threading
+from contextlib import ExitStack
+
+import pytest
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+pytest.importorskip('ultralytics')
+
+import inference
+import model_api
+from admission import AdmissionController, UploadGate
+
+
+def chunked_upload(path, size):
+    """WSGI environ for a multipart 'image' upload of `size` bytes sent without a Content-Length."""
+    environ = EnvironBuilder(path=path, method='POST', data={'image': (io.BytesIO(b'x' * size), 'leaf.jpg')}).get_environ()
+    body = environ['wsgi.input'].read()
+    del environ['CONTENT_LENGTH']
+    environ['HTTP_TRANSFER_ENCODING'] = 'chunked'
+    environ['wsgi.input'] = io.BytesIO(body)
+    environ['wsgi.input_terminated'] = True
+    return environ
+
+
+def test_chunked_predict_upload_is_held_to_the_predict_limit(monkeypatch):
+    monkeypatch.setitem(inference.UPLOAD_LIMITS, '/predict', 1024)
+    ready = threading.Event()
+    ready.set()
+    monkeypatch.setattr(inference.loader, '_ready', ready)
+    _, status, _ = run_wsgi_app(model_api.app.wsgi_app, chunked_upload('/predict', 4096))
+    assert status.startswith('413')
+
+
+def test_uploads_being_received_leave_admission_tickets_free(monkeypatch):
+    ready = threading.Event()
+    ready.set()
+    monkeypatch.setattr(inference.loader, '_ready', ready)
+    monkeypatch.setattr(inference, 'admission', AdmissionController(max_active=1, max_queue=0))
+    monkeypatch.setattr(inference, 'uploads', UploadGate(limit=25))
+    monkeypatch.setattr(inference, 'predict_upload', lambda upload, deadline=None: {'disease_name': 'ok'})
+
+    with ExitStack() as stalled:
+        for _ in range(24):
+            stalled.enter_context(inference.uploads.hold())
+        client = model_api.app.test_client()
+        image = {'image': (io.BytesIO(b'x' * 64), 'leaf.jpg')}
+        assert client.post('/predict', data=image).status_code == 200
+
+        stalled.enter_context(inference.uploads.hold())
+        image = {'image': (io.BytesIO(b'x' * 64), 'leaf.jpg')}
+        response = client.post('/predict', data=image)
+        assert response.status_code == 503
+        assert response.get_json()['reason'] == 'uploads_full'
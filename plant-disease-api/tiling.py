@@ -0,0 +1,90 @@
+"""
+Tiled prediction for whole-plant and crop-row photos.
+
+The model was trained on single-leaf close-ups at imgsz, so shrinking a wide
+field photo to one imgsz input loses the lesions. Instead the photo is cut
+into overlapping imgsz tiles, each scored like a close-up, and the per-tile
+predictions are combined into a per-class severity and one diagnosis.
+"""
+import math
+
+from PIL import Image
+
+
+def max_long_side(tile, overlap, max_across):
+    """Longest image side that `max_across` overlapping tiles cover."""
+    return int(tile + (max_across - 1) * tile * (1 - overlap))
+
+
+def fit_for_tiling(img, tile, overlap, max_across):
+    """Downscale an RGB PIL image so its long side spans at most `max_across` tiles; never upscales."""
+    max_long = max_long_side(tile, overlap, max_across)
+    w, h = img.size
+    scale = max_long / max(w, h)
+    if scale >= 1:
+        return img
+    return img.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.BILINEAR, reducing_gap=2.0)
+
+
+def tile_starts(length, tile, stride):
+    """Offsets of tiles covering `length`, spread evenly so the last one ends on the edge."""
+    if length <= tile:
+        return [0]
+    n = math.ceil((length - tile) / stride) + 1
+    return [round(i * (length - tile) / (n - 1)) for i in range(n)]
+
+
+def tile_grid(width, height, tile, overlap):
+    """(row, col, (left, top, right, bottom)) of overlapping `tile`-pixel tiles covering the image."""
+    stride = max(1.0, tile * (1 - overlap))
+    xs = tile_starts(width, tile, stride)
+    ys = tile_starts(height, tile, stride)
+    return [
+        (row, col, (x, y, min(x + tile, width), min(y + tile, height)))
+        for row, y in enumerate(ys)
+        for col, x in enumerate(xs)
+    ]
+
+
+def aggregate(predictions, min_confidence=0.5):
+    """Per-class severity and an overall diagnosis from the scored tiles' predictions.
+
+    Severity is the share of scored tiles whose top class is that class. The
+    diagnosis is the disease found on the most tiles (ties broken by
+    confidence), counting only diseases seen with at least `min_confidence`
+    on some tile, so one doubtful tile doesn't overrule a healthy plant.
+    """
+    counts, confidence_sums, max_confidence = {}, {}, {}
+    diseased_tiles = 0
+    for p in predictions:
+        name = p['disease_name']
+        counts[name] = counts.get(name, 0) + 1
+        confidence_sums[name] = confidence_sums.get(name, 0.0) + p['confidence']
+        max_confidence[name] = max(max_confidence.get(name, 0.0), p['confidence'])
+        if not p['is_healthy'] and name != 'No Detection':
+            diseased_tiles += 1
+
+    total = len(predictions)
+    severity = {
+        name: {
+            'tiles': count,
+            'share': round(count / total, 4),
+            'mean_confidence': round(confidence_sums[name] / count, 4),
+            'max_confidence': round(max_confidence[name], 4),
+        }
+        for name, count in sorted(counts.items(), key=lambda item: -item[1])
+    }
+
+    healthy = {p['disease_name'] for p in predictions if p['is_healthy']}
+    diseases = [
+        name for name in counts
+        if name not in healthy and name != 'No Detection' and max_confidence[name] >= min_confidence
+    ]
+    best = max(diseases or counts, key=lambda name: (counts[name], confidence_sums[name]))
+    return {
+        'disease_name': best,
+        'confidence': round(confidence_sums[best] / counts[best], 4),
+        'is_healthy': best in healthy,
+        'affected_share': round(diseased_tiles / total, 4),
+        'severity': severity,
+    }
@@ -0,0 +1,116 @@
+"""
+Check that uploads downscaled and re-encoded by the client, as advertised in
+the `/` input spec, get the same prediction as the original photo.
+
+Each image goes through the server's decode + preprocessing twice: once from
+its original file, once after a client-side resize (the spec's edge to
+`imgsz` pixels) and re-encode in every requested format. Top-1 classes must
+match and confidences stay within --max-conf-delta; upload sizes are
+reported to show what the downscale saves.
+
+Example:
+    python verify_client_resize.py /teamspace/studios/this_studio/yolo_dataset/test \
+        --weights best_model.pt --task classify --formats jpeg webp avif
+"""
+import argparse
+import io
+import os
+import sys
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from backends import BACKENDS, load_backend
+from bulk_predict import iter_sources
+from export_model import sample_images, top1
+from preprocessing import UndecodableImageError, accepted_formats, client_downscale, decode_image, letterbox, to_bgr
+
+FORMAT_MIME = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'avif': 'image/avif', 'png': 'image/png'}
+
+
+def client_upload(path, edge, pixels, fmt, quality):
+    """Bytes a client following the input spec would send for the photo at `path`."""
+    with Image.open(path) as img:
+        # Clients apply EXIF orientation before resizing, so the upload carries none
+        img = client_downscale(ImageOps.exif_transpose(img).convert('RGB'), edge, pixels)
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt.upper(), quality=quality)
+    return buffer.getvalue()
+
+
+def server_predict(backend, fp):
+    """Mirrors inference.predict_upload: decode at the model size, then preprocess for the task."""
+    img = decode_image(fp, backend.imgsz)
+    if backend.task == 'classify':
+        model_input = to_bgr(img)
+    else:
+        model_input = letterbox(img, backend.imgsz)
+    return top1(backend.predict([model_input], conf=0.25, verbose=False)[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help='Image directories or single images')
+    parser.add_argument('--weights', default='best_model.pt')
+    parser.add_argument('--backend', choices=BACKENDS, default='pytorch')
+    parser.add_argument('--imgsz', type=int, default=512)
+    parser.add_argument('--task', choices=['classify', 'detect'], default='classify')
+    parser.add_argument('--formats', nargs='+', default=['jpeg', 'webp', 'avif'], choices=sorted(FORMAT_MIME))
+    parser.add_argument('--quality', type=int, default=85, help='Client encode quality')
+    parser.add_argument('--samples', type=int, default=200, help='0 = every image')
+    parser.add_argument('--max-conf-delta', type=float, default=0.02)
+    args = parser.parse_args(argv)
+
+    paths = [path for archive, path in iter_sources(args.inputs) if archive is None]
+    paths = sample_images(paths, args.samples)
+    backend = load_backend(args.weights, args.backend, imgsz=args.imgsz, task=args.task)
+    edge = 'short' if backend.task == 'classify' else 'long'
+    print(f"Model: {backend.describe()}; client resize: {edge} edge -> {backend.imgsz}px")
+
+    decodable = accepted_formats()
+    formats = []
+    for fmt in args.formats:
+        if FORMAT_MIME[fmt] in decodable:
+            formats.append(fmt)
+        else:
+            print(f"⚠️  This Pillow build can't decode {fmt}, skipping it")
+
+    reference = {}
+    original_bytes = 0
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                reference[path] = server_predict(backend, f)
+            original_bytes += os.path.getsize(path)
+        except UndecodableImageError as e:
+            print(f"⚠️  Skipping {path}: {e}")
+    print(f"\n{len(reference)} images, {original_bytes / 1e6:.1f} MB as originals:")
+
+    failed = False
+    for fmt in formats:
+        mismatches = []
+        deltas = []
+        upload_bytes = 0
+        for path, (ref_cls, ref_conf) in reference.items():
+            data = client_upload(path, edge, backend.imgsz, fmt, args.quality)
+            upload_bytes += len(data)
+            cls, conf = server_predict(backend, io.BytesIO(data))
+            if cls != ref_cls:
+                mismatches.append(path)
+            else:
+                deltas.append(abs(conf - ref_conf))
+
+        max_delta = float(np.max(deltas)) if deltas else 0.0
+        ok = not mismatches and max_delta <= args.max_conf_delta
+        print(f"{'✓' if ok else '❌'} {fmt}: {len(reference) - len(mismatches)}/{len(reference)} same top-1, "
+              f"max |Δconf| {max_delta:.4f}, {upload_bytes / 1e6:.1f} MB uploaded "
+              f"({upload_bytes / max(1, original_bytes) * 100:.1f}% of the originals)")
+        for path in mismatches[:10]:
+            print(f"    top-1 changed: {path}")
+        failed |= not ok
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
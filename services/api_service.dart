@@ -4,53 +4,120 @@ import 'package:http/http.dart' as http;
 import 'package:image_picker/image_picker.dart';
 import '../models/prediction_result.dart';
 
+/// An error response the UI can explain better than "failed to connect".
+class ApiException implements Exception {
+  final int statusCode;
+  final String message;
+
+  /// Seconds the server asked us to wait before retrying (503 only).
+  final int? retryAfter;
+
+  ApiException(this.statusCode, this.message, {this.retryAfter});
+
+  @override
+  String toString() => message;
+}
+
 /// Service to handle communication with the backend prediction API.
 /// This version is compatible with both Web and Mobile.
 class ApiService {
   // IMPORTANT: Replace this with your actual Render API URL if it's different.
   final String _apiUrl = 'https://winkoo-plant-disease-api.hf.space/predict';
 
+  // Sent as X-Client-Timeout so the server drops our request instead of
+  // running it after we've stopped waiting.
+  static const Duration _timeout = Duration(seconds: 30);
+
+  // A busy server (503) is retried once if it asks for a short wait.
+  static const int _maxBusyRetries = 1;
+  static const int _maxAutoRetryWaitSeconds = 5;
+
   /// Sends the image to the backend and returns a prediction.
   Future<PredictionResult> predict(XFile imageFile) async {
-    try {
-      final uri = Uri.parse(_apiUrl);
-      final request = http.MultipartRequest('POST', uri);
+    // Read the image file as bytes, which works on all platforms.
+    final bytes = await imageFile.readAsBytes();
 
-      // Read the image file as bytes, which works on all platforms.
-      final bytes = await imageFile.readAsBytes();
+    for (var attempt = 0;; attempt++) {
+      try {
+        return await _send(bytes, imageFile.name);
+      } on ApiException catch (e) {
+        final wait = e.retryAfter;
+        if (e.statusCode == 503 &&
+            wait != null &&
+            wait <= _maxAutoRetryWaitSeconds &&
+            attempt < _maxBusyRetries) {
+          await Future.delayed(Duration(seconds: wait));
+          continue;
+        }
+        rethrow;
+      }
+    }
+  }
 
-      // Create a MultipartFile from the bytes.
-      final multipartFile = http.MultipartFile.fromBytes(
-        'image', // This key must match what the Flask API expects.
-        bytes,
-        filename: imageFile.name, // The original filename.
-      );
+  Future<PredictionResult> _send(Uint8List bytes, String filename) async {
+    final uri = Uri.parse(_apiUrl);
+    final request = http.MultipartRequest('POST', uri);
+    request.headers['X-Client-Timeout'] = '${_timeout.inSeconds}';
 
-      // Add the file and any other fields to the request.
-      request.files.add(multipartFile);
-      request.fields['conf_threshold'] = '0.5'; // Example field
+    // Create a MultipartFile from the bytes.
+    final multipartFile = http.MultipartFile.fromBytes(
+      'image', // This key must match what the Flask API expects.
+      bytes,
+      filename: filename, // The original filename.
+    );
 
-      final response = await request.send();
+    // Add the file and any other fields to the request.
+    request.files.add(multipartFile);
+    request.fields['conf_threshold'] = '0.5'; // Example field
 
-      if (response.statusCode == 200) {
-        final responseBody = await response.stream.bytesToString();
-        final decodedJson = jsonDecode(responseBody);
-        return PredictionResult.fromJson(decodedJson);
-      } else {
-        // Provide more detailed error logging for debugging.
-        final errorBody = await response.stream.bytesToString();
-        print('Server Error: ${response.statusCode}');
-        print('Error Body: $errorBody');
-        throw Exception(
-          'Failed to get prediction. Status code: ${response.statusCode}',
-        );
-      }
+    final http.StreamedResponse response;
+    final String responseBody;
+    try {
+      response = await request.send().timeout(_timeout);
+      responseBody = await response.stream.bytesToString().timeout(_timeout);
     } catch (e) {
-      // Catch network or other exceptions.
+      // Catch network errors and timeouts.
       print('Error calling API: $e');
       throw Exception(
         'Failed to connect to the server. Please check your connection.',
       );
     }
+
+    switch (response.statusCode) {
+      case 200:
+        return PredictionResult.fromJson(jsonDecode(responseBody));
+      case 503:
+        // Overloaded or still loading the model; the server says when to retry
+        throw ApiException(
+          503,
+          'The server is busy right now. Please try again in a moment.',
+          retryAfter: int.tryParse(response.headers['retry-after'] ?? ''),
+        );
+      case 500:
+        // The model failed to load; retrying won't help until the server restarts
+        throw ApiException(
+          500,
+          'The diagnosis service is unavailable right now. Please try again later.',
+        );
+      case 413:
+        throw ApiException(
+          413,
+          'This photo is too large to upload. Please choose a smaller one.',
+        );
+      case 422:
+        // A valid image the leaf gate rejected (not a leaf, blurred, too dark...)
+        throw ApiException(
+          422,
+          'This photo can\'t be analyzed. Please take a clear, well-lit photo of a single leaf.',
+        );
+      default:
+        // Provide more detailed error logging for debugging.
+        print('Server Error: ${response.statusCode}');
+        print('Error Body: $responseBody');
+        throw ApiException(
+          response.statusCode,
+          'Failed to get prediction. Status code: ${response.statusCode}',
+        );
+    }
   }
 }
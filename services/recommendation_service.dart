@@ -2,14 +2,14 @@ import 'dart:convert';
 import 'package:http/http.dart' as http;
 
 class RecommendationService {
-  // Use the base URL that we know works
-  static const String _baseUrl =
-      'https://ravina0912-fertilizer-recomm.hf.space';
+  // The plant API proxies the recommendation space (ravina0912-fertilizer-recomm)
+  // and caches its answers, so repeat diseases don't wait for a new generation
+  static const String _baseUrl = 'https://winkoo-plant-disease-api.hf.space';
 
   Future<Map<String, String>> getRecommendations(String fullDiseaseName) async {
     try {
-      // 1. Prepare the URL (using /predict as it responded correctly before)
-      final Uri url = Uri.parse('$_baseUrl/predict');
+      // 1. Prepare the URL (same request/response as the space's /predict)
+      final Uri url = Uri.parse('$_baseUrl/recommend');
 
       // 2. Split the string into 'Crop' and 'Disease'
       // Example Input: "corn common rust" -> Crop: "corn", Disease: "common rust"